@@ -1,11 +1,153 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-from .models import AccountType,Account,Transaction
+from .models import AccountType,Account,Transaction,JournalEntry,JournalLeg,FxRate,Period,OpeningBalance,ArchivedTransaction
+from .posting import validate_transaction,available_balance,post_transactions,posted_transactions
 # Register your models here.
 
-admin.site.register(AccountType)
-admin.site.register(Account)
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes the row count of an unfiltered changelist from the database's statistics
+
+    COUNT(*) reads the whole table. PostgreSQL and MySQL keep an estimate of the number of rows, which
+    is used when it is over ESTIMATE_FROM; smaller tables, filtered lists and other databases are counted.
+    """
+    ESTIMATE_FROM = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model,queryset.db)
+            if estimate is not None and estimate > self.ESTIMATE_FROM:
+                return estimate
+        return super().count
+
+def estimated_rows(model,using):
+    """Returns the database's estimate of the number of rows of model's table, or None if it has none"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql,[model._meta.db_table])
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 for a table that was never analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables too large to count or list without care"""
+    paginator = EstimatedCountPaginator
+    # Filtered changelists would otherwise also count the whole table for the "x total" link
+    show_full_result_count = False
+
+@admin.register(AccountType)
+class AccountTypeAdmin(ScalableAdmin):
+    list_display = ['name','bal_type','parent']
+    list_filter = ['bal_type']
+    list_select_related = ['parent']
+    search_fields = ['name']
+    autocomplete_fields = ['parent']
+
+@admin.register(Account)
+class AccountAdmin(ScalableAdmin):
+    list_display = ['name','acc_type','balance','currency']
+    list_filter = ['currency']
+    list_select_related = ['acc_type']
+    search_fields = ['name']
+    autocomplete_fields = ['acc_type']
+
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ['date','base','quote','rate']
+    list_filter = ['base','quote']
+    date_hierarchy = 'date'
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
-    list_filter = ['date','from_acc','to_acc']
\ No newline at end of file
+class TransactionAdmin(ScalableAdmin):
+    list_display = ['id','date','from_acc','to_acc','amount','currency','pending','edited']
+    # Filtering on the accounts would list every account in the sidebar - search for them instead
+    list_filter = ['pending','edited','currency']
+    list_select_related = ['from_acc','to_acc']
+    search_fields = ['from_acc__name','to_acc__name','note']
+    autocomplete_fields = ['from_acc','to_acc']
+    raw_id_fields = ['updating']
+    date_hierarchy = 'date'
+    actions = ['reverse_transactions']
+
+    @admin.action(permissions=['add'],description="Reverse the selected transactions")
+    def reverse_transactions(self,request,queryset):
+        """Posts, in one batch, a transaction moving each selected amount back, once per transaction"""
+        txns = list(queryset.filter(edited=False).select_related('from_acc__acc_type','to_acc__acc_type').order_by('pk'))
+        # The key of a reversal makes reversing the same transaction again a no-op
+        reversed_already = posted_transactions(f'reversal:{txn.pk}' for txn in txns)
+        txns = [txn for txn in txns if f'reversal:{txn.pk}' not in reversed_already]
+
+        rows,balances = [],{}
+        for txn in txns:
+            try:
+                validate_transaction(txn.to_acc,txn.from_acc,txn.amount,balances)
+            except ValidationError as e:
+                self.message_user(request,f'Nothing was reversed - reversing transaction {txn.pk}: {" ".join(e.messages)}',messages.ERROR)
+                return
+            for acc,delta in ((txn.to_acc,-txn.amount),(txn.from_acc,txn.amount)):
+                balances[acc.pk] = available_balance(acc,balances)+delta
+            rows.append((txn.to_acc,txn.from_acc,txn.amount,f'Reversal of transaction {txn.pk}'))
+
+        post_transactions(rows,[f'reversal:{txn.pk}' for txn in txns])
+        self.message_user(request,f'Reversed {len(rows)} transactions ({len(reversed_already)} were already reversed)',messages.SUCCESS)
+
+class JournalLegInline(admin.TabularInline):
+    model = JournalLeg
+    raw_id_fields = ['account']
+
+@admin.register(JournalEntry)
+class JournalEntryAdmin(admin.ModelAdmin):
+    list_display = ['id','date','currency','note']
+    date_hierarchy = 'date'
+    inlines = [JournalLegInline]
+
+    # Entries are posted through post_journal_entry, which also updates the balances
+    def has_add_permission(self,request):
+        return False
+
+    def has_change_permission(self,request,obj=None):
+        return False
+
+    def has_delete_permission(self,request,obj=None):
+        return False
+
+@admin.register(Period)
+class PeriodAdmin(admin.ModelAdmin):
+    list_display = ['end','closed_at']
+
+    def has_add_permission(self,request):
+        # Periods are closed with the close_period command, which also archives their transactions
+        return False
+
+@admin.register(OpeningBalance)
+class OpeningBalanceAdmin(admin.ModelAdmin):
+    list_display = ['period','account','balance']
+    list_filter = ['period']
+    list_select_related = ['period','account']
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(admin.ModelAdmin):
+    list_display = ['id','date','from_acc','to_acc','amount','currency']
+    list_select_related = ['from_acc','to_acc']
+    date_hierarchy = 'date'
+
+    # The archive is an audit trail of closed periods
+    def has_add_permission(self,request):
+        return False
+
+    def has_change_permission(self,request,obj=None):
+        return False
+
+    def has_delete_permission(self,request,obj=None):
+        return False
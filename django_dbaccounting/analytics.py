@@ -0,0 +1,173 @@
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from dbaccounting.models import AccountType, Account, ArchivedTransaction, JournalLeg, Transaction
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = pd = None
+
+# Analytics over the ledger with pandas and NumPy.
+# Each loader reads its rows as tuples with one values_list() query and builds the frame column by
+# column, with integer ids downcast to the smallest type that holds them and repeated strings as
+# categoricals. The helpers then work on whole columns: postings() turns transactions and journal
+# legs into signed movements, and balances as of past dates are the current balances less the
+# movements since. Amounts are in each account's own currency. Needs the optional pandas.
+
+def require_pandas():
+    if pd is None:
+        raise ImportError('dbaccounting.analytics needs pandas and numpy - install django-dbaccounting[analytics]')
+
+def ids(values):
+    return pd.to_numeric(pd.Series(values, dtype='int64'), downcast='integer').to_numpy()
+
+def nullable_ids(values):
+    return pd.array(values, dtype='Int64')
+
+def frame(rows, columns, converters, index=None):
+    """Builds a DataFrame from row tuples, converting each column with its converter"""
+    values = list(zip(*rows)) or [()]*len(columns)
+    df = pd.DataFrame({name: converters[name](column) for name, column in zip(columns, values)})
+    return df.set_index(index) if index else df
+
+def categories(values):
+    return pd.Categorical(values)
+
+def moments(values):
+    return pd.to_datetime(pd.Series(values, dtype=object), utc=settings.USE_TZ)
+
+def account_types_frame():
+    """Returns the account types indexed by id, with their name, bal_type and parent"""
+    require_pandas()
+    columns = ('id', 'name', 'bal_type', 'parent')
+    rows = AccountType.objects.order_by().values_list(*columns)
+    return frame(rows, columns, {'id': ids, 'name': categories, 'bal_type': categories, 'parent': nullable_ids}, 'id')
+
+def accounts_frame():
+    """Returns the accounts indexed by id, with their type and its bal_type, currency and current balance"""
+    require_pandas()
+    columns = ('id', 'name', 'acc_type', 'bal_type', 'currency', 'balance')
+    # The pending balance includes queued deltas and balance shards, like the transactions do
+    rows = Account.objects.with_pending_balance().order_by().values_list('id', 'name', 'acc_type', 'acc_type__bal_type', 'currency', 'pending_balance')
+    return frame(rows, columns, {'id': ids, 'name': categories, 'acc_type': ids, 'bal_type': categories, 'currency': categories,
+        'balance': lambda values: np.array([value or 0.0 for value in values], dtype='float64')}, 'id')
+
+def transactions_frame(start=None, end=None):
+    """Returns the transactions dated from start up to end (exclusive), with the names of their accounts"""
+    require_pandas()
+    columns = ('id', 'date', 'from_acc', 'from_acc_name', 'to_acc', 'to_acc_name', 'amount', 'currency', 'updating', 'edited')
+    rows = Transaction.objects.order_by('date', 'pk')
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lt=end)
+    rows = rows.values_list('id', 'date', 'from_acc', 'from_acc__name', 'to_acc', 'to_acc__name', 'amount', 'currency', 'updating', 'edited')
+    return frame(rows, columns, {'id': ids, 'date': moments, 'from_acc': ids, 'from_acc_name': categories, 'to_acc': ids,
+        'to_acc_name': categories, 'amount': lambda values: np.array(values, dtype='float64'), 'currency': categories,
+        'updating': nullable_ids, 'edited': lambda values: np.array(values, dtype=bool)}, 'id')
+
+def postings(since=None, until=None):
+    """Returns the date, account and signed amount of each movement made by the transactions and journal legs from since up to until
+
+    Transactions of closed periods are included from the archive, and a transaction that replaced
+    another also reverses it, on its own date.
+    """
+    require_pandas()
+    dates, accounts, amounts = [], [], []
+    for model in (Transaction, ArchivedTransaction):
+        txns = model.objects.order_by()
+        if since is not None:
+            txns = txns.filter(date__gte=since)
+        if until is not None:
+            txns = txns.filter(date__lt=until)
+        rows = list(txns.values_list('date', 'from_acc', 'to_acc', 'amount', 'updating__from_acc', 'updating__to_acc', 'updating__amount'))
+        if not rows:
+            continue
+        date, from_acc, to_acc, amount, prev_from, prev_to, prev_amount = zip(*rows)
+        amount = np.array(amount, dtype='float64')
+        dates += [date, date]
+        accounts += [from_acc, to_acc]
+        amounts += [-amount, amount]
+        edits = [i for i, acc in enumerate(prev_from) if acc is not None]
+        if edits:
+            prev_amount = np.array([prev_amount[i] for i in edits], dtype='float64')
+            dates += [[date[i] for i in edits]]*2
+            accounts += [[prev_from[i] for i in edits], [prev_to[i] for i in edits]]
+            amounts += [prev_amount, -prev_amount]
+
+    legs = JournalLeg.objects.order_by()
+    if since is not None:
+        legs = legs.filter(entry__date__gte=since)
+    if until is not None:
+        legs = legs.filter(entry__date__lt=until)
+    rows = list(legs.values_list('entry__date', 'account', 'amount'))
+    if rows:
+        date, account, amount = zip(*rows)
+        dates.append(date)
+        accounts.append(account)
+        amounts.append(np.array(amount, dtype='float64'))
+
+    return pd.DataFrame({
+        'date': moments([d for part in dates for d in part]),
+        'account': ids([acc for part in accounts for acc in part]),
+        'amount': np.concatenate(amounts) if amounts else np.array([], dtype='float64'),
+    })
+
+def end_of(day):
+    """Returns the first moment after the date day, as in periods.period_boundary"""
+    boundary = datetime.datetime.combine(day+datetime.timedelta(days=1), datetime.time.min)
+    return timezone.make_aware(boundary) if settings.USE_TZ else boundary
+
+def balances_as_of(dates):
+    """Returns a frame of each account's balance at the end of each of dates, one column per date"""
+    require_pandas()
+    dates = sorted(set(dates))
+    accs = accounts_frame()
+    if not dates:
+        return pd.DataFrame(index=accs.index)
+    boundaries = moments([end_of(day) for day in dates])
+    moves = postings(since=end_of(dates[0]))
+
+    # Bucket j holds the movements between boundary j-1 and j, so the movements since boundary j
+    # are the buckets after j, summed from the right
+    buckets = pd.Index(boundaries).searchsorted(moves['date'], side='right')
+    table = (pd.DataFrame({'account': moves['account'], 'bucket': buckets, 'amount': moves['amount']})
+        .pivot_table(index='account', columns='bucket', values='amount', aggfunc='sum', fill_value=0.0)
+        .reindex(index=accs.index, columns=range(len(dates)+1), fill_value=0.0))
+    since = table.iloc[:, ::-1].cumsum(axis=1).iloc[:, ::-1]
+    balances = since.iloc[:, 1:].rsub(accs['balance'], axis=0)
+    balances.columns = dates
+    return balances
+
+def activity(since=None, until=None, freq='MS'):
+    """Returns the net movement of each account (columns) in each period of the pandas frequency freq (rows)"""
+    require_pandas()
+    moves = postings(since, until)
+    return (moves.groupby([pd.Grouper(key='date', freq=freq), 'account'])['amount'].sum()
+        .unstack('account', fill_value=0.0))
+
+def type_rollup(balances, accs=None, types=None):
+    """Sums balances indexed by account id (a Series, or a frame of several columns) into every account type and its ancestors"""
+    require_pandas()
+    accs = accounts_frame() if accs is None else accs
+    types = account_types_frame() if types is None else types
+    own = balances.groupby(accs['acc_type'].reindex(balances.index).to_numpy()).sum()
+
+    # Pair each type with itself and each of its ancestors, one level of the tree at a time
+    parents = types['parent']
+    pairs = [pd.DataFrame({'acc_type': types.index, 'ancestor': types.index})]
+    while True:
+        ancestors = parents.reindex(pairs[-1]['ancestor']).to_numpy()
+        known = ~pd.isna(ancestors)
+        if not known.any():
+            break
+        pairs.append(pd.DataFrame({'acc_type': pairs[-1]['acc_type'].to_numpy()[known], 'ancestor': ancestors[known].astype('int64')}))
+    pairs = pd.concat(pairs, ignore_index=True)
+
+    rolled = own.reindex(pairs['acc_type'].to_numpy(), fill_value=0.0)
+    rolled.index = pairs['ancestor'].to_numpy()
+    return rolled.groupby(level=0).sum().reindex(types.index, fill_value=0.0)
@@ -0,0 +1,394 @@
+import datetime
+import json
+import math
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+from dbaccounting.conf import get_setting
+from dbaccounting.models import AccountType, Account, Transaction, TransactionChange, JournalEntry
+from dbaccounting.posting import validate_transaction, post_transactions, posted_transactions, validate_journal_entry, post_journal_entry
+from dbaccounting.fx import MissingRate, consolidated_totals
+from dbaccounting.ledger import LedgerTree, account_rows
+from dbaccounting.tree import get_tree
+from dbaccounting.routers import replica_reads_view, stick_to_primary
+from dbaccounting.instrumentation import stats
+from dbaccounting.chart import ChartError, import_chart
+from dbaccounting.search import search
+
+# JSON API
+# List endpoints page by primary key (?after=<last id>&limit=<n>) and return only the requested
+# ?fields=..., read with values() so that no model instances are built for the rows.
+# The changes endpoints let a client keep a copy in sync: accounts and account types are paged by
+# (updated_at, id), transactions by the sequence number of their change log entries.
+
+ACCOUNT_TYPE_FIELDS = ('id', 'name', 'bal_type', 'parent')
+ACCOUNT_FIELDS = ('id', 'name', 'acc_type', 'balance', 'currency', 'date_create')
+# Fields read from an annotation rather than their column - a sharded account's balance column lags its postings
+ACCOUNT_SOURCES = {'balance': 'current_balance'}
+TRANSACTION_FIELDS = ('id', 'date', 'from_acc', 'to_acc', 'amount', 'currency', 'note', 'updating', 'edited', 'pending', 'idempotency_key')
+
+class ApiError(Exception):
+    """An error reported to the client as a JSON body with the given status code"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def api_view(*perms, methods=('GET',)):
+    """Requires a logged in user with perms and turns ApiErrors into JSON error responses"""
+    def decorator(view):
+        @require_http_methods(methods)
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+            if not request.user.has_perms(perms):
+                return JsonResponse({'error': 'Permission denied'}, status=403)
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as e:
+                return JsonResponse({'error': e.message}, status=e.status)
+        return wrapper
+    return decorator
+
+def int_param(request, name, default):
+    try:
+        return int(request.GET.get(name, default))
+    except ValueError:
+        raise ApiError(f'{name} must be an integer')
+
+def field_values(queryset, fields, sources):
+    """queryset.values() of fields, with the fields in sources read from the annotation they map to"""
+    sources = sources or {}
+    return queryset.values(*(sources.get(field, field) for field in fields))
+
+def renamed(rows, sources):
+    for row in rows:
+        for field, source in (sources or {}).items():
+            if source in row:
+                row[field] = row.pop(source)
+    return rows
+
+def cursor_page(request, queryset, allowed_fields, sources=None):
+    """Returns one page of queryset as a JSON response of field dicts plus the cursor of the next page"""
+    fields = request.GET.get('fields')
+    fields = tuple(fields.split(',')) if fields else allowed_fields
+    unknown = set(fields)-set(allowed_fields)
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    limit = min(int_param(request, 'limit', get_setting('API_PAGE_SIZE')), get_setting('API_MAX_PAGE_SIZE'))
+    if limit < 1:
+        raise ApiError('limit must be positive')
+    after = int_param(request, 'after', 0)
+
+    # The id is always read for the cursor, and one extra row tells whether there is a next page
+    columns = ('id', *(field for field in fields if field != 'id'))
+    rows = renamed(list(field_values(queryset.filter(pk__gt=after).order_by('pk'), columns, sources)[:limit+1]), sources)
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_url = None
+    if more:
+        query = request.GET.copy()
+        query['after'] = rows[-1]['id']
+        next_url = f'{request.path}?{query.urlencode()}'
+    if 'id' not in fields:
+        for row in rows:
+            del row['id']
+
+    return JsonResponse({'results': rows, 'next': next_url})
+
+@replica_reads_view
+@api_view('dbaccounting.view_accounttype')
+def account_type_list(request):
+    return cursor_page(request, AccountType.objects.all(), ACCOUNT_TYPE_FIELDS)
+
+@replica_reads_view
+@api_view('dbaccounting.view_account')
+def account_list(request):
+    queryset = Account.objects.with_current_balance()
+    if 'acc_type' in request.GET:
+        queryset = queryset.filter(acc_type=int_param(request, 'acc_type', None))
+    return cursor_page(request, queryset, ACCOUNT_FIELDS, ACCOUNT_SOURCES)
+
+@replica_reads_view
+@api_view('dbaccounting.view_transaction')
+def transaction_list(request):
+    queryset = Transaction.objects.all()
+    if 'account' in request.GET:
+        acc = int_param(request, 'account', None)
+        queryset = queryset.filter(Q(from_acc=acc)|Q(to_acc=acc))
+    return cursor_page(request, queryset, TRANSACTION_FIELDS)
+
+def settled_before():
+    """Changes after this time may still be followed by commits of earlier ones, and are held back"""
+    return timezone.now()-datetime.timedelta(seconds=get_setting('CHANGES_SETTLE_SECONDS'))
+
+def page_limit(request):
+    limit = min(int_param(request, 'limit', get_setting('API_PAGE_SIZE')), get_setting('API_MAX_PAGE_SIZE'))
+    if limit < 1:
+        raise ApiError('limit must be positive')
+    return limit
+
+def next_page(request, name, value):
+    query = request.GET.copy()
+    query[name] = value
+    return f'{request.path}?{query.urlencode()}'
+
+def modified_page(request, queryset, fields, sources=None):
+    """Returns the rows of queryset modified after ?cursor=<updated_at>,<id> in modification order, and the next cursor"""
+    limit = page_limit(request)
+    queryset = queryset.filter(updated_at__lte=settled_before())
+    if 'cursor' in request.GET:
+        try:
+            updated_at, pk = request.GET['cursor'].rsplit(',', 1)
+            updated_at, pk = datetime.datetime.fromisoformat(updated_at), int(pk)
+        except ValueError:
+            raise ApiError('cursor must be a cursor returned by this endpoint')
+        queryset = queryset.filter(Q(updated_at__gt=updated_at)|Q(updated_at=updated_at, pk__gt=pk))
+
+    rows = renamed(list(field_values(queryset.order_by('updated_at', 'pk'), (*fields, 'updated_at'), sources)[:limit+1]), sources)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    # Without new rows the client polls again with the same cursor
+    cursor = f"{rows[-1]['updated_at'].isoformat()},{rows[-1]['id']}" if rows else request.GET.get('cursor')
+    return JsonResponse({'results': rows, 'cursor': cursor, 'next': next_page(request, 'cursor', cursor) if more else None})
+
+@replica_reads_view
+@api_view('dbaccounting.view_accounttype')
+def account_type_changes(request):
+    return modified_page(request, AccountType.objects.all(), ACCOUNT_TYPE_FIELDS)
+
+@replica_reads_view
+@api_view('dbaccounting.view_account')
+def account_changes(request):
+    return modified_page(request, Account.objects.with_current_balance(), ACCOUNT_FIELDS, ACCOUNT_SOURCES)
+
+@replica_reads_view
+@api_view('dbaccounting.view_transaction')
+def transaction_changes(request):
+    """Returns the transaction changes after ?cursor=<sequence number>, each with the transaction as it is now
+
+    The transaction is null once it has been deleted or archived.
+    """
+    limit = page_limit(request)
+    after = int_param(request, 'cursor', 0)
+    changes = list(TransactionChange.objects.filter(pk__gt=after, at__lte=settled_before()).order_by('pk')[:limit+1])
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    txns = {row['id']: row for row in Transaction.objects.filter(pk__in={change.transaction_id for change in changes}).values(*TRANSACTION_FIELDS)}
+    results = [{'seq': change.pk, 'kind': change.kind, 'id': change.transaction_id, 'at': change.at,
+        'transaction': txns.get(change.transaction_id)} for change in changes]
+    cursor = changes[-1].pk if changes else after
+    return JsonResponse({'results': results, 'cursor': cursor, 'next': next_page(request, 'cursor', cursor) if more else None})
+
+@replica_reads_view
+@api_view()
+def text_search(request):
+    """Returns a page (?limit=<n>&offset=<n>) of the transactions, or with ?in=accounts the accounts, matching ?q=
+
+    Each result has a highlight of its note or name, HTML-escaped with the matched words in <mark>.
+    """
+    kind = request.GET.get('in', 'transactions')
+    if kind not in ('transactions', 'accounts'):
+        raise ApiError('in must be transactions or accounts')
+    model, fields, sources, queryset = ((Transaction, TRANSACTION_FIELDS, {}, Transaction.objects.all()) if kind == 'transactions'
+        else (Account, ACCOUNT_FIELDS, ACCOUNT_SOURCES, Account.objects.with_current_balance()))
+    if not request.user.has_perm(f'dbaccounting.view_{model._meta.model_name}'):
+        raise ApiError('Permission denied', status=403)
+    terms = request.GET.get('q', '').strip()
+    if not terms:
+        raise ApiError('q is required')
+
+    limit = min(int_param(request, 'limit', get_setting('API_PAGE_SIZE')), get_setting('API_MAX_PAGE_SIZE'))
+    offset = int_param(request, 'offset', 0)
+    if limit < 1 or offset < 0:
+        raise ApiError('limit must be positive and offset not negative')
+
+    # One extra hit tells whether there is a next page
+    hits = search(model, terms, limit+1, offset, queryset)
+    next_url = None
+    if len(hits) > limit:
+        query = request.GET.copy()
+        query['offset'] = offset+limit
+        next_url = f'{request.path}?{query.urlencode()}'
+    results = [dict({field: getattr(obj, sources.get(field) or model._meta.get_field(field).attname) for field in fields}, highlight=obj.highlight) for obj in hits[:limit]]
+    return JsonResponse({'results': results, 'next': next_url})
+
+@replica_reads_view
+@api_view('dbaccounting.view_account', 'dbaccounting.view_accounttype')
+def consolidated_balances(request):
+    """Returns the total balance of each account type's own accounts, converted to one currency"""
+    currency = request.GET.get('currency', get_setting('CURRENCY')).upper()
+    try:
+        date = datetime.date.fromisoformat(request.GET['date']) if 'date' in request.GET else datetime.date.today()
+    except ValueError:
+        raise ApiError('date must be formatted as YYYY-MM-DD')
+
+    try:
+        totals = consolidated_totals(currency, date)
+    except MissingRate as e:
+        raise ApiError(str(e), status=409)
+    return JsonResponse({'currency': currency, 'date': date, 'totals': [{'acc_type': pk, 'total': total} for pk, total in totals.items()]})
+
+@replica_reads_view
+@api_view('dbaccounting.view_account', 'dbaccounting.view_accounttype')
+def balance_sheet(request):
+    """Returns the account type tree with each type's accounts and rolled up total, converted to one currency"""
+    currency = request.GET.get('currency', get_setting('CURRENCY')).upper()
+    try:
+        date = datetime.date.fromisoformat(request.GET['date']) if 'date' in request.GET else datetime.date.today()
+    except ValueError:
+        raise ApiError('date must be formatted as YYYY-MM-DD')
+
+    try:
+        ledger = LedgerTree(get_tree(), account_rows(date, currency), date, currency)
+    except MissingRate as e:
+        raise ApiError(str(e), status=409)
+    return JsonResponse({'currency': currency, 'date': date, 'types': ledger.as_dicts()})
+
+def transaction_rows(request):
+    """Parses and validates the body of a bulk transaction POST
+
+    Returns the (from_acc, to_acc, amount, note) rows to post with their idempotency keys, and for
+    each item of the batch the transaction already posted with its key, or None.
+    """
+    try:
+        items = json.loads(request.body)
+    except ValueError:
+        raise ApiError('Request body must be JSON')
+    if isinstance(items, dict):
+        items = items.get('transactions')
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        raise ApiError('Expected a non-empty list of transactions')
+    if len(items) > get_setting('API_MAX_BATCH'):
+        raise ApiError(f"At most {get_setting('API_MAX_BATCH')} transactions can be posted at once", status=413)
+
+    ids = {item.get(key) for item in items for key in ('from_acc', 'to_acc')}
+    accs = Account.objects.select_related('acc_type').with_pending_balance().in_bulk([pk for pk in ids if isinstance(pk, int)])
+    # Items whose key was already used are answered with the transaction posted then, found in one query
+    posted = posted_transactions({item.get('idempotency_key') for item in items if isinstance(item.get('idempotency_key'), str)})
+    # Running balances, so that each transaction is checked against the ones before it in the batch
+    balances = {}
+
+    rows, keys, existing, errors = [], [], [], {}
+    for index, item in enumerate(items):
+        from_acc, to_acc = accs.get(item.get('from_acc')), accs.get(item.get('to_acc'))
+        amount, note, key = item.get('amount'), item.get('note'), item.get('idempotency_key')
+        if isinstance(key, str) and key in posted:
+            existing.append(posted[key])
+            continue
+        try:
+            if key is not None and (not isinstance(key, str) or not key or len(key) > Transaction._meta.get_field('idempotency_key').max_length):
+                raise ValidationError('idempotency_key must be a string of 1 to 64 characters')
+            if key is not None and key in keys:
+                raise ValidationError('idempotency_key is repeated in the batch')
+            if from_acc is None or to_acc is None:
+                raise ValidationError('from_acc and to_acc must be existing account ids')
+            if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+                raise ValidationError('amount must be a finite number')
+            if note is not None and (not isinstance(note, str) or len(note) > Transaction._meta.get_field('note').max_length):
+                raise ValidationError('note must be a string of at most 256 characters')
+            validate_transaction(from_acc, to_acc, amount, balances)
+        except ValidationError as e:
+            errors[index] = e.messages
+            continue
+
+        for acc, delta in ((from_acc, -amount), (to_acc, amount)):
+            balances[acc.pk] = balances.get(acc.pk, acc.pending_balance)+delta
+        rows.append((from_acc, to_acc, amount, note))
+        keys.append(key)
+        existing.append(None)
+
+    if errors:
+        raise ApiError(errors)
+    return rows, keys, existing
+
+@api_view('dbaccounting.add_transaction', methods=('POST',))
+def transaction_bulk_create(request):
+    """Posts a batch of transactions in one DB transaction - either all of them are posted or none
+
+    Items with the idempotency_key of a transaction already posted are not posted again: their
+    result is that transaction, with created false.
+    """
+    rows, keys, existing = transaction_rows(request)
+    try:
+        txns = iter(post_transactions(rows, keys))
+    except IntegrityError:
+        # Another request may have posted one of the keys since they were looked up - any other violation is a bug
+        if not posted_transactions([key for key in keys if key is not None]):
+            raise
+        raise ApiError('An idempotency_key of the batch was posted concurrently - retry the batch', status=409)
+    stick_to_primary(request)
+    results = [{'id': txn.pk, 'date': txn.date, 'from_acc': txn.from_acc_id, 'to_acc': txn.to_acc_id, 'amount': txn.amount,
+        'currency': txn.currency, 'note': txn.note, 'pending': txn.pending, 'idempotency_key': txn.idempotency_key, 'created': created}
+        for txn, created in ((txn or next(txns), txn is None) for txn in existing)]
+    return JsonResponse({'results': results}, status=201 if rows else 200)
+
+@api_view('dbaccounting.add_journalentry', methods=('POST',))
+def journal_entry_create(request):
+    """Posts a journal entry of {"account": id, "amount": change} legs that sum to zero"""
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        raise ApiError('Request body must be JSON')
+    items = body.get('legs') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ApiError('Expected a list of legs')
+    if len(items) > get_setting('API_MAX_BATCH'):
+        raise ApiError(f"At most {get_setting('API_MAX_BATCH')} legs can be posted at once", status=413)
+    note = body.get('note')
+    if note is not None and (not isinstance(note, str) or len(note) > JournalEntry._meta.get_field('note').max_length):
+        raise ApiError('note must be a string of at most 256 characters')
+
+    ids = [item.get('account') for item in items]
+    accs = Account.objects.select_related('acc_type').with_pending_balance().in_bulk([pk for pk in ids if isinstance(pk, int)])
+    legs, errors = [], {}
+    for index, item in enumerate(items):
+        acc, amount = accs.get(item.get('account')), item.get('amount')
+        if acc is None:
+            errors[index] = ['account must be an existing account id']
+        elif isinstance(amount, bool) or not isinstance(amount, (int, float)) or not amount or not math.isfinite(amount):
+            errors[index] = ['amount must be a finite non-zero number']
+        else:
+            legs.append((acc, amount))
+    if errors:
+        raise ApiError(errors)
+    try:
+        validate_journal_entry(legs)
+    except ValidationError as e:
+        raise ApiError(e.messages)
+
+    entry = post_journal_entry(legs, note)
+    stick_to_primary(request)
+    return JsonResponse({'id': entry.pk, 'date': entry.date, 'currency': entry.currency, 'note': entry.note,
+        'legs': [{'account': acc.pk, 'amount': amount} for acc, amount in legs]}, status=201)
+
+@api_view('dbaccounting.add_accounttype', 'dbaccounting.add_account', methods=('POST',))
+def chart_import(request):
+    """Creates a chart of account types and accounts, referencing parents by name - see chart.import_chart"""
+    try:
+        chart = json.loads(request.body)
+    except ValueError:
+        raise ApiError('Request body must be JSON')
+    try:
+        counts = import_chart(chart)
+    except ChartError as e:
+        raise ApiError(e.errors)
+    stick_to_primary(request)
+    return JsonResponse(counts, status=201)
+
+@api_view()
+def view_stats(request):
+    """Returns the rolling query count and timing percentiles of each view recorded by InstrumentationMiddleware"""
+    if not request.user.is_staff:
+        raise ApiError('Staff only', status=403)
+    return JsonResponse({'enabled': get_setting('INSTRUMENT'), 'views': stats.summary()})
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DbaccountingConfig(AppConfig):
     name = 'dbaccounting'
+
+    def ready(self):
+        # Register signal receivers
+        from dbaccounting import fx, tree, search
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from dbaccounting.models import AccountType, Account, Transaction
+from dbaccounting.posting import post_transaction, apply_queued_deltas, compact_balance_shards
+from dbaccounting.generate import generate_ledger
+from dbaccounting.instrumentation import record_queries
+from dbaccounting.ledger import LedgerTree, account_rows
+from dbaccounting.tree import get_tree
+
+# Benchmark scenarios, run against a throwaway database by the benchmark management command.
+# Each scenario takes the command options and returns a dict of JSON-serializable results.
+
+SCENARIOS = {}
+
+def scenario(name):
+    """Registers a benchmark scenario under name"""
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+def rate(count, seconds):
+    return {'count': count, 'seconds': round(seconds, 4), 'per_second': round(count/seconds, 1) if seconds else None}
+
+def measure(func, repeat):
+    """Runs func repeat times, returning the median time and the queries of one run"""
+    times = []
+    for i in range(repeat):
+        with record_queries() as recorder:
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    times.sort()
+    return {'seconds': round(times[len(times) // 2], 4), 'queries': recorder.count}
+
+def run_threads(func, jobs, threads):
+    """Runs func over jobs on a thread pool, closing each worker's connection, and returns the elapsed time"""
+    def work(job):
+        try:
+            func(job)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(work, jobs))
+    return time.perf_counter() - start
+
+@scenario('hot_account')
+def hot_account(options):
+    """Many concurrent postings into a single clearing account, applied directly and through the write-behind queue
+
+    The queue avoids waiting on the clearing account's row lock, so there is nothing to gain on SQLite.
+    """
+    postings = options['postings']
+    threads = options['threads']
+    assets = AccountType.objects.get_or_create(name='Bench Assets', bal_type='D')[0]
+
+    results = {}
+    for mode in ('direct', 'write_behind'):
+        hot = Account.objects.create(name=f'Bench Clearing ({mode})', acc_type=assets)
+        sources = [Account.objects.create(name=f'Bench Source {i} ({mode})', acc_type=assets, balance=postings) for i in range(threads)]
+
+        with override_settings(DBACCOUNTING_WRITE_BEHIND=(mode == 'write_behind')):
+            elapsed = run_threads(lambda i: post_transaction(sources[i % threads], hot, 1), range(postings), threads)
+            results[mode] = rate(postings, elapsed)
+
+            if mode == 'write_behind':
+                start = time.perf_counter()
+                while apply_queued_deltas():
+                    pass
+                results['write_behind_apply'] = rate(postings, time.perf_counter()-start)
+
+        hot.refresh_from_db()
+        results[f'{mode}_balance_ok'] = hot.balance == postings
+
+    results['speedup'] = round(results['write_behind']['per_second']/results['direct']['per_second'], 2)
+    return results
+
+@scenario('sharded_account')
+def sharded_account(options):
+    """Many concurrent postings into a single clearing account, updating its balance row and spread over balance shards
+
+    Shards spread the row lock of the clearing account, so like hot_account this needs a row-locking database.
+    """
+    postings = options['postings']
+    threads = options['threads']
+    assets = AccountType.objects.get_or_create(name='Bench Assets', bal_type='D')[0]
+
+    results = {}
+    for mode, shards in (('single_row', 0), ('sharded', options['shards'])):
+        hot = Account.objects.create(name=f'Bench Clearing ({mode})', acc_type=assets, balance_shards=shards)
+        sources = [Account.objects.create(name=f'Bench Source {i} ({mode})', acc_type=assets, balance=postings) for i in range(threads)]
+
+        elapsed = run_threads(lambda i: post_transaction(sources[i % threads], hot, 1), range(postings), threads)
+        results[mode] = rate(postings, elapsed)
+
+        if shards:
+            start = time.perf_counter()
+            compact_balance_shards([hot])
+            results['compact_seconds'] = round(time.perf_counter()-start, 4)
+        hot.refresh_from_db()
+        results[f'{mode}_balance_ok'] = hot.balance == postings
+
+    results['speedup'] = round(results['sharded']['per_second']/results['single_row']['per_second'], 2)
+    return results
+
+@scenario('wsgi_vs_asgi')
+def wsgi_vs_asgi(options):
+    """The read endpoints served by a pool of sync workers (WSGI) and by one event loop with the async views (ASGI)"""
+    count = options['requests']
+    threads = options['threads']
+    user = get_user_model().objects.create_superuser('bench', password='bench')
+
+    assets = AccountType.objects.get_or_create(name='Bench Assets', bal_type='D')[0]
+    current = AccountType.objects.create(name='Bench Current Assets', bal_type='D', parent=assets)
+    accs = [Account.objects.create(name=f'Bench Read {i}', acc_type=current, balance=1000) for i in range(20)]
+    Transaction.objects.bulk_create([Transaction(from_acc=accs[i % 20], to_acc=accs[(i+1) % 20], amount=1) for i in range(1000)])
+
+    endpoints = {
+        'transaction_list': (reverse('txn'), reverse('txn-async')),
+        'account_detail': (reverse('acc-detail', args=[accs[0].pk]), reverse('acc-detail-async', args=[accs[0].pk])),
+        'balance_sheet': (reverse('balance-sheet'), reverse('balance-sheet-async')),
+    }
+
+    def wsgi_worker(url):
+        client = Client()
+        client.force_login(user)
+        for i in range(count // threads):
+            assert client.get(url).status_code == 200
+
+    async def asgi_run(client, url):
+        limit = asyncio.Semaphore(threads*4)
+        async def get():
+            async with limit:
+                response = await client.get(url)
+                assert response.status_code == 200
+        await asyncio.gather(*(get() for i in range(count // threads * threads)))
+
+    results = {}
+    for name, (sync_url, async_url) in endpoints.items():
+        elapsed = run_threads(wsgi_worker, [sync_url]*threads, threads)
+        results[f'{name}_wsgi'] = rate(count // threads * threads, elapsed)
+
+        client = AsyncClient()
+        client.force_login(user)
+        start = time.perf_counter()
+        asyncio.run(asgi_run(client, async_url))
+        results[f'{name}_asgi'] = rate(count // threads * threads, time.perf_counter()-start)
+    return results
+
+@scenario('ledger')
+def ledger(options):
+    """Generates a large ledger and times posting, the list pages, the ledger build and the reports on it"""
+    user = get_user_model().objects.create_superuser('bench_ledger', password='bench')
+    start = time.perf_counter()
+    generate_ledger(options['depth'], options['width'], options['accounts'], options['transactions'])
+    results = {'generate': rate(options['transactions'], time.perf_counter()-start)}
+
+    # Postings between debit accounts, which the generated opening balances can always cover
+    accs = list(Account.objects.filter(acc_type__bal_type='D').select_related('acc_type')[:20])
+    postings = options['postings']
+    start = time.perf_counter()
+    for i in range(postings):
+        post_transaction(accs[i % len(accs)], accs[(i+1) % len(accs)], 0.01)
+    results['post_transaction'] = rate(postings, time.perf_counter()-start)
+
+    client = Client()
+    client.force_login(user)
+    def get(url, **params):
+        def request():
+            assert client.get(url, params).status_code == 200
+        return request
+
+    repeat = options['repeat']
+    results['transaction_list_first_page'] = measure(get(reverse('txn')), repeat)
+    results['transaction_list_last_page'] = measure(get(reverse('txn'), page='last'), repeat)
+    results['account_list'] = measure(get(reverse('acc')), repeat)
+    results['account_detail'] = measure(get(reverse('acc-detail', args=[accs[0].pk])), repeat)
+    results['ledger_build'] = measure(lambda: LedgerTree(get_tree(), account_rows(None)), repeat)
+    results['balance_sheet'] = measure(get(reverse('balance-sheet')), repeat)
+    results['api_transactions'] = measure(get(reverse('api-txn'), account=accs[0].pk, limit=1000), repeat)
+    results['api_balances'] = measure(get(reverse('api-balances')), repeat)
+    return results
@@ -0,0 +1,107 @@
+import math
+
+from django.db import transaction
+
+from dbaccounting.conf import get_setting
+from dbaccounting.models import AccountType, Account
+from dbaccounting.tree import tree_changed
+from dbaccounting.conditional import data_changed
+
+# Chart of accounts import
+# A chart is a dict of 'account_types' ({'name', 'bal_type', 'parent'}) and 'accounts'
+# ({'name', 'acc_type', 'balance', 'currency'}), where parents and account types are referenced by
+# name, either to a type in the chart or to an existing one. Types are inserted a level of the tree
+# at a time, so an import takes a handful of queries however large the chart is.
+
+class ChartError(Exception):
+    """A chart cannot be imported, errors lists why"""
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+def type_levels(types, known):
+    """Sorts the chart's types into levels, each only referencing parents in known or in earlier levels"""
+    levels, placed, remaining = [], set(known), list(types)
+    while remaining:
+        level = [acc_type for acc_type in remaining if acc_type.get('parent') in (None, '') or acc_type['parent'] in placed]
+        if not level:
+            raise ChartError([f"Account types {', '.join(sorted(acc_type['name'] for acc_type in remaining))} have circular parents"])
+        levels.append(level)
+        placed |= {acc_type['name'] for acc_type in level}
+        remaining = [acc_type for acc_type in remaining if acc_type['name'] not in placed]
+    return levels
+
+def validate_chart(chart):
+    """Returns the chart's types and accounts, raising ChartError with every problem found"""
+    if not isinstance(chart, dict):
+        raise ChartError(['A chart must be an object of account_types and accounts'])
+    types, accs = chart.get('account_types', []), chart.get('accounts', [])
+    if not isinstance(types, list) or not isinstance(accs, list) or not all(isinstance(item, dict) for item in types+accs):
+        raise ChartError(['account_types and accounts must be lists of objects'])
+
+    errors, names = [], set()
+    for index, acc_type in enumerate(types):
+        name = acc_type.get('name')
+        if not isinstance(name, str) or not name or len(name) > AccountType._meta.get_field('name').max_length:
+            errors.append(f"account_types[{index}]: name must be a string of at most {AccountType._meta.get_field('name').max_length} characters")
+        elif name in names:
+            errors.append(f'account_types[{index}]: {name} appears more than once')
+        names.add(name)
+        if acc_type.get('bal_type') not in ('C', 'D'):
+            errors.append(f'account_types[{index}]: bal_type must be C or D')
+        if not isinstance(acc_type.get('parent') or '', str):
+            errors.append(f'account_types[{index}]: parent must be the name of an account type')
+    acc_names = set()
+    for index, acc in enumerate(accs):
+        name = acc.get('name')
+        if not isinstance(name, str) or not name or len(name) > Account._meta.get_field('name').max_length:
+            errors.append(f"accounts[{index}]: name must be a string of at most {Account._meta.get_field('name').max_length} characters")
+        elif name in acc_names:
+            errors.append(f'accounts[{index}]: {name} appears more than once')
+        acc_names.add(name)
+        if not isinstance(acc.get('acc_type') or '', str):
+            errors.append(f'accounts[{index}]: acc_type must be the name of an account type')
+        balance = acc.get('balance', 0)
+        if isinstance(balance, bool) or not isinstance(balance, (int, float)) or not math.isfinite(balance):
+            errors.append(f'accounts[{index}]: balance must be a finite number')
+        currency = acc.get('currency', get_setting('CURRENCY'))
+        if not isinstance(currency, str) or len(currency) != 3:
+            errors.append(f'accounts[{index}]: currency must be a 3 letter code')
+    if errors:
+        raise ChartError(errors)
+    return types, accs
+
+@transaction.atomic
+def import_chart(chart, batch_size=1000):
+    """Creates the account types and accounts of chart, returning the number of each created"""
+    types, accs = validate_chart(chart)
+    names = {acc_type['name'] for acc_type in types}
+
+    # Names outside the chart must be existing types
+    referenced = {acc_type.get('parent') for acc_type in types} | {acc.get('acc_type') for acc in accs}
+    referenced -= names | {None, ''}
+    type_ids = dict(AccountType.objects.filter(name__in=names | referenced).values_list('name', 'pk'))
+
+    errors = [f'Account type {name} already exists' for name in sorted(names & set(type_ids))]
+    errors += [f'Account type {name} does not exist' for name in sorted(referenced-set(type_ids))]
+    errors += [f'Account {name} already exists' for name in Account.objects.filter(name__in=[acc['name'] for acc in accs]).order_by('name').values_list('name', flat=True)]
+    errors += [f'accounts[{index}]: acc_type is required' for index, acc in enumerate(accs) if acc.get('acc_type') in (None, '')]
+    if errors:
+        raise ChartError(errors)
+
+    for level in type_levels(types, set(type_ids)):
+        created = AccountType.objects.bulk_create([AccountType(name=acc_type['name'], bal_type=acc_type['bal_type'],
+            parent_id=type_ids.get(acc_type.get('parent'))) for acc_type in level], batch_size=batch_size)
+        if any(acc_type.pk is None for acc_type in created):
+            # Backends that cannot return the ids of bulk inserts - the names are unique, so read them back
+            created = AccountType.objects.filter(name__in=[acc_type['name'] for acc_type in level])
+        type_ids.update((acc_type.name, acc_type.pk) for acc_type in created)
+    if types:
+        # bulk_create sends no signals
+        tree_changed()
+
+    Account.objects.bulk_create([Account(name=acc['name'], acc_type_id=type_ids[acc['acc_type']], balance=acc.get('balance', 0),
+        currency=acc.get('currency', get_setting('CURRENCY')).upper()) for acc in accs], batch_size=batch_size)
+    data_changed()
+
+    return {'account_types': len(types), 'accounts': len(accs)}
@@ -0,0 +1,98 @@
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from dbaccounting.conf import get_setting
+from dbaccounting.models import AccountType, Account, Transaction, JournalEntry
+from dbaccounting.routers import replica_alias
+from dbaccounting.tree import OnCommit, waiting_on_commit
+
+# Conditional GET and fragment caching of the HTML pages.
+# A data version - a random token and the time it was published - is kept in the
+# DBACCOUNTING_PAGE_CACHE cache and replaced whenever the app's data changes. Pages are tagged with
+# it as their ETag and Last-Modified, so an unchanged page is answered with a 304 without querying
+# the database, and their rendered rows are cached under it. Saves of the models publish a new
+# version through signals; code that deletes, writes in bulk or with update() calls
+# data_changed() itself.
+
+VERSION_KEY = 'dbaccounting:data_version'
+
+def page_cache():
+    return caches[get_setting('PAGE_CACHE')]
+
+def new_version():
+    # HTTP dates have a resolution of one second
+    return uuid.uuid4().hex, timezone.now().replace(microsecond=0)
+
+def data_version():
+    """Returns the current (token, published at) data version"""
+    version = page_cache().get(VERSION_KEY)
+    if version is None:
+        page_cache().add(VERSION_KEY, new_version(), None)
+        version = page_cache().get(VERSION_KEY)
+    return version
+
+def publish_version():
+    page_cache().set(VERSION_KEY, new_version(), None)
+
+def data_changed(using=None):
+    """Publishes a new data version once the current transaction commits"""
+    transaction.on_commit(OnCommit(publish_version), using=using)
+
+# Deletes through the admin or the ORM's collector are caught too, at the cost of Django's fast
+# deletes of these models - the posting and deletion functions also call data_changed()
+@receiver((post_save, post_delete), sender=AccountType)
+@receiver((post_save, post_delete), sender=Account)
+@receiver((post_save, post_delete), sender=Transaction)
+@receiver(post_save, sender=JournalEntry)
+def model_changed(sender, using=None, **kwargs):
+    data_changed(using)
+
+def settled(version):
+    """Whether pages read under version may be cached - with a replica, only once it has had time to catch up"""
+    # Pages read by a transaction with uncommitted changes must not be cached under the old version
+    if waiting_on_commit(publish_version):
+        return False
+    return replica_alias() is None or (timezone.now()-version[1]).total_seconds() > get_setting('STICKY_SECONDS')
+
+def page_etag(request, *args, **kwargs):
+    version = data_version()
+    if not settled(version):
+        return None
+    # The pages show the user's name and what their permissions allow
+    return hashlib.md5(f'{version[0]}:{request.user.pk}'.encode()).hexdigest()
+
+def page_last_modified(request, *args, **kwargs):
+    version = data_version()
+    return version[1] if settled(version) else None
+
+class ConditionalGetMixin:
+    """Answers GETs of an unchanged page with a 304, and passes the version to the template for {% cache %}
+
+    Place it after PermissionRequiredMixin, so that permissions are checked before a 304 is sent.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        response = condition(etag_func=page_etag, last_modified_func=page_last_modified)(super().dispatch)(request, *args, **kwargs)
+        # Browsers revalidate on every poll, and shared caches must not keep a user's page
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(fragment_context())
+        return context
+
+def fragment_context():
+    """The template variables of the pages' {% cache %} tags"""
+    version = data_version()
+    if not settled(version):
+        # Nothing is ever stored with a timeout of 0, so the fragments are rendered afresh
+        return {'data_version': 'unsettled', 'fragment_seconds': 0, 'page_cache': get_setting('PAGE_CACHE')}
+    return {'data_version': version[0], 'fragment_seconds': get_setting('FRAGMENT_SECONDS'), 'page_cache': get_setting('PAGE_CACHE')}
@@ -0,0 +1,45 @@
+from django.conf import settings
+
+# Default values for the DBACCOUNTING_* settings
+
+DEFAULTS = {
+    # Currency of new accounts, and the currency reports are consolidated in
+    'CURRENCY': 'AED',
+    # Seconds each process keeps the exchange rates it looked up, so that a rate corrected by another process is
+    # picked up within that time (0 to look every rate up)
+    'RATE_CACHE_SECONDS': 300,
+    # Queue balance changes for the apply_balance_deltas command instead of updating accounts in the request
+    'WRITE_BEHIND': False,
+    # Page size of the JSON API list endpoints, and the most rows a client may ask for
+    'API_PAGE_SIZE': 100,
+    'API_MAX_PAGE_SIZE': 1000,
+    # Most transactions accepted by one bulk POST
+    'API_MAX_BATCH': 1000,
+    # Database alias the read-only views read from with routers.ReplicaRouter, None to read from the primary
+    'REPLICA': None,
+    # Seconds a session's reads stay on the primary after it writes, to cover the replica's lag
+    'STICKY_SECONDS': 5,
+    # Record per-view query counts and timings with instrumentation.InstrumentationMiddleware
+    'INSTRUMENT': False,
+    # Requests kept per URL name for the percentiles, and the time in ms above which a request is logged (None to not log)
+    'INSTRUMENT_WINDOW': 1000,
+    'SLOW_REQUEST_MS': None,
+    # Cache alias holding the version of the account type tree that every process keeps in memory
+    'TREE_CACHE': 'default',
+    # Cache alias holding the data version behind the pages' ETags and their cached fragments, and seconds a fragment is kept
+    'PAGE_CACHE': 'default',
+    'FRAGMENT_SECONDS': 3600,
+    # Seconds the changes API holds back recent changes, so that a writer still committing cannot add changes behind its cursor
+    'CHANGES_SETTLE_SECONDS': 5,
+    # Sink the relay_outbox command delivers ledger events to: file:<path>, an http(s):// URL or the dotted path of a function
+    'OUTBOX_SINK': None,
+    # Reports the snapshot_reports command precomputes, the cache alias holding the lock that lets one request at a
+    # time compute a report, and the seconds the others wait for it before computing the report themselves
+    'SNAPSHOT_REPORTS': ('balance-sheet',),
+    'SNAPSHOT_CACHE': 'default',
+    'SNAPSHOT_LOCK_SECONDS': 120,
+}
+
+def get_setting(name):
+    """Returns the DBACCOUNTING_<name> setting, or the app default if the project does not set it"""
+    return getattr(settings, f'DBACCOUNTING_{name}', DEFAULTS[name])
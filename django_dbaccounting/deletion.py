@@ -0,0 +1,136 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from dbaccounting.models import AccountType, Account, Transaction, TransactionChange, ArchivedTransaction, BalanceDelta, BalanceShard, JournalLeg, OpeningBalance, OutboxEvent
+from dbaccounting.posting import apply_deltas, log_changes
+from dbaccounting.outbox import record_events
+from dbaccounting.tree import tree_changed
+from dbaccounting.conditional import data_changed
+
+# Batched deletion of account types and accounts.
+# Django's delete() collects every descendant type, account and transaction in memory and deletes
+# them row by row, and the cascade leaves the balances of the accounts on the other side of the
+# deleted transactions as they were. AccountDeletion works on subqueries instead: the balance
+# effects are computed with aggregate queries, and the rows are deleted in bounded batches.
+
+class DeletionError(Exception):
+    """Accounts cannot be deleted"""
+
+def subtree_levels(acc_type):
+    """Returns the ids of acc_type and its descendants, one list per level of the tree from acc_type down"""
+    levels = [[acc_type.pk]]
+    while True:
+        children = list(AccountType.objects.filter(parent__in=levels[-1]).values_list('pk', flat=True))
+        if not children:
+            return levels
+        levels.append(children)
+
+class AccountDeletion:
+    """The deletion of a set of accounts, with the account types given as type_levels (top level first)"""
+    def __init__(self, accounts, type_levels=()):
+        self.accounts = accounts
+        self.type_levels = list(type_levels)
+        # The transactions, live or archived, that are deleted with the accounts
+        self.txns = {model: model.objects.filter(Q(from_acc__in=accounts)|Q(to_acc__in=accounts)) for model in (Transaction, ArchivedTransaction)}
+
+    @classmethod
+    def for_type(cls, acc_type):
+        levels = subtree_levels(acc_type)
+        type_ids = [pk for level in levels for pk in level]
+        return cls(Account.objects.filter(acc_type__in=type_ids).values('pk'), levels)
+
+    @classmethod
+    def for_account(cls, acc):
+        return cls(Account.objects.filter(pk=acc.pk).values('pk'))
+
+    def queued_deltas(self):
+        return BalanceDelta.objects.filter(Q(account__in=self.accounts)|Q(transaction__in=self.txns[Transaction].values('pk')))
+
+    def restored(self, model):
+        """The transactions that a deleted edit replaced, which are restored as in posting.delete_transaction"""
+        edits = self.txns[model].filter(edited=False, updating__isnull=False).values('updating')
+        return model.objects.filter(pk__in=edits).exclude(from_acc__in=self.accounts).exclude(to_acc__in=self.accounts)
+
+    def balance_deltas(self):
+        """Returns {account pk: change} reversing the deleted transactions' effect on the remaining accounts"""
+        deltas = defaultdict(float)
+        for model, txns in self.txns.items():
+            # Transactions replaced by an edit no longer count towards the balances
+            live = txns.filter(edited=False).order_by()
+            for row in live.exclude(to_acc__in=self.accounts).values('to_acc').annotate(total=Sum('amount')):
+                deltas[row['to_acc']] -= row['total']
+            for row in live.exclude(from_acc__in=self.accounts).values('from_acc').annotate(total=Sum('amount')):
+                deltas[row['from_acc']] += row['total']
+            for row in self.restored(model).order_by().values('from_acc', 'to_acc').annotate(total=Sum('amount')):
+                deltas[row['from_acc']] -= row['total']
+                deltas[row['to_acc']] += row['total']
+        return {pk: delta for pk, delta in deltas.items() if delta}
+
+    def impact(self):
+        """Returns the number of rows deleted per model and the number of other accounts whose balance changes"""
+        return {
+            'account_types': sum(len(level) for level in self.type_levels),
+            'accounts': self.accounts.count(),
+            'transactions': self.txns[Transaction].count(),
+            'archived_transactions': self.txns[ArchivedTransaction].count(),
+            'opening_balances': OpeningBalance.objects.filter(account__in=self.accounts).count(),
+            'affected_accounts': len(self.balance_deltas()),
+            'queued_deltas': self.queued_deltas().count(),
+        }
+
+    @transaction.atomic
+    def delete(self, batch_size=1000, reverse=True):
+        """Deletes the accounts, their transactions and types, reversing their effect on the other accounts' balances
+
+        With reverse=False, raises DeletionError instead if any other account's balance would change.
+        """
+        if self.queued_deltas().exists():
+            raise DeletionError('Apply the queued balance deltas before deleting these accounts')
+        if JournalLeg.objects.filter(account__in=self.accounts).exists():
+            raise DeletionError('These accounts have journal entries, which cannot be deleted')
+        deltas = self.balance_deltas()
+        if deltas and not reverse:
+            raise DeletionError(f'Deleting these accounts would change the balance of {len(deltas)} other accounts')
+
+        apply_deltas(deltas)
+        for model in self.txns:
+            # Edits of the deleted transactions that are kept lose their link, as with on_delete=SET_NULL
+            unlinked = model.objects.filter(updating__in=self.txns[model].values('pk')).exclude(pk__in=self.txns[model].values('pk'))
+            if model is Transaction:
+                log_changes(TransactionChange.UPDATED, set(self.restored(model).values_list('pk', flat=True))|set(unlinked.values_list('pk', flat=True)))
+            self.restored(model).update(edited=False)
+            unlinked.update(updating=None)
+
+        for model, txns in self.txns.items():
+            # Edits reference the transactions they replaced, so delete the newest first
+            delete_batches(txns.order_by('-pk'), batch_size, transactions_deleted if model is Transaction else None)
+        delete_batches(OpeningBalance.objects.filter(account__in=self.accounts), batch_size)
+        delete_batches(BalanceShard.objects.filter(account__in=self.accounts), batch_size)
+        delete_batches(Account.objects.filter(pk__in=self.accounts), batch_size)
+        for level in reversed(self.type_levels):
+            delete_batches(AccountType.objects.filter(pk__in=level), batch_size)
+        if self.type_levels:
+            tree_changed()
+        data_changed()
+
+def transactions_deleted(ids):
+    log_changes(TransactionChange.DELETED, ids)
+    # Only the ids are read, the rest of the transactions going with their accounts
+    record_events(OutboxEvent.DELETED, [{'id': pk} for pk in ids])
+
+def delete_batches(queryset, batch_size, on_batch=None):
+    """Deletes the rows of queryset batch_size at a time with plain DELETE statements, bypassing Django's collector
+
+    The caller must have dealt with anything referencing the rows and with on_delete handlers, and
+    the deletes send no signals. on_batch is called with the ids of each batch before it is deleted.
+    """
+    model = queryset.model
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        if on_batch is not None:
+            on_batch(ids)
+        model.objects.filter(pk__in=ids)._raw_delete(queryset.db)
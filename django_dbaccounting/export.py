@@ -0,0 +1,140 @@
+import datetime
+import os
+
+from django.conf import settings
+from django.utils import timezone
+
+from dbaccounting.models import ArchivedTransaction, Transaction
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Columnar export of the journal for analytics.
+# Transactions are read in date order as tuples, joined with their accounts and account types,
+# and written chunk by chunk as Arrow record batches to one file per month, in a Hive-style
+# directory layout (month=YYYY-MM/transactions.parquet) that pyarrow.dataset and pandas read as a
+# partitioned dataset. Only one chunk is held in memory at a time. Needs the optional pyarrow.
+
+FORMATS = {'parquet': 'parquet', 'feather': 'arrow'}
+
+# (column, lookup, Arrow type) - the columns shared by Transaction and ArchivedTransaction
+COLUMNS = (
+    ('id', 'id', 'int64'),
+    ('date', 'date', 'timestamp'),
+    ('amount', 'amount', 'float64'),
+    ('currency', 'currency', 'string'),
+    ('note', 'note', 'string'),
+    ('from_acc', 'from_acc', 'int64'),
+    ('from_acc_name', 'from_acc__name', 'string'),
+    ('from_acc_type', 'from_acc__acc_type__name', 'string'),
+    ('from_acc_bal_type', 'from_acc__acc_type__bal_type', 'string'),
+    ('to_acc', 'to_acc', 'int64'),
+    ('to_acc_name', 'to_acc__name', 'string'),
+    ('to_acc_type', 'to_acc__acc_type__name', 'string'),
+    ('to_acc_bal_type', 'to_acc__acc_type__bal_type', 'string'),
+    ('updating', 'updating', 'int64'),
+    ('edited', 'edited', 'bool'),
+)
+
+class ExportError(Exception):
+    """The journal cannot be exported"""
+
+def arrow_schema():
+    types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(), 'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us', tz='UTC' if settings.USE_TZ else None)}
+    return pa.schema([(name, types[kind]) for name, lookup, kind in COLUMNS])
+
+def start_of(day):
+    """Returns the first moment of the date day"""
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+def month_of(moment):
+    return (timezone.localtime(moment) if settings.USE_TZ else moment).strftime('%Y-%m')
+
+def partition_path(directory, month, file_format):
+    return os.path.join(directory, f'month={month}', f'transactions.{FORMATS[file_format]}')
+
+def exported_months(directory):
+    """Returns the months already exported to directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[len('month='):] for name in os.listdir(directory) if name.startswith('month='))
+
+class PartitionWriter:
+    """Writes the batches of one month after another, each to a temporary file moved into place once complete"""
+    def __init__(self, directory, schema, file_format):
+        self.directory = directory
+        self.schema = schema
+        self.file_format = file_format
+        self.month = self.writer = None
+        self.rows = {}
+
+    def write(self, month, rows):
+        if month != self.month:
+            self.close()
+            self.month = month
+            self.path = partition_path(self.directory, month, self.file_format)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.file_format == 'parquet':
+                self.writer = pq.ParquetWriter(self.path+'.tmp', self.schema, compression='snappy')
+            else:
+                self.writer = pa.ipc.new_file(self.path+'.tmp', self.schema)
+            self.rows[month] = 0
+        columns = zip(*rows)
+        batch = pa.RecordBatch.from_arrays([pa.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema)
+        self.writer.write_table(pa.Table.from_batches([batch]))
+        self.rows[month] += len(rows)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.path+'.tmp', self.path)
+            self.writer = None
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.path+'.tmp')
+            self.writer = None
+
+def export_transactions(directory, file_format='parquet', start=None, end=None, chunk_size=50000, archived=False):
+    """Exports the transactions of the months from start up to the date end (exclusive) and returns {month: rows}
+
+    start is rounded down to the first of its month, so that every month written is whole up to end,
+    and the files of the exported months are replaced. With archived=True, exports the archived
+    transactions of closed periods instead.
+    """
+    if pa is None:
+        raise ExportError('Exporting needs pyarrow - install django-dbaccounting[arrow]')
+    if file_format not in FORMATS:
+        raise ExportError(f"Unknown format {file_format} - use {' or '.join(FORMATS)}")
+
+    queryset = (ArchivedTransaction if archived else Transaction).objects.order_by('date', 'pk')
+    if start is not None:
+        queryset = queryset.filter(date__gte=start_of(start.replace(day=1)))
+    if end is not None:
+        queryset = queryset.filter(date__lt=start_of(end))
+    rows = queryset.values_list(*(lookup for name, lookup, kind in COLUMNS)).iterator(chunk_size=chunk_size)
+
+    out = PartitionWriter(directory, arrow_schema(), file_format)
+    try:
+        chunk, chunk_month = [], None
+        for row in rows:
+            # Rows come in date order, so each month's rows are contiguous
+            month = month_of(row[1])
+            if chunk and (month != chunk_month or len(chunk) >= chunk_size):
+                out.write(chunk_month, chunk)
+                chunk = []
+            chunk_month = month
+            chunk.append(row)
+        if chunk:
+            out.write(chunk_month, chunk)
+    except BaseException:
+        out.abort()
+        raise
+    out.close()
+    return out.rows
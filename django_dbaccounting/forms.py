@@ -3,34 +3,60 @@ import datetime
 from django import forms
 from django.forms import ModelForm
 from django.core.exceptions import ValidationError
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import gettext_lazy as _
 
 from dbaccounting.models import Account, Transaction
+from dbaccounting.posting import validate_transaction
+from dbaccounting.identity import AccountMap
+
+def account_pk(value):
+    """The pk of an account choice as submitted, or None if it is not one"""
+    if isinstance(value, Account):
+        return value.pk
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class AccountChoiceField(forms.ModelChoiceField):
+    """Account choice that takes the chosen account from the form's AccountMap"""
+    accounts = None
+
+    def to_python(self, value):
+        if self.accounts is None or value in self.empty_values:
+            return super().to_python(value)
+        acc = self.accounts.get(account_pk(value))
+        if acc is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return acc
 
 class TransactionForm(ModelForm):
 
     class Meta:
         model = Transaction
         fields = '__all__'
-        exclude=['updating','edited']
+        exclude=['updating','edited','pending','currency','idempotency_key']
+        field_classes = {'from_acc': AccountChoiceField, 'to_acc': AccountChoiceField}
+
+    def __init__(self, *args, accounts=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Both accounts are loaded, with their types, in one query when the form is cleaned
+        self.accounts = accounts if accounts is not None else AccountMap()
+        for name in ('from_acc', 'to_acc'):
+            self.fields[name].accounts = self.accounts
+            if self.is_bound:
+                self.accounts.defer([account_pk(self.data.get(self.add_prefix(name)))])
+
+    def _get_validation_exclusions(self):
+        # The accounts were read from the AccountMap, so the model's check that they exist is a wasted query each
+        return super()._get_validation_exclusions() | {'from_acc', 'to_acc'}
 
     def clean(self):
         from_acc_data = self.cleaned_data['from_acc']
         amount_data = self.cleaned_data['amount']
         to_acc_data = self.cleaned_data['to_acc']
 
-        if amount_data<0:
-            raise ValidationError(_('Invalid Amount - Must be greater than or equal to 0'))
+        validate_transaction(from_acc_data,to_acc_data,amount_data)
 
-        if from_acc_data.acc_type.bal_type == 'D':        
-            # Check if from_acc has sufficient balance
-            if from_acc_data.balance < amount_data:
-                raise ValidationError(_('Invalid From Account - Insufficient Funds'))
-
-        if to_acc_data.acc_type.bal_type == 'C':        
-            # Check if from_acc has sufficient balance
-            if to_acc_data.balance + amount_data > 0:
-                raise ValidationError(_('Invalid To Account - Excess Funds'))
-        
         ModelForm.clean(self)
     
\ No newline at end of file
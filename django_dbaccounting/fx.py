@@ -0,0 +1,95 @@
+import datetime
+import time
+from functools import lru_cache
+
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from dbaccounting.conf import get_setting
+from dbaccounting.models import Account, FxRate
+
+# Currency conversion for reports.
+# Queries convert in SQL with a correlated subquery on the rate table, so a report is still one
+# query however many accounts it covers. Python code converts through get_rate, which caches
+# each (pair, date) rate found for DBACCOUNTING_RATE_CACHE_SECONDS - missing rates are looked up again.
+
+class MissingRate(ValueError):
+    """There is no rate to convert between two currencies on or before a date"""
+    def __init__(self, base, quote, date):
+        super().__init__(f'No exchange rate from {base} to {quote} on or before {date}')
+        self.base, self.quote, self.date = base, quote, date
+
+def rate_subquery(base, quote, date):
+    """A subquery of the latest rate from the base expression's currency to quote on or before date"""
+    return Subquery(FxRate.objects.filter(base=base, quote=quote, date__lte=date).order_by('-date').values('rate')[:1])
+
+def converted(amount, currency, quote=None, date=None):
+    """An expression of the amount field converted from the currency field's currency to quote, NULL without a rate"""
+    quote = quote or get_setting('CURRENCY')
+    date = date or datetime.date.today()
+    rate = Coalesce(rate_subquery(OuterRef(currency), quote, date), Value(1.0)/rate_subquery(quote, OuterRef(currency), date))
+    return Case(When(**{currency: quote}, then=F(amount)), default=F(amount)*rate)
+
+def with_reporting_balance(accs, quote=None, date=None):
+    """Annotates accounts with reporting_balance, their balance (with any balance shards) converted to quote on date"""
+    return accs.with_current_balance().annotate(reporting_balance=converted('current_balance', 'currency', quote, date))
+
+def consolidated_totals(quote=None, date=None):
+    """Returns {account type id: total balance converted to quote} in a single aggregate query"""
+    accs = Account.objects.order_by().with_current_balance().alias(converted=converted('current_balance', 'currency', quote, date))
+    totals = accs.values('acc_type').annotate(total=Sum('converted'), missing=Count('pk', filter=Q(converted__isnull=True)))
+
+    totals = list(totals)
+    if any(row['missing'] for row in totals):
+        # Sum() skips NULLs, so an account without a rate would silently drop out of the total
+        currency = accs.filter(converted__isnull=True).values_list('currency', flat=True).first()
+        raise MissingRate(currency, quote or get_setting('CURRENCY'), date or datetime.date.today())
+    return {row['acc_type']: row['total'] for row in totals}
+
+class RateNotFound(LookupError):
+    pass
+
+def lookup_rate(base, quote, date):
+    if base == quote:
+        return 1.0
+    rate = FxRate.objects.filter(base=base, quote=quote, date__lte=date).order_by('-date').values_list('rate', flat=True).first()
+    if rate is None:
+        inverse = FxRate.objects.filter(base=quote, quote=base, date__lte=date).order_by('-date').values_list('rate', flat=True).first()
+        rate = 1/inverse if inverse else None
+    if rate is None:
+        # lru_cache does not keep exceptions, so a rate loaded later, even by another process, is found on the next call
+        raise RateNotFound
+    return rate
+
+@lru_cache(maxsize=1024)
+def cached_rate(base, quote, date, window):
+    # Keyed by the time window too, so that entries of a past window are never read again and age out of the cache
+    return lookup_rate(base, quote, date)
+
+def get_rate(base, quote, date):
+    """Returns the latest base to quote rate on or before date, or None, using the inverse rate if needed"""
+    seconds = get_setting('RATE_CACHE_SECONDS')
+    try:
+        if not seconds:
+            return lookup_rate(base, quote, date)
+        return cached_rate(base, quote, date, int(time.monotonic()//seconds))
+    except RateNotFound:
+        return None
+
+get_rate.cache_clear = cached_rate.cache_clear
+
+def convert(amount, base, quote=None, date=None):
+    """Converts amount from base to quote at the rate on date, raising MissingRate if there is none"""
+    quote = quote or get_setting('CURRENCY')
+    date = date or datetime.date.today()
+    rate = get_rate(base, quote, date)
+    if rate is None:
+        raise MissingRate(base, quote, date)
+    return amount*rate
+
+@receiver((post_save, post_delete), sender=FxRate)
+def clear_rate_cache(sender, **kwargs):
+    # The cache is per process - the others pick the change up once their cache window ends
+    get_rate.cache_clear()
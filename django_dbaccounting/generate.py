@@ -0,0 +1,113 @@
+import datetime
+import random
+import uuid
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from dbaccounting.models import AccountType, Account, Transaction, TransactionChange
+from dbaccounting.posting import log_changes
+from dbaccounting.tree import tree_changed
+from dbaccounting.conditional import data_changed
+
+# Synthetic ledgers for benchmarking.
+# generate_ledger builds a chart of accounts and a transaction history with bulk inserts only, in
+# batches, so that millions of transactions can be generated with flat memory use. Balances are
+# set at the end to an opening balance plus the generated postings, so the ledger is consistent.
+# The names of the generated types and accounts start with a prefix unique to the run, so that it
+# can add to a database that already has a chart of accounts.
+
+ROOT_TYPES = (('Assets', 'D'), ('Liabilities', 'C'), ('Equity', 'C'), ('Income', 'C'), ('Expenses', 'D'))
+
+def run_prefix():
+    return f'{uuid.uuid4().hex[:8]} '
+
+def bulk_create_named(model, objs, batch_size=None, queryset=None):
+    """bulk_create()s objs and returns them with their ids, reading them back by their unique names where the backend cannot return ids"""
+    created = model.objects.bulk_create(objs, batch_size=batch_size)
+    if all(obj.pk is not None for obj in created):
+        return created
+    by_name = (model.objects if queryset is None else queryset).in_bulk([obj.name for obj in objs], field_name='name')
+    return [by_name[obj.name] for obj in objs]
+
+def generate_types(depth, width, prefix=''):
+    """Creates a tree of account types under each root type, width children per type down to depth levels, and returns the leaves"""
+    level = bulk_create_named(AccountType, [AccountType(name=f'{prefix}{name}', bal_type=bal_type) for name, bal_type in ROOT_TYPES])
+    for _ in range(1, depth):
+        # Assets 1, Assets 1.1, ...
+        level = bulk_create_named(AccountType, [AccountType(name=f"{parent.name}{'.' if parent.parent_id else ' '}{child+1}", bal_type=parent.bal_type, parent=parent)
+            for parent in level for child in range(width)])
+    tree_changed()
+    return level
+
+def bulk_create_transactions(txns):
+    """bulk_create()s txns and returns their ids, reading them back where the backend cannot return ids"""
+    if connections[router.db_for_write(Transaction)].features.can_return_rows_from_bulk_insert:
+        return [txn.pk for txn in Transaction.objects.bulk_create(txns)]
+    # Called inside a transaction, so the rows after the last id are the ones inserted
+    last = Transaction.objects.aggregate(last=Max('pk'))['last'] or 0
+    Transaction.objects.bulk_create(txns)
+    return list(Transaction.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True))
+
+def generate_ledger(depth=3, width=4, accounts=1000, transactions=100000, hot_accounts=10, hot_share=0.5, days=365, seed=0, batch_size=5000, prefix=None):
+    """Generates a chart of accounts and a history of transactions, returning the number of rows created per model
+
+    The names of the types and accounts start with prefix, by default a random one.
+
+    hot_share of the transactions touch one of the first hot_accounts accounts, to reproduce the skew of
+    real ledgers where a few clearing and bank accounts see most of the postings. The transactions are
+    spread evenly over the last days days, oldest first.
+    """
+    rng = random.Random(seed)
+    prefix = run_prefix() if prefix is None else prefix
+    types = len(ROOT_TYPES)*sum(width**level for level in range(depth))
+    with transaction.atomic():
+        leaves = generate_types(depth, width, prefix)
+        accs = bulk_create_named(Account, [Account(name=f'{prefix}Account {i+1}', acc_type=leaves[i % len(leaves)], balance=0) for i in range(accounts)],
+            batch_size, Account.objects.select_related('acc_type'))
+    if len(accs) < 2:
+        return {'account_types': types, 'accounts': len(accs), 'transactions': 0}
+
+    hot = accs[:max(1, min(hot_accounts, len(accs)))]
+    def pick():
+        return rng.choice(hot) if rng.random() < hot_share else rng.choice(accs)
+
+    # One timestamp per batch keeps the dates in step with the ids without updating rows one by one
+    end = timezone.now()
+    start = end-datetime.timedelta(days=days)
+    batches = -(-transactions//batch_size) if transactions else 0
+    net = defaultdict(float)
+
+    for batch in range(batches):
+        txns = []
+        for i in range(min(batch_size, transactions-batch*batch_size)):
+            from_acc = pick()
+            to_acc = pick()
+            while to_acc is from_acc:
+                to_acc = rng.choice(accs)
+            amount = round(rng.uniform(1, 1000), 2)
+            net[from_acc.pk] -= amount
+            net[to_acc.pk] += amount
+            txns.append(Transaction(from_acc=from_acc, to_acc=to_acc, amount=amount, currency=from_acc.currency, note=f'Generated {batch*batch_size+i+1}'))
+
+        with transaction.atomic():
+            ids = bulk_create_transactions(txns)
+            # date is auto_now_add, so bulk_create stamps every row with now
+            Transaction.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]).update(date=start+(end-start)*batch/max(1, batches-1))
+            log_changes(TransactionChange.CREATED, ids)
+
+    # Opening balances large enough that no debit account ends below zero and no credit account above it
+    now = timezone.now()
+    for acc in accs:
+        acc.updated_at = now
+        movement = net.get(acc.pk, 0)
+        if acc.acc_type.bal_type == 'D':
+            acc.balance = max(0, -movement)+rng.uniform(0, 10000)+movement
+        else:
+            acc.balance = min(0, -movement)-rng.uniform(0, 10000)+movement
+    Account.objects.bulk_update(accs, ['balance', 'updated_at'], batch_size=batch_size)
+    data_changed()
+
+    return {'account_types': types, 'accounts': len(accs), 'transactions': transactions}
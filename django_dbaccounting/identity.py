@@ -0,0 +1,62 @@
+from dbaccounting.conf import get_setting
+from dbaccounting.models import Account
+
+# Per-request identity map of accounts.
+# The views of a request, its TransactionForm and the posting functions get their Account and
+# AccountType instances from one AccountMap, so each row is loaded at most once per request and
+# every reference to an account is the same Python object. Accounts wanted together are loaded
+# together: defer() collects their ids and the next get() loads them all in one query.
+
+class AccountMap:
+    """Accounts, and their account types, by pk - one instance per row"""
+    def __init__(self):
+        self.accounts = {}
+        self.types = {}
+        self.pending = set()
+
+    def defer(self, pks):
+        """Marks the accounts with the given pks to be loaded with the next one that is needed"""
+        self.pending.update(pk for pk in pks if pk is not None and pk not in self.accounts)
+
+    def load(self):
+        pks, self.pending = self.pending, set()
+        if not pks:
+            return
+        accs = Account.objects.select_related('acc_type')
+        if get_setting('WRITE_BEHIND'):
+            accs = accs.with_pending_balance()
+        for acc in accs.filter(pk__in=pks):
+            self.add(acc)
+
+    def get(self, pk):
+        """Returns the account with the given pk, or None if there is none"""
+        if pk not in self.accounts:
+            self.defer([pk])
+            self.load()
+        return self.accounts.get(pk)
+
+    def add(self, acc):
+        """Returns the map's instance of acc's row, adding acc if it has none yet"""
+        if acc.pk in self.accounts:
+            return self.accounts[acc.pk]
+        acc_type_field = Account._meta.get_field('acc_type')
+        if acc_type_field.is_cached(acc):
+            acc.acc_type = self.types.setdefault(acc.acc_type_id, acc.acc_type)
+        elif acc.acc_type_id in self.types:
+            acc.acc_type = self.types[acc.acc_type_id]
+        self.accounts[acc.pk] = acc
+        return acc
+
+    def attach(self, txns):
+        """Points the accounts of txns at the map's instances, loading the missing ones in one query"""
+        self.defer(pk for txn in txns for pk in (txn.from_acc_id, txn.to_acc_id))
+        for txn in txns:
+            txn.from_acc = self.get(txn.from_acc_id)
+            txn.to_acc = self.get(txn.to_acc_id)
+        return txns
+
+def request_accounts(request):
+    """Returns the AccountMap of request, creating it on first use"""
+    if not hasattr(request, '_dbaccounting_accounts'):
+        request._dbaccounting_accounts = AccountMap()
+    return request._dbaccounting_accounts
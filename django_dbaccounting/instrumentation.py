@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from dbaccounting.conf import get_setting
+
+# Request instrumentation
+# InstrumentationMiddleware records the query count, database time, render time and total time of
+# every request to a dbaccounting view, keeping the last DBACCOUNTING_INSTRUMENT_WINDOW requests of
+# each URL name for the percentiles served by api.view_stats. record_queries() gives tests the same
+# numbers for a block of code, to assert query budgets.
+
+logger = logging.getLogger('dbaccounting.instrumentation')
+
+# Number of statements logged with a slow request
+SLOW_REQUEST_STATEMENTS = 5
+
+class QueryRecorder:
+    """Counts and times the statements executed while it is installed as a connection's execute wrapper"""
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter()-start
+            self.count += 1
+            self.time += elapsed
+            self.statements.append((elapsed, sql))
+
+    def slowest(self, count=SLOW_REQUEST_STATEMENTS):
+        """Returns the count slowest (seconds, sql) statements"""
+        return sorted(self.statements, key=lambda statement: statement[0], reverse=True)[:count]
+
+@contextmanager
+def record_queries():
+    """Records the statements run on every database connection of this thread inside the block"""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(recorder))
+        yield recorder
+
+def percentile(values, pct):
+    """Nearest-rank percentile of the sorted list values"""
+    if not values:
+        return None
+    return values[min(len(values)-1, max(0, round(pct/100*len(values))-1))]
+
+class ViewStats:
+    """Rolling samples of (queries, db_ms, render_ms, total_ms) per URL name, shared by the threads of a process"""
+    FIELDS = ('queries', 'db_ms', 'render_ms', 'total_ms')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=get_setting('INSTRUMENT_WINDOW')))
+
+    def add(self, url_name, *sample):
+        with self.lock:
+            self.samples[url_name].append(sample)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self):
+        """Returns {url name: {'requests': n, field: {'p50', 'p90', 'p99', 'max'}}}"""
+        with self.lock:
+            samples = {url_name: list(rows) for url_name, rows in self.samples.items()}
+
+        summary = {}
+        for url_name, rows in samples.items():
+            summary[url_name] = {'requests': len(rows)}
+            for index, field in enumerate(self.FIELDS):
+                values = sorted(row[index] for row in rows)
+                summary[url_name][field] = {'p50': percentile(values, 50), 'p90': percentile(values, 90), 'p99': percentile(values, 99), 'max': values[-1]}
+        return summary
+
+stats = ViewStats()
+
+class InstrumentationMiddleware:
+    """Records the cost of each dbaccounting view in stats and logs the requests slower than DBACCOUNTING_SLOW_REQUEST_MS
+
+    Removed from the middleware chain unless DBACCOUNTING_INSTRUMENT is set, so it costs nothing when disabled.
+    The render time covers TemplateResponses rendered by the handler; views that render before returning count it as view time.
+    """
+    def __init__(self, get_response):
+        if not get_setting('INSTRUMENT'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        total = time.perf_counter()-start
+
+        match = request.resolver_match
+        if match is None or not match.url_name or not getattr(match.func, '__module__', '').startswith('dbaccounting.'):
+            return response
+
+        total_ms = total*1000
+        render_ms = getattr(request, '_dbaccounting_render_time', 0.0)*1000
+        stats.add(match.url_name, recorder.count, recorder.time*1000, render_ms, total_ms)
+
+        slow_ms = get_setting('SLOW_REQUEST_MS')
+        if slow_ms is not None and total_ms >= slow_ms:
+            statements = ''.join(f'\n  {seconds*1000:.1f}ms {sql}' for seconds, sql in recorder.slowest())
+            logger.warning('Slow request %s %s (%s): %.1fms, %d queries in %.1fms%s',
+                request.method, request.path, match.url_name, total_ms, recorder.count, recorder.time*1000, statements)
+        return response
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+        def rendered(response):
+            request._dbaccounting_render_time = time.perf_counter()-start
+        response.add_post_render_callback(rendered)
+        return response
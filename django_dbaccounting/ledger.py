@@ -0,0 +1,154 @@
+import logging
+from array import array
+
+from dbaccounting.fx import convert, with_reporting_balance
+from dbaccounting.models import Account
+
+# Compact in-memory ledger of the account tree.
+# LedgerTree keeps the account types in depth-first order and their accounts as parallel arrays
+# built from values_list() rows, instead of a model instance per account and an object per type.
+# Each type points at its parent by index, so the totals are rolled up in one backwards pass over
+# that order, children before their parents. LedgerNode and LedgerAccount are slotted views onto
+# the arrays, made on access, with the attributes the templates and API serializers read.
+
+logger = logging.getLogger('dbaccounting.ledger')
+
+# The values_list() fields of the rows a LedgerTree is built from
+ACCOUNT_FIELDS = ('pk', 'name', 'acc_type', 'current_balance', 'currency', 'reporting_balance')
+
+def account_rows(date, quote=None):
+    """The rows of every account, with their balance converted to quote on date in the same query"""
+    return with_reporting_balance(Account.objects.order_by(), quote, date).values_list(*ACCOUNT_FIELDS)
+
+class LedgerTree:
+    """The account types of a type tree with their accounts and rolled up totals, as parallel arrays"""
+    __slots__ = ('types', 'position', 'parents', 'depths', 'own', 'totals', 'acc_start',
+        'acc_ids', 'acc_names', 'balances', 'currencies', 'reporting')
+
+    def __init__(self, tree, rows, date=None, quote=None):
+        """Builds the ledger of tree.TypeTree tree from (pk, name, acc_type, balance, currency, reporting_balance) rows
+
+        A reporting_balance of None is converted from the balance to quote at the rate on date, raising
+        fx.MissingRate if there is none. Accounts of a type the tree does not have yet are left out.
+        """
+        order = list(tree.depth_first())
+        self.types = [node for node, depth in order]
+        self.position = {node.id: i for i, node in enumerate(self.types)}
+        self.parents = array('l', (self.position[node.parent_id] if node.parent_id is not None else -1 for node in self.types))
+        self.depths = array('l', (depth for node, depth in order))
+
+        # The rows may come from a replica, or from a moment after the tree was loaded
+        rows, known = list(rows), []
+        for row in rows:
+            if row[2] in self.position:
+                known.append(row)
+        if len(known) < len(rows):
+            logger.warning('Left %d accounts of unknown account types out of the ledger', len(rows)-len(known))
+
+        # Each type's accounts are stored together, in name order
+        rows = sorted(known, key=lambda row: (self.position[row[2]], row[1]))
+        self.acc_ids = array('q', (row[0] for row in rows))
+        self.acc_names = [row[1] for row in rows]
+        self.balances = array('d', (row[3] or 0.0 for row in rows))
+        # Share one string per currency code rather than one per row
+        codes = {}
+        self.currencies = [codes.setdefault(row[4], row[4]) for row in rows]
+        self.reporting = array('d', (row[5] if row[5] is not None else convert(row[3] or 0.0, row[4], quote, date) for row in rows))
+
+        # acc_start[i]:acc_start[i+1] are the accounts of the type at position i
+        counts = array('l', bytes(array('l').itemsize*(len(self.types)+1)))
+        self.own = array('d', bytes(array('d').itemsize*len(self.types)))
+        for row, reporting in zip(rows, self.reporting):
+            i = self.position[row[2]]
+            counts[i+1] += 1
+            self.own[i] += reporting
+        for i in range(len(self.types)):
+            counts[i+1] += counts[i]
+        self.acc_start = counts
+
+        # Children come after their parents, so one backwards pass rolls every subtree up
+        self.totals = array('d', self.own)
+        for i in range(len(self.types)-1, -1, -1):
+            if self.parents[i] >= 0:
+                self.totals[self.parents[i]] += self.totals[i]
+
+    @property
+    def roots(self):
+        """The ledgers of the top-level types"""
+        return [LedgerNode(self, i) for i, parent in enumerate(self.parents) if parent < 0]
+
+    def as_dicts(self):
+        return [node.as_dict() for node in self.roots]
+
+class LedgerNode:
+    """One account type of a LedgerTree, with its accounts, sub-ledgers and totals"""
+    __slots__ = ('ledger', 'index')
+
+    def __init__(self, ledger, index):
+        self.ledger, self.index = ledger, index
+
+    @property
+    def acc_type(self):
+        return self.ledger.types[self.index]
+
+    @property
+    def depth(self):
+        return self.ledger.depths[self.index]
+
+    @property
+    def total(self):
+        """The total of the type's accounts and all the types below it"""
+        return self.ledger.totals[self.index]
+
+    @property
+    def subtotal(self):
+        """The total of the types below it"""
+        return self.ledger.totals[self.index]-self.ledger.own[self.index]
+
+    @property
+    def accs(self):
+        start, end = self.ledger.acc_start[self.index], self.ledger.acc_start[self.index+1]
+        return [LedgerAccount(self.ledger, i) for i in range(start, end)]
+
+    @property
+    def children(self):
+        return [LedgerNode(self.ledger, self.ledger.position[child.id]) for child in self.acc_type.children]
+
+    def as_dict(self):
+        return {
+            'acc_type': self.acc_type.id,
+            'name': self.acc_type.name,
+            'total': self.total,
+            'accounts': [acc.as_dict() for acc in self.accs],
+            'children': [child.as_dict() for child in self.children],
+        }
+
+class LedgerAccount:
+    """One account of a LedgerTree"""
+    __slots__ = ('ledger', 'index')
+
+    def __init__(self, ledger, index):
+        self.ledger, self.index = ledger, index
+
+    @property
+    def pk(self):
+        return self.ledger.acc_ids[self.index]
+
+    @property
+    def name(self):
+        return self.ledger.acc_names[self.index]
+
+    @property
+    def balance(self):
+        return self.ledger.balances[self.index]
+
+    @property
+    def currency(self):
+        return self.ledger.currencies[self.index]
+
+    @property
+    def reporting_balance(self):
+        return self.ledger.reporting[self.index]
+
+    def as_dict(self):
+        return {'id': self.pk, 'name': self.name, 'balance': self.balance, 'currency': self.currency, 'reporting_balance': self.reporting_balance}
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dbaccounting.posting import apply_queued_deltas
+
+class Command(BaseCommand):
+    help = "Applies the balance deltas queued by write-behind posting, coalesced into one update per account per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Maximum number of deltas applied per batch")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling")
+
+    def handle(self, *args, **options):
+        while True:
+            applied = apply_queued_deltas(options['batch_size'])
+            if applied:
+                self.stdout.write(f'Applied {applied} balance deltas')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
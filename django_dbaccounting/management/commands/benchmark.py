@@ -0,0 +1,68 @@
+import datetime
+import json
+import os
+import platform
+import tempfile
+
+import django
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from dbaccounting.bench import SCENARIOS
+
+class Command(BaseCommand):
+    help = ("Runs the dbaccounting benchmark scenarios against a throwaway test database and prints the results as JSON. "
+        "The concurrent posting scenarios only show a gain on a database with row locks, e.g. PostgreSQL: "
+        "SQLite serializes every write, so they run single-threaded there unless --threads is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+        parser.add_argument('--postings', type=int, default=2000, help="Number of transactions posted by posting scenarios")
+        parser.add_argument('--shards', type=int, default=8, help="Number of balance shards of the sharded_account scenario's clearing account")
+        parser.add_argument('--requests', type=int, default=200, help="Number of requests made per endpoint by request scenarios")
+        parser.add_argument('--threads', type=int, help="Number of concurrent workers (default: 4, or 1 on SQLite)")
+        parser.add_argument('--accounts', type=int, default=1000, help="Number of accounts generated by the ledger scenario")
+        parser.add_argument('--transactions', type=int, default=100000, help="Number of transactions generated by the ledger scenario")
+        parser.add_argument('--depth', type=int, default=3, help="Levels of account types generated by the ledger scenario")
+        parser.add_argument('--width', type=int, default=4, help="Child types per account type generated by the ledger scenario")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of times each timed operation is run - the median is reported")
+        parser.add_argument('--label', help="Label stored with the results, e.g. the commit being measured")
+        parser.add_argument('--output', help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names)-set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        # Never touch the project's data - benchmarks run in a test database that is dropped afterwards.
+        # SQLite test databases default to shared in-memory ones, which lock out concurrent writers, so use a file.
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'dbaccounting_benchmark.sqlite3')
+        if options['threads'] is None:
+            # A second SQLite writer only waits on the database lock, or fails once its timeout runs out
+            options['threads'] = 1 if connection.vendor == 'sqlite' else 4
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {name: SCENARIOS[name](options) for name in names}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        # Enough context to compare results across commits and machines
+        meta = {
+            'label': options['label'],
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'options': {name: options[name] for name in ('postings', 'requests', 'threads', 'accounts', 'transactions', 'depth', 'width', 'repeat')},
+        }
+        output = json.dumps({'meta': meta, 'results': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dbaccounting.periods import PeriodError, close_period
+
+class Command(BaseCommand):
+    help = "Closes the accounting period ending on the given date, recording opening balances and archiving its transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('end', type=datetime.date.fromisoformat, help="Last day of the period (YYYY-MM-DD)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of transactions archived per batch")
+
+    def handle(self, *args, **options):
+        try:
+            period = close_period(options['end'], options['batch_size'])
+        except PeriodError as e:
+            raise CommandError(e)
+        self.stdout.write(f'Closed the period ending {period.end} - {period.openingbalance_set.count()} opening balances recorded')
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dbaccounting.posting import compact_balance_shards
+
+class Command(BaseCommand):
+    help = "Folds the balance shards of sharded accounts into their balance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds to wait between compactions")
+        parser.add_argument('--once', action='store_true', help="Compact once and exit instead of repeating")
+
+    def handle(self, *args, **options):
+        while True:
+            compacted = compact_balance_shards()
+            if compacted:
+                self.stdout.write(f'Compacted the balance shards of {compacted} accounts')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
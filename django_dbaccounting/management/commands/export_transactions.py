@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dbaccounting.export import FORMATS, ExportError, export_transactions, exported_months
+
+class Command(BaseCommand):
+    help = "Exports the transactions with their accounts to Parquet or Feather files, one per month"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Directory the month=YYYY-MM partitions are written to")
+        parser.add_argument('--format', choices=FORMATS, default='parquet')
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help="Export from the month of this date (YYYY-MM-DD)")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help="Export up to this date, exclusive (YYYY-MM-DD)")
+        parser.add_argument('--incremental', action='store_true', help="Export from the newest month already in the directory")
+        parser.add_argument('--chunk-size', type=int, default=50000, help="Number of rows read and written at a time")
+        parser.add_argument('--archived', action='store_true', help="Export the archived transactions of closed periods")
+
+    def handle(self, *args, **options):
+        start = options['start']
+        if options['incremental']:
+            months = exported_months(options['directory'])
+            # The newest month may have been exported before it ended, so it is exported again
+            if months:
+                start = datetime.date.fromisoformat(f'{months[-1]}-01')
+        try:
+            exported = export_transactions(options['directory'], options['format'], start, options['end'], options['chunk_size'], options['archived'])
+        except ExportError as e:
+            raise CommandError(e)
+        for month, rows in exported.items():
+            self.stdout.write(f'Exported {rows} transactions of {month}')
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dbaccounting.generate import generate_ledger
+
+class Command(BaseCommand):
+    help = "Adds a synthetic chart of accounts and transaction history to the database, for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=3, help="Levels of account types, including the root types")
+        parser.add_argument('--width', type=int, default=4, help="Child types of each account type")
+        parser.add_argument('--accounts', type=int, default=1000, help="Number of accounts, spread over the leaf types")
+        parser.add_argument('--transactions', type=int, default=100000, help="Number of transactions")
+        parser.add_argument('--hot-accounts', type=int, default=10, help="Number of accounts that see a large share of the transactions")
+        parser.add_argument('--hot-share', type=float, default=0.5, help="Share of the transactions that touch a hot account")
+        parser.add_argument('--days', type=int, default=365, help="Number of days the transactions are spread over")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, so that runs can be reproduced")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of rows inserted per query")
+        parser.add_argument('--prefix', help="Prefix of the names of the generated types and accounts (default a random one per run)")
+
+    def handle(self, *args, **options):
+        if options['depth'] < 1 or options['width'] < 1:
+            raise CommandError('depth and width must be at least 1')
+        if not 0 <= options['hot_share'] <= 1:
+            raise CommandError('hot-share must be between 0 and 1')
+
+        start = time.perf_counter()
+        counts = generate_ledger(options['depth'], options['width'], options['accounts'], options['transactions'],
+            options['hot_accounts'], options['hot_share'], options['days'], options['seed'], options['batch_size'], options['prefix'])
+        self.stdout.write(f"Generated {counts['account_types']} account types, {counts['accounts']} accounts and "
+            f"{counts['transactions']} transactions in {time.perf_counter()-start:.1f}s")
@@ -0,0 +1,31 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dbaccounting.chart import ChartError, import_chart
+
+class Command(BaseCommand):
+    help = "Imports a chart of accounts from a JSON file of account_types and accounts, with parents referenced by name"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSON file to import, or - for standard input")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows inserted per query")
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                chart = json.load(sys.stdin)
+            else:
+                with open(options['path']) as f:
+                    chart = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        start = time.perf_counter()
+        try:
+            counts = import_chart(chart, options['batch_size'])
+        except ChartError as e:
+            raise CommandError('\n'.join(e.errors))
+        self.stdout.write(f"Imported {counts['account_types']} account types and {counts['accounts']} accounts in {time.perf_counter()-start:.1f}s")
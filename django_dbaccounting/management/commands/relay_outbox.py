@@ -0,0 +1,37 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dbaccounting.conf import get_setting
+from dbaccounting.outbox import relay, sink_from_spec, purge_delivered
+
+class Command(BaseCommand):
+    help = "Delivers the ledger events in the outbox to a sink in batches, marking each batch delivered"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sink', help="file:<path>, an http(s):// URL or the dotted path of a function (default DBACCOUNTING_OUTBOX_SINK)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Maximum number of events delivered per batch")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to wait when the outbox is empty")
+        parser.add_argument('--keep-days', type=float, help="Delete events delivered more than this many days ago")
+        parser.add_argument('--once', action='store_true', help="Drain the outbox and exit instead of polling")
+
+    def handle(self, *args, **options):
+        spec = options['sink'] or get_setting('OUTBOX_SINK')
+        if not spec:
+            raise CommandError('No sink given with --sink or DBACCOUNTING_OUTBOX_SINK')
+        sink = sink_from_spec(spec)
+
+        while True:
+            delivered = relay(sink, options['batch_size'])
+            if delivered:
+                self.stdout.write(f'Delivered {delivered} events')
+                continue
+            if options['keep_days'] is not None:
+                purged = purge_delivered(timezone.now()-datetime.timedelta(days=options['keep_days']))
+                if purged:
+                    self.stdout.write(f'Deleted {purged} delivered events')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
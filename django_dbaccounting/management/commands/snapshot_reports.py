@@ -0,0 +1,26 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+
+from dbaccounting.conf import get_setting
+from dbaccounting.snapshots import REPORTS, get_snapshot
+
+class Command(BaseCommand):
+    help = "Precomputes snapshots of the configured reports, for the snapshot views to serve"
+
+    def add_arguments(self, parser):
+        parser.add_argument('reports', nargs='*', help="Reports to compute (default DBACCOUNTING_SNAPSHOT_REPORTS)")
+        parser.add_argument('--key', help="Which instance of the reports to compute, e.g. period:<end date> (default today)")
+
+    def handle(self, *args, **options):
+        names = options['reports'] or get_setting('SNAPSHOT_REPORTS')
+        unknown = set(names)-set(REPORTS)
+        if unknown:
+            raise CommandError(f"Unknown reports: {', '.join(sorted(unknown))}")
+        for name in names:
+            key = options['key'] or REPORTS[name].default_key()
+            try:
+                REPORTS[name].check_key(key)
+            except (ValueError, ObjectDoesNotExist):
+                raise CommandError(f'{name} cannot be computed for {key}')
+            snapshot = get_snapshot(name, key, recompute=True)
+            self.stdout.write(f'Computed {name} {key} in {snapshot.duration:.2f}s')
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbaccounting', '0010_auto_20200307_1933'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='pending',
+            field=models.BooleanField(default=False, help_text='Balance changes are queued and not yet applied to the accounts'),
+        ),
+        migrations.CreateModel(
+            name='BalanceDelta',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.FloatField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dbaccounting.account')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dbaccounting.transaction')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:18
+
+import dbaccounting.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbaccounting', '0011_transaction_pending_balancedelta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=3)),
+                ('quote', models.CharField(max_length=3)),
+                ('date', models.DateField()),
+                ('rate', models.FloatField()),
+            ],
+            options={
+                'ordering': ['base', 'quote', '-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='currency',
+            field=models.CharField(default=dbaccounting.models.default_currency, help_text='ISO 4217 code of the currency the account is kept in', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='currency',
+            field=models.CharField(default=dbaccounting.models.default_currency, max_length=3),
+        ),
+        migrations.AddConstraint(
+            model_name='fxrate',
+            constraint=models.UniqueConstraint(fields=('base', 'quote', 'date'), name='unique_fx_rate'),
+        ),
+    ]
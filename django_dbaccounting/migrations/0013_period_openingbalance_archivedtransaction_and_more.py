@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbaccounting', '0012_fxrate_account_currency_transaction_currency_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Period',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('end', models.DateField(unique=True)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-end'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OpeningBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.FloatField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dbaccounting.account')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dbaccounting.period')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateTimeField(db_index=True)),
+                ('amount', models.FloatField()),
+                ('currency', models.CharField(max_length=3)),
+                ('note', models.TextField(blank=True, max_length=256, null=True)),
+                ('edited', models.BooleanField(default=False)),
+                ('from_acc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_from_account', to='dbaccounting.account', verbose_name='from account')),
+                ('to_acc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_to_account', to='dbaccounting.account', verbose_name='to account')),
+                ('updating', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dbaccounting.archivedtransaction')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='openingbalance',
+            constraint=models.UniqueConstraint(fields=('period', 'account'), name='unique_opening_balance'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbaccounting', '0014_account_balance_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client-supplied key identifying the request that posted the transaction - retries with the same key return it instead of posting again', max_length=64, null=True, unique=True),
+        ),
+    ]
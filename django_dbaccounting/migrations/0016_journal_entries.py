@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:53
+
+import dbaccounting.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbaccounting', '0015_transaction_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('currency', models.CharField(default=dbaccounting.models.default_currency, max_length=3)),
+                ('note', models.TextField(blank=True, max_length=256, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'journal entries',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='JournalLeg',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.FloatField(help_text="Added to the account's balance - negative for the accounts the amounts come from")),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='dbaccounting.account')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='dbaccounting.journalentry')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
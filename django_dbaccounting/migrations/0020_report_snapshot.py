@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbaccounting', '0019_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report', models.CharField(max_length=32)),
+                ('key', models.CharField(help_text='Which instance of the report, e.g. the date it is reported on', max_length=64)),
+                ('content', models.TextField()),
+                ('computed_at', models.DateTimeField(help_text='When the computation started - the report shows the data as of then')),
+                ('duration', models.FloatField(help_text='Seconds taken to compute the report')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reportsnapshot',
+            constraint=models.UniqueConstraint(fields=('report', 'key'), name='unique_report_snapshot'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbaccounting', '0020_report_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,8 +1,17 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils.functional import cached_property
+
+from dbaccounting.conf import get_setting
 
 # Create your models here.
 
+def default_currency():
+    """The project's reporting currency (DBACCOUNTING_CURRENCY), used for new accounts and transactions"""
+    return get_setting('CURRENCY')
+
 class AccountType(models.Model):
     name = models.CharField(max_length=64, unique=True)
     
@@ -15,6 +24,7 @@ class AccountType(models.Model):
         help_text="Indicate whether the account type is a credit or debit", verbose_name = "balance type")
     
     parent = models.ForeignKey('AccountType',on_delete=models.CASCADE,help_text = "Is this a subcategory (e.g. Current Assets)",null=True,blank=True)
+    updated_at = models.DateTimeField(auto_now=True,db_index=True)
     
     class Meta:
         ordering = ['-bal_type','name']
@@ -26,15 +36,44 @@ class AccountType(models.Model):
     def __str__(self):
         return f'{self.name}'
 
+def shard_total(account):
+    """A subquery of the total of the balance shards of the account expression, 0 if it has none"""
+    shards = BalanceShard.objects.filter(account=account).order_by().values('account').annotate(total=models.Sum('amount')).values('total')
+    return Coalesce(models.Subquery(shards),0.0)
+
+class AccountQuerySet(models.QuerySet):
+    def with_pending_balance(self):
+        """Annotates each account with its balance including deltas still in the posting queue or in balance shards"""
+        queued = BalanceDelta.objects.filter(account=models.OuterRef('pk')).order_by().values('account').annotate(total=models.Sum('amount')).values('total')
+        return self.annotate(pending_balance=models.F('balance')+Coalesce(models.Subquery(queued),0.0)+shard_total(models.OuterRef('pk')))
+
+    def with_current_balance(self):
+        """Annotates each account with current_balance, its balance including the balance shards"""
+        return self.annotate(current_balance=models.F('balance')+shard_total(models.OuterRef('pk')))
+
 class Account(models.Model):
     date_create = models.DateTimeField(auto_now_add=True)
     name = models.CharField(max_length=64, unique=True)
     acc_type = models.ForeignKey(AccountType,on_delete=models.CASCADE,verbose_name="account type")
     balance = models.FloatField(default=0,null=True)
+    currency = models.CharField(max_length=3,default=default_currency,help_text="ISO 4217 code of the currency the account is kept in")
+    # Also set by the update() calls that change balances, which bypass auto_now
+    updated_at = models.DateTimeField(auto_now=True,db_index=True)
+    balance_shards = models.PositiveSmallIntegerField(default=0,blank=True,
+        help_text="Spread the balance updates of this busy account over this many rows, folded into the balance by compact_balance_shards (0 to update the balance directly)")
+
+    objects = AccountQuerySet.as_manager()
 
     class Meta:
         ordering = ['name']
 
+    @cached_property
+    def pending_balance(self):
+        """The posted balance plus any deltas still waiting in the posting queue or in balance shards"""
+        queued = self.balancedelta_set.aggregate(total=models.Sum('amount'))['total']
+        sharded = self.balanceshard_set.aggregate(total=models.Sum('amount'))['total'] if self.balance_shards else None
+        return self.balance + (queued or 0) + (sharded or 0)
+
     def get_absolute_url(self):
         """Returns the url to access a detail record for this book."""
         return reverse('acc-detail',args=[str(self.id)])
@@ -43,13 +82,17 @@ class Account(models.Model):
         return f'{self.name}'
 
 class Transaction(models.Model):
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(auto_now_add=True,db_index=True)
     from_acc = models.ForeignKey(Account,on_delete=models.CASCADE, related_name = 'from_account', verbose_name = "from account")
     to_acc = models.ForeignKey(Account,on_delete=models.CASCADE, related_name = 'to_account', verbose_name = "to account")
     amount = models.FloatField()
+    currency = models.CharField(max_length=3,default=default_currency)
     note = models.TextField(max_length = 256, blank=True,null=True)
     updating = models.ForeignKey('Transaction',on_delete=models.SET_NULL,blank=True,null=True)
     edited = models.BooleanField(default=False)
+    pending = models.BooleanField(default=False, help_text="Balance changes are queued and not yet applied to the accounts")
+    idempotency_key = models.CharField(max_length=64,unique=True,blank=True,null=True,
+        help_text="Client-supplied key identifying the request that posted the transaction - retries with the same key return it instead of posting again")
 
     class Meta:
         ordering = ['date']
@@ -59,4 +102,189 @@ class Transaction(models.Model):
         return reverse('txn-detail',args=[str(self.id)])
 
     def __str__(self):
-        return f'TXN on {self.date} from {self.from_acc} to {self.to_acc} for {self.amount} AED'
+        return f'TXN on {self.date} from {self.from_acc} to {self.to_acc} for {self.amount} {self.currency}'
+
+class TransactionChange(models.Model):
+    """An entry of the transaction change log - its id is the change sequence number read by the changes API"""
+    CREATED, UPDATED, DELETED, ARCHIVED = 'created', 'updated', 'deleted', 'archived'
+    KIND_CHOICES = (
+        (CREATED,'Created'),
+        (UPDATED,'Updated'),
+        (DELETED,'Deleted'),
+        (ARCHIVED,'Archived'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    # Not a foreign key, so that the changes of deleted transactions stay in the log
+    transaction_id = models.IntegerField()
+    kind = models.CharField(choices=KIND_CHOICES,max_length=8)
+    at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.id}: transaction {self.transaction_id} {self.kind}'
+
+class OutboxEvent(models.Model):
+    """A ledger event written with the change it describes, for the relay_outbox command to deliver downstream"""
+    POSTED, EDITED, DELETED = 'transaction.posted', 'transaction.edited', 'transaction.deleted'
+    EVENT_CHOICES = (
+        (POSTED,'Transaction posted'),
+        (EDITED,'Transaction edited'),
+        (DELETED,'Transaction deleted'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    event = models.CharField(choices=EVENT_CHOICES,max_length=32)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(blank=True,null=True)
+
+    class Meta:
+        ordering = ['id']
+        # The relay only reads undelivered events, which this index keeps small as delivered ones pile up
+        indexes = [models.Index(fields=['id'],condition=models.Q(delivered_at=None),name='outbox_undelivered')]
+
+    def message(self):
+        return {'id': self.id, 'event': self.event, 'created_at': self.created_at, 'payload': self.payload}
+
+    def __str__(self):
+        return f'{self.id}: {self.event}'
+
+# Journal entries
+
+class JournalEntry(models.Model):
+    """A compound posting moving amounts between any number of accounts, as legs that sum to zero"""
+    date = models.DateTimeField(auto_now_add=True)
+    currency = models.CharField(max_length=3,default=default_currency)
+    note = models.TextField(max_length = 256, blank=True,null=True)
+
+    class Meta:
+        ordering = ['date']
+        verbose_name_plural = "journal entries"
+
+    def __str__(self):
+        return f'Journal entry on {self.date} in {self.currency}'
+
+class JournalLeg(models.Model):
+    """The change one journal entry makes to one account's balance"""
+    entry = models.ForeignKey(JournalEntry,on_delete=models.CASCADE,related_name='legs')
+    # Protected: the accounts' balances include the entry, which deleting the account would leave unbalanced
+    account = models.ForeignKey(Account,on_delete=models.PROTECT)
+    amount = models.FloatField(help_text="Added to the account's balance - negative for the accounts the amounts come from")
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.amount} to {self.account}'
+
+
+class BalanceDelta(models.Model):
+    """A queued change to an account balance, applied in batches by the apply_balance_deltas command"""
+    account = models.ForeignKey(Account,on_delete=models.CASCADE)
+    transaction = models.ForeignKey(Transaction,on_delete=models.SET_NULL,blank=True,null=True)
+    amount = models.FloatField()
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.amount} to {self.account}'
+
+class BalanceShard(models.Model):
+    """One of the rows that the balance updates of a sharded account are spread over"""
+    account = models.ForeignKey(Account,on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    amount = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account','shard'],name='unique_balance_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.account} shard {self.shard}: {self.amount}'
+
+# Closed periods
+
+class Period(models.Model):
+    """A closed accounting period, covering every transaction dated on or before its end"""
+    end = models.DateField(unique=True)
+    closed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-end']
+
+    def __str__(self):
+        return f'Period ending {self.end}'
+
+class OpeningBalance(models.Model):
+    """The balance of an account at the end of a closed period, i.e. its opening balance for the next one"""
+    period = models.ForeignKey(Period,on_delete=models.CASCADE)
+    account = models.ForeignKey(Account,on_delete=models.CASCADE)
+    balance = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period','account'],name='unique_opening_balance'),
+        ]
+
+    def __str__(self):
+        return f'{self.account} at {self.period.end}: {self.balance}'
+
+class ArchivedTransaction(models.Model):
+    """A transaction of a closed period, moved out of the Transaction table with its id and fields unchanged"""
+    id = models.IntegerField(primary_key=True)
+    date = models.DateTimeField(db_index=True)
+    from_acc = models.ForeignKey(Account,on_delete=models.CASCADE, related_name = 'archived_from_account', verbose_name = "from account")
+    to_acc = models.ForeignKey(Account,on_delete=models.CASCADE, related_name = 'archived_to_account', verbose_name = "to account")
+    amount = models.FloatField()
+    currency = models.CharField(max_length=3)
+    note = models.TextField(max_length = 256, blank=True,null=True)
+    updating = models.ForeignKey('ArchivedTransaction',on_delete=models.SET_NULL,blank=True,null=True)
+    edited = models.BooleanField(default=False)
+    pending = models.BooleanField(default=False)
+    # Kept so that a retry after the period is closed still finds the transaction its key posted
+    idempotency_key = models.CharField(max_length=64,unique=True,blank=True,null=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f'TXN on {self.date} from {self.from_acc} to {self.to_acc} for {self.amount} {self.currency}'
+
+class FxRate(models.Model):
+    """The price of one unit of the base currency in the quote currency on a date"""
+    base = models.CharField(max_length=3)
+    quote = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.FloatField()
+
+    class Meta:
+        ordering = ['base','quote','-date']
+        constraints = [
+            models.UniqueConstraint(fields=['base','quote','date'],name='unique_fx_rate'),
+        ]
+
+    def __str__(self):
+        return f'1 {self.base} = {self.rate} {self.quote} on {self.date}'
+
+# Report snapshots
+
+class ReportSnapshot(models.Model):
+    """A report rendered ahead of time, served by the snapshot views instead of computing it on each request"""
+    report = models.CharField(max_length=32)
+    key = models.CharField(max_length=64,help_text="Which instance of the report, e.g. the date it is reported on")
+    content = models.TextField()
+    computed_at = models.DateTimeField(help_text="When the computation started - the report shows the data as of then")
+    duration = models.FloatField(help_text="Seconds taken to compute the report")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['report','key'],name='unique_report_snapshot'),
+        ]
+
+    def __str__(self):
+        return f'{self.report} {self.key} computed at {self.computed_at}'
@@ -0,0 +1,86 @@
+import json
+import os
+import urllib.request
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from dbaccounting.models import OutboxEvent, Transaction
+
+# Outbox of ledger events for downstream systems.
+# The posting functions write an OutboxEvent in the same database transaction as the change it
+# describes, so an event exists exactly when its change was committed. relay() hands the
+# undelivered events in id order to a sink and marks them delivered in one update; a crash between
+# the two delivers the batch again, so consumers should ignore event ids they have already seen.
+
+TRANSACTION_FIELDS = ('id', 'date', 'from_acc', 'to_acc', 'amount', 'currency', 'note', 'updating', 'pending')
+
+def transaction_payload(txn):
+    return {field: getattr(txn, Transaction._meta.get_field(field).attname) for field in TRANSACTION_FIELDS}
+
+def record_events(event, payloads):
+    """Adds an event with each of payloads to the outbox, in the caller's transaction"""
+    OutboxEvent.objects.bulk_create([OutboxEvent(event=event, payload=payload) for payload in payloads])
+
+def record_transactions(event, txns):
+    record_events(event, [transaction_payload(txn) for txn in txns])
+
+# Sinks are callables taking a list of event messages, which raise if the events were not delivered
+
+class FileSink:
+    """Appends the events to a file as JSON lines"""
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, messages):
+        with open(self.path, 'a') as f:
+            for message in messages:
+                f.write(json.dumps(message, cls=DjangoJSONEncoder)+'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+class HttpSink:
+    """POSTs the events as a JSON array to url, and fails on any status other than 2xx"""
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, messages):
+        request = urllib.request.Request(self.url, data=json.dumps(messages, cls=DjangoJSONEncoder).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST')
+        # urlopen raises HTTPError for error statuses
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+class CallbackSink:
+    """Passes the events to a function in the relay's process"""
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, messages):
+        self.callback(messages)
+
+def sink_from_spec(spec):
+    """Returns the sink for file:<path>, an http(s):// URL or the dotted path of a callable"""
+    if spec.startswith('file:'):
+        return FileSink(spec[len('file:'):])
+    if spec.startswith(('http://', 'https://')):
+        return HttpSink(spec)
+    return CallbackSink(import_string(spec))
+
+def relay(sink, batch_size=500):
+    """Delivers up to batch_size undelivered events to sink, marks them delivered and returns their number"""
+    with transaction.atomic():
+        # Concurrent relays skip each other's batches where the database can lock rows
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=True).filter(delivered_at=None).order_by('pk')[:batch_size])
+        if not events:
+            return 0
+        sink([event.message() for event in events])
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(delivered_at=timezone.now())
+    return len(events)
+
+def purge_delivered(before):
+    """Deletes the events delivered before the given time and returns their number"""
+    return OutboxEvent.objects.filter(delivered_at__lt=before).delete()[0]
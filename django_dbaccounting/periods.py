@@ -0,0 +1,95 @@
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FloatField, Sum, Value
+from django.utils import timezone
+
+from dbaccounting.models import Account, ArchivedTransaction, BalanceDelta, JournalLeg, OpeningBalance, Period, Transaction, TransactionChange
+from dbaccounting.posting import compact_balance_shards, log_changes
+from dbaccounting.conditional import data_changed
+
+# Period close
+# Closing a period records every account's balance at its end and moves its transactions into
+# ArchivedTransaction, so that the Transaction table only holds the open period. Reports on a
+# closed period read the recorded balances instead of the transactions.
+
+class PeriodError(Exception):
+    """A period cannot be closed"""
+
+def period_boundary(end):
+    """Returns the first moment after the period ending on the date end"""
+    boundary = datetime.datetime.combine(end+datetime.timedelta(days=1), datetime.time.min)
+    return timezone.make_aware(boundary) if settings.USE_TZ else boundary
+
+def movements_since(boundary):
+    """Returns {account pk: net change to its balance} of the postings made at or after boundary"""
+    movements = defaultdict(float)
+    txns = Transaction.objects.filter(date__gte=boundary).order_by()
+
+    for acc_field, sign in (('to_acc', 1), ('from_acc', -1)):
+        for row in txns.values(acc_field).annotate(total=Sum('amount')):
+            movements[row[acc_field]] += sign*row['total']
+        # Posting an edit also reversed the transaction it replaced
+        for row in txns.filter(updating__isnull=False).values(f'updating__{acc_field}').annotate(total=Sum('updating__amount')):
+            movements[row[f'updating__{acc_field}']] -= sign*row['total']
+    for row in JournalLeg.objects.filter(entry__date__gte=boundary).order_by().values('account').annotate(total=Sum('amount')):
+        movements[row['account']] += row['total']
+    return movements
+
+def retained_ids(boundary):
+    """Returns the ids of transactions before boundary that stay in the table because a later edit replaced them"""
+    # Keeping the edited transactions lets movements_since reverse them when a later period is closed
+    keep = set(Transaction.objects.filter(date__gte=boundary, updating__isnull=False).values_list('updating', flat=True))
+    new = keep
+    while new:
+        new = set(Transaction.objects.filter(pk__in=new, updating__isnull=False).values_list('updating', flat=True))-keep
+        keep |= new
+    return keep
+
+def archive_transactions(ids):
+    """Copies the transactions with the given ids into the archive and deletes them"""
+    rows = Transaction.objects.filter(pk__in=ids).values('id', 'date', 'from_acc', 'to_acc', 'amount', 'currency', 'note', 'updating', 'edited', 'pending', 'idempotency_key')
+    ArchivedTransaction.objects.bulk_create([ArchivedTransaction(id=row['id'], date=row['date'], from_acc_id=row['from_acc'], to_acc_id=row['to_acc'],
+        amount=row['amount'], currency=row['currency'], note=row['note'], updating_id=row['updating'], edited=row['edited'],
+        pending=row['pending'], idempotency_key=row['idempotency_key']) for row in rows])
+    log_changes(TransactionChange.ARCHIVED, ids)
+    Transaction.objects.filter(pk__in=ids).delete()
+
+@transaction.atomic
+def close_period(end, batch_size=1000):
+    """Closes the period ending on the date end, returning the new Period"""
+    if end >= timezone.localdate():
+        raise PeriodError('Only periods that have already ended can be closed')
+    last = Period.objects.order_by('-end').first()
+    if last and end <= last.end:
+        raise PeriodError(f'The period ending {last.end} is already closed')
+    if BalanceDelta.objects.exists():
+        raise PeriodError('Apply the queued balance deltas before closing a period')
+
+    # The recorded balances are read from the balance field, so fold the balance shards into it first
+    compact_balance_shards()
+    boundary = period_boundary(end)
+    period = Period.objects.create(end=end)
+
+    movements = movements_since(boundary)
+    balances = Account.objects.filter(date_create__lt=boundary).values_list('pk', 'balance')
+    OpeningBalance.objects.bulk_create([OpeningBalance(period=period, account_id=pk, balance=balance-movements.get(pk, 0)) for pk, balance in balances], batch_size=batch_size)
+
+    # Newest first, so that an edit is always archived before the transaction it replaced
+    keep = retained_ids(boundary)
+    closed = Transaction.objects.filter(date__lt=boundary).exclude(pk__in=keep).order_by('-pk')
+    while True:
+        ids = list(closed.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        archive_transactions(ids)
+    data_changed()
+
+    return period
+
+def closing_balance_rows(period):
+    """The ledger.ACCOUNT_FIELDS rows of the accounts that existed at the end of period, with their balance then"""
+    return Account.objects.filter(openingbalance__period=period).values_list(
+        'pk', 'name', 'acc_type', 'openingbalance__balance', 'currency', Value(None, output_field=FloatField()))
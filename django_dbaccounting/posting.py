@@ -0,0 +1,292 @@
+import math
+import random
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from dbaccounting.conf import get_setting
+from dbaccounting.conditional import data_changed
+from dbaccounting.models import Account, ArchivedTransaction, BalanceDelta, BalanceShard, JournalEntry, JournalLeg, OutboxEvent, Transaction, TransactionChange
+from dbaccounting.outbox import record_transactions
+
+# Posting of transactions to account balances.
+# Every change to a balance goes through apply_deltas, which either updates the accounts
+# straight away or, with DBACCOUNTING_WRITE_BEHIND, queues the change as BalanceDelta rows.
+# Accounts with balance_shards spread their updates over that many BalanceShard rows instead,
+# so that concurrent postings to them do not all wait on the lock of one row.
+# Changes to transactions are recorded in the TransactionChange log with log_changes, and
+# updates of accounts set their updated_at, for the changes API. Postings, edits and deletes also
+# add events to the outbox (see outbox.py) for downstream systems.
+
+def validate_transaction(from_acc, to_acc, amount, balances=None):
+    """Raises ValidationError if the transaction has a negative amount or would overdraw/overfill an account
+
+    balances optionally maps account pks to the balances to check against instead of the accounts' own,
+    e.g. the running balances of a batch being posted.
+    """
+    if amount<0:
+        raise ValidationError(_('Invalid Amount - Must be greater than or equal to 0'))
+
+    if from_acc.currency != to_acc.currency:
+        raise ValidationError(_('Invalid Accounts - Both accounts must be in the same currency'))
+
+    if from_acc.acc_type.bal_type == 'D':
+        # Check if from_acc has sufficient balance
+        if available_balance(from_acc, balances) < amount:
+            raise ValidationError(_('Invalid From Account - Insufficient Funds'))
+
+    if to_acc.acc_type.bal_type == 'C':
+        # Check if to_acc has room for the amount
+        if available_balance(to_acc, balances) + amount > 0:
+            raise ValidationError(_('Invalid To Account - Excess Funds'))
+
+def available_balance(acc, balances=None):
+    """The balance of acc that postings are checked against - from balances ({account pk: balance}) if it is there"""
+    if balances is not None and acc.pk in balances:
+        return balances[acc.pk]
+    # With write-behind posting queued deltas, and with sharded accounts their shards, count towards the balance
+    return acc.pending_balance if get_setting('WRITE_BEHIND') or acc.balance_shards else acc.balance
+
+def transaction_deltas(from_acc, to_acc, amount, deltas=None):
+    """Adds the balance changes of moving amount from from_acc to to_acc to deltas ({account pk: change})"""
+    if deltas is None:
+        deltas = defaultdict(float)
+    deltas[from_acc.pk] -= amount
+    deltas[to_acc.pk] += amount
+    return deltas
+
+def apply_deltas(deltas, txn=None, accounts=()):
+    """Applies (or queues) the balance changes in deltas, keeping the given Account instances in step"""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    data_changed()
+
+    if get_setting('WRITE_BEHIND'):
+        BalanceDelta.objects.bulk_create([BalanceDelta(account_id=pk, transaction=txn, amount=delta) for pk, delta in deltas.items()])
+        return
+
+    shards = shard_counts(deltas, accounts)
+    for pk, delta in deltas.items():
+        if shards.get(pk):
+            add_to_shard(pk, random.randrange(shards[pk]), shards[pk], delta)
+        else:
+            Account.objects.filter(pk=pk).update(balance=F('balance')+delta, updated_at=timezone.now())
+    # The same account may be passed more than once, e.g. the from_acc of both an edit and its original
+    for acc in {id(acc): acc for acc in accounts}.values():
+        if acc.pk in deltas:
+            if shards.get(acc.pk):
+                # The balance field is only updated by compaction, so just forget the balance read with the shards
+                acc.__dict__.pop('pending_balance', None)
+            else:
+                acc.balance += deltas[acc.pk]
+
+def log_changes(kind, txn_ids):
+    """Records that the transactions with the given ids were created, updated, deleted or archived (a TransactionChange kind)"""
+    TransactionChange.objects.bulk_create([TransactionChange(transaction_id=pk, kind=kind) for pk in txn_ids])
+
+def shard_counts(deltas, accounts=()):
+    """Returns {account pk: balance_shards} of the accounts in deltas, read from the given instances where possible"""
+    counts = {acc.pk: acc.balance_shards for acc in accounts if acc.pk in deltas}
+    missing = [pk for pk in deltas if pk not in counts]
+    if missing:
+        counts.update(Account.objects.filter(pk__in=missing, balance_shards__gt=0).values_list('pk', 'balance_shards'))
+    return counts
+
+def add_to_shard(pk, shard, count, delta):
+    """Adds delta to one shard of the account pk, creating its count shards on first use"""
+    if BalanceShard.objects.filter(account_id=pk, shard=shard).update(amount=F('amount')+delta):
+        return
+    BalanceShard.objects.bulk_create([BalanceShard(account_id=pk, shard=i) for i in range(count)], ignore_conflicts=True)
+    BalanceShard.objects.filter(account_id=pk, shard=shard).update(amount=F('amount')+delta)
+
+@transaction.atomic
+def post_transaction(from_acc, to_acc, amount, note=None, idempotency_key=None):
+    """Records a new transaction and applies its effect on both account balances
+
+    If a transaction was already posted with idempotency_key, returns it instead without posting again -
+    as an ArchivedTransaction if its period has been closed since.
+    """
+    if idempotency_key is not None:
+        # The unique constraint below only covers the open period
+        archived = ArchivedTransaction.objects.filter(idempotency_key=idempotency_key).first()
+        if archived is not None:
+            return archived
+    txn = Transaction(from_acc=from_acc, to_acc=to_acc, amount=amount, currency=from_acc.currency, note=note, pending=get_setting('WRITE_BEHIND'), idempotency_key=idempotency_key)
+    if idempotency_key is None:
+        txn.save(force_insert=True)
+    else:
+        # Insert and let the unique constraint detect a repeat, rather than looking for it first
+        try:
+            with transaction.atomic():
+                txn.save(force_insert=True)
+        except IntegrityError:
+            existing = Transaction.objects.filter(idempotency_key=idempotency_key).first()
+            if existing is None:
+                raise
+            return existing
+    log_changes(TransactionChange.CREATED, [txn.pk])
+    record_transactions(OutboxEvent.POSTED, [txn])
+    apply_deltas(transaction_deltas(from_acc, to_acc, amount), txn, (from_acc, to_acc))
+    return txn
+
+def posted_transactions(keys):
+    """Returns {idempotency key: transaction} of the transactions already posted with any of keys, archived or not"""
+    keys = [key for key in keys if key is not None]
+    if not keys:
+        return {}
+    posted = ArchivedTransaction.objects.in_bulk(keys, field_name='idempotency_key')
+    posted.update(Transaction.objects.in_bulk(keys, field_name='idempotency_key'))
+    return posted
+
+@transaction.atomic
+def post_transactions(rows, keys=None):
+    """Records a batch of (from_acc, to_acc, amount, note) transactions with a single balance update per account
+
+    keys optionally gives the idempotency key of each row. The caller must leave out rows already
+    posted (see posted_transactions) - a repeated key raises IntegrityError and posts nothing.
+    """
+    pending = get_setting('WRITE_BEHIND')
+    keys = keys or [None]*len(rows)
+    txns = [Transaction(from_acc=from_acc, to_acc=to_acc, amount=amount, currency=from_acc.currency, note=note, pending=pending, idempotency_key=key)
+        for (from_acc, to_acc, amount, note), key in zip(rows, keys)]
+    if connections[router.db_for_write(Transaction)].features.can_return_rows_from_bulk_insert:
+        Transaction.objects.bulk_create(txns)
+    else:
+        # The change log, the outbox and queued deltas need the ids, which such backends cannot return from a bulk insert
+        for txn in txns:
+            txn.save(force_insert=True)
+    log_changes(TransactionChange.CREATED, [txn.pk for txn in txns])
+    record_transactions(OutboxEvent.POSTED, txns)
+
+    if pending:
+        data_changed()
+        # Queued deltas keep their transaction so that it is marked posted once they are applied
+        BalanceDelta.objects.bulk_create([BalanceDelta(account_id=pk, transaction=txn, amount=delta)
+            for txn in txns for pk, delta in transaction_deltas(txn.from_acc, txn.to_acc, txn.amount).items() if delta])
+        return txns
+
+    deltas = None
+    for txn in txns:
+        deltas = transaction_deltas(txn.from_acc, txn.to_acc, txn.amount, deltas)
+    apply_deltas(deltas or {})
+    return txns
+
+def validate_journal_entry(legs):
+    """Raises ValidationError unless the (account, amount) legs balance and leave every account within its limits"""
+    if len(legs) < 2:
+        raise ValidationError(_('Invalid Journal Entry - At least two legs are needed'))
+    if len({acc.currency for acc, amount in legs}) > 1:
+        raise ValidationError(_('Invalid Journal Entry - All accounts must be in the same currency'))
+    # NaN is neither positive nor negative, so it would slip past the balance check below
+    if not all(math.isfinite(amount) for acc, amount in legs):
+        raise ValidationError(_('Invalid Journal Entry - Amounts must be finite numbers'))
+    debits = math.fsum(amount for acc, amount in legs if amount > 0)
+    credits = math.fsum(-amount for acc, amount in legs if amount < 0)
+    if not debits or not math.isclose(debits, credits):
+        raise ValidationError(_('Invalid Journal Entry - The legs must sum to zero'))
+
+    # Each account is checked once, against the net change of all its legs
+    accounts, deltas = {}, defaultdict(float)
+    for acc, amount in legs:
+        accounts[acc.pk] = acc
+        deltas[acc.pk] += amount
+    for pk, delta in deltas.items():
+        acc = accounts[pk]
+        if acc.acc_type.bal_type == 'D' and delta < 0 and available_balance(acc) + delta < 0:
+            raise ValidationError(_('Invalid Journal Entry - Insufficient Funds in %(account)s'), params={'account': acc})
+        if acc.acc_type.bal_type == 'C' and delta > 0 and available_balance(acc) + delta > 0:
+            raise ValidationError(_('Invalid Journal Entry - Excess Funds in %(account)s'), params={'account': acc})
+
+@transaction.atomic
+def post_journal_entry(legs, note=None):
+    """Records a journal entry of (account, amount) legs with one insert for the legs and one balance update per account"""
+    entry = JournalEntry.objects.create(currency=legs[0][0].currency, note=note)
+    JournalLeg.objects.bulk_create([JournalLeg(entry=entry, account=acc, amount=amount) for acc, amount in legs])
+
+    deltas = defaultdict(float)
+    for acc, amount in legs:
+        deltas[acc.pk] += amount
+    apply_deltas(deltas, accounts=[acc for acc, amount in legs])
+    return entry
+
+@transaction.atomic
+def edit_transaction(orig_txn, from_acc, to_acc, amount, note=None):
+    """Replaces orig_txn with a new transaction, reversing the original's effect on the balances"""
+    deltas = transaction_deltas(orig_txn.to_acc, orig_txn.from_acc, orig_txn.amount)
+    transaction_deltas(from_acc, to_acc, amount, deltas)
+
+    orig_txn.edited = True
+    orig_txn.save(update_fields=['edited'])
+
+    txn = Transaction.objects.create(from_acc=from_acc, to_acc=to_acc, amount=amount, currency=from_acc.currency, note=note, updating=orig_txn, pending=get_setting('WRITE_BEHIND'))
+    log_changes(TransactionChange.UPDATED, [orig_txn.pk])
+    log_changes(TransactionChange.CREATED, [txn.pk])
+    record_transactions(OutboxEvent.EDITED, [txn])
+    apply_deltas(deltas, txn, (from_acc, to_acc, orig_txn.from_acc, orig_txn.to_acc))
+    return txn
+
+@transaction.atomic
+def delete_transaction(txn):
+    """Deletes txn, reversing its effect on the balances and restoring the transaction it replaced"""
+    deltas = transaction_deltas(txn.to_acc, txn.from_acc, txn.amount)
+
+    if txn.updating:
+        prev = txn.updating
+        prev.edited = False
+        prev.save(update_fields=['edited'])
+        transaction_deltas(prev.from_acc, prev.to_acc, prev.amount, deltas)
+        log_changes(TransactionChange.UPDATED, [prev.pk])
+
+    apply_deltas(deltas)
+    log_changes(TransactionChange.DELETED, [txn.pk])
+    record_transactions(OutboxEvent.DELETED, [txn])
+    txn.delete()
+
+# Write-behind queue
+
+def apply_queued_deltas(batch_size=500):
+    """Applies up to batch_size queued deltas with one UPDATE per account and returns the number applied"""
+    with transaction.atomic():
+        # Concurrent workers skip each other's batches where the database can lock rows, so no delta is applied twice
+        ids = list(BalanceDelta.objects.select_for_update(skip_locked=True).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        batch = BalanceDelta.objects.filter(pk__in=ids)
+
+        totals = batch.order_by().values('account').annotate(total=Sum('amount'))
+        for row in totals:
+            Account.objects.filter(pk=row['account']).update(balance=F('balance')+row['total'], updated_at=timezone.now())
+
+        txn_ids = set(batch.exclude(transaction=None).values_list('transaction', flat=True))
+        batch.delete()
+
+        # A transaction is posted once none of its deltas remain in the queue
+        posted = list(Transaction.objects.filter(pk__in=txn_ids, pending=True).exclude(balancedelta__isnull=False).values_list('pk', flat=True))
+        Transaction.objects.filter(pk__in=posted).update(pending=False)
+        log_changes(TransactionChange.UPDATED, posted)
+        data_changed()
+
+    return len(ids)
+
+# Balance shards
+
+def compact_balance_shards(accounts=None):
+    """Folds the balance shards of accounts (default: all) into their balance and returns the number of accounts compacted"""
+    shards = BalanceShard.objects.exclude(amount=0)
+    if accounts is not None:
+        shards = shards.filter(account__in=accounts)
+
+    with transaction.atomic():
+        totals = defaultdict(float)
+        for pk, account, amount in shards.values_list('pk', 'account', 'amount'):
+            # Subtracting the amount read, rather than zeroing the shard, keeps postings made since
+            BalanceShard.objects.filter(pk=pk).update(amount=F('amount')-amount)
+            totals[account] += amount
+        for account, total in totals.items():
+            Account.objects.filter(pk=account).update(balance=F('balance')+total, updated_at=timezone.now())
+        if totals:
+            data_changed()
+    return len(totals)
@@ -0,0 +1,110 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db import connections
+
+from dbaccounting.conf import get_setting
+
+# Read replica routing
+# Add 'dbaccounting.routers.ReplicaRouter' to DATABASE_ROUTERS and set DBACCOUNTING_REPLICA to the
+# replica's alias. Reads made by the read-only views (ReplicaReadMixin, replica_reads_view) then go
+# to the replica, unless the session wrote through the app in the last DBACCOUNTING_STICKY_SECONDS,
+# in which case they stay on the primary so that users see their own writes.
+
+STICKY_SESSION_KEY = 'dbaccounting_primary_until'
+
+_use_replica = ContextVar('dbaccounting_use_replica', default=False)
+
+def replica_alias():
+    """Returns the configured replica alias, or None if there is none"""
+    alias = get_setting('REPLICA')
+    return alias if alias and alias in connections.settings else None
+
+class ReplicaRouter:
+    """Routes this app's reads made inside replica_reads() to the DBACCOUNTING_REPLICA database"""
+    def db_for_read(self, model, **hints):
+        # Other apps' models, e.g. users and sessions, are left to the project's own routing
+        if _use_replica.get() and model._meta.app_label == 'dbaccounting':
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        dbs = {'default', replica_alias()}
+        if obj1._state.db in dbs and obj2._state.db in dbs:
+            return True
+        return None
+
+def stick_to_primary(request):
+    """Keeps the session's reads on the primary for the next DBACCOUNTING_STICKY_SECONDS"""
+    request.session[STICKY_SESSION_KEY] = time.time()+get_setting('STICKY_SECONDS')
+
+def is_sticky(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+@contextmanager
+def replica_reads(request=None):
+    """Sends the reads made inside the block to the replica, unless request's session recently wrote"""
+    token = _use_replica.set(not (request is not None and is_sticky(request)))
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+def replica_reads_view(view):
+    """Decorator for read-only function views (sync or async), see replica_reads()"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            # The session is loaded synchronously, so check stickiness before entering the event loop's context
+            sticky = await sync_to_async(is_sticky)(request)
+            token = _use_replica.set(not sticky)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+def replica_reads_iter(iterable, request=None):
+    """Yields the items of iterable with the reads of each step sent to the replica, see replica_reads()
+
+    For the content of streaming responses, which is read after the view has returned.
+    """
+    iterator = iter(iterable)
+    while True:
+        with replica_reads(request):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+class ReplicaReadMixin:
+    """Class-based view mixin sending the view's reads, including its template rendering, to the replica"""
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request):
+            response = super().dispatch(request, *args, **kwargs)
+            # Template responses render lazily - render now so their queries are routed too
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+class PrimaryAfterWriteMixin:
+    """Model form view mixin keeping the session on the primary after a successful write"""
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        stick_to_primary(self.request)
+        return response
@@ -0,0 +1,146 @@
+import html
+import re
+
+from django.db import OperationalError, connections, transaction
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from dbaccounting.models import Account, Transaction
+
+# Full-text search over transaction notes and account names.
+# On SQLite each searched column gets an FTS5 index; on PostgreSQL a GIN index over its tsvector.
+# Other databases fall back to a LIKE scan of the column.
+# SQLite locks the whole database for a write, so an FTS5 update inside every posting made
+# concurrent postings fail with "database is locked". Triggers there only queue the ids of the
+# changed rows in a plain table, and search() applies the queue to the index before it queries.
+# The indexes and triggers are created by install_search after every migrate, since SQLite drops
+# a table's triggers whenever a migration rebuilds the table.
+
+# The searched column of each model, and its index
+SEARCHED = {Transaction: 'note', Account: 'name'}
+
+# Marks around the matched terms in highlights, replaced with <mark> once the text is escaped
+START, STOP = '\x02', '\x03'
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+def queue_table(model):
+    return f'{model._meta.db_table}_fts_queue'
+
+def sqlite_statements(model, column):
+    table, queue = model._meta.db_table, queue_table(model)
+    triggers = {
+        f'{queue}_insert': f'AFTER INSERT ON {table} BEGIN INSERT INTO {queue}(id) VALUES (new.id); END',
+        f'{queue}_delete': f'AFTER DELETE ON {table} BEGIN INSERT INTO {queue}(id) VALUES (old.id); END',
+        f'{queue}_update': f'AFTER UPDATE OF {column} ON {table} BEGIN INSERT INTO {queue}(id) VALUES (new.id); END',
+    }
+    # The index keeps its own copy of the text, so that a row can be removed from it after the row is gone
+    return [f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table(model)} USING fts5({column})',
+        f'CREATE TABLE IF NOT EXISTS {queue} (id integer NOT NULL)'], triggers
+
+def reindex(cursor, model, column):
+    fts = fts_table(model)
+    cursor.execute(f'DELETE FROM {queue_table(model)}')
+    cursor.execute(f'DELETE FROM {fts}')
+    cursor.execute(f'INSERT INTO {fts}(rowid, {column}) SELECT id, {column} FROM {model._meta.db_table}')
+
+def refresh_index(connection, model, column):
+    """Applies the queued changes of model's rows to its SQLite index - skipped while another connection is writing"""
+    fts, queue = fts_table(model), queue_table(model)
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'SELECT MAX(rowid) FROM {queue}')
+            last = cursor.fetchone()[0]
+            if last is None:
+                return
+            changed = f'SELECT id FROM {queue} WHERE rowid <= %s'
+            cursor.execute(f'DELETE FROM {fts} WHERE rowid IN ({changed})', [last])
+            cursor.execute(f'INSERT INTO {fts}(rowid, {column}) SELECT id, {column} FROM {model._meta.db_table} WHERE id IN ({changed})', [last])
+            cursor.execute(f'DELETE FROM {queue} WHERE rowid <= %s', [last])
+    except OperationalError:
+        # The queue is kept, so the next search applies it - until then this one may miss the latest changes
+        pass
+
+def postgresql_vector(column):
+    return f"to_tsvector('simple', COALESCE({column}, ''))"
+
+def install_search(using='default'):
+    """Creates the search indexes of the database using, and reindexes any whose triggers were missing"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model, column in SEARCHED.items():
+            if connection.vendor == 'sqlite':
+                creates, triggers = sqlite_statements(model, column)
+                # Indexes of earlier versions read their text from the table and were updated by triggers of their own
+                cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [fts_table(model)])
+                row = cursor.fetchone()
+                if row and 'content=' in row[0]:
+                    cursor.execute(f'DROP TABLE {fts_table(model)}')
+                for name in ('insert', 'delete', 'update'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts_table(model)}_{name}')
+                for create in creates:
+                    cursor.execute(create)
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f'{queue_table(model)}_%'])
+                existing = {row[0] for row in cursor.fetchall()}
+                if set(triggers)-existing:
+                    for name, body in triggers.items():
+                        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+                        cursor.execute(f'CREATE TRIGGER {name} {body}')
+                    # Changes made while the triggers were missing are only picked up by a reindex
+                    reindex(cursor, model, column)
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {model._meta.db_table}_{column}_search ON {model._meta.db_table} USING gin ({postgresql_vector(column)})')
+
+@receiver(post_migrate)
+def migrated(sender, using='default', **kwargs):
+    if sender.name == 'dbaccounting':
+        install_search(using)
+
+def fts_query(terms):
+    """An FTS5 query matching all the words of terms, the last one as a prefix as it may be still being typed"""
+    words = re.findall(r'\w+', terms)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words[:-1])+f' "{words[-1]}"*'
+
+def highlighted(text):
+    """Escapes text for HTML, with the marked terms in <mark>"""
+    return html.escape(text or '').replace(START, '<mark>').replace(STOP, '</mark>')
+
+def search(model, terms, limit=20, offset=0, queryset=None):
+    """Returns the instances of model, read from queryset, matching terms, best match first, each with a highlight of its searched column"""
+    column = SEARCHED[model]
+    if queryset is None:
+        queryset = model.objects.all()
+    connection = connections[queryset.db]
+    table = model._meta.db_table
+
+    if connection.vendor == 'sqlite':
+        query = fts_query(terms)
+        if query is None:
+            return []
+        refresh_index(connection, model, column)
+        sql = (f"SELECT rowid, highlight({fts_table(model)}, 0, %s, %s) FROM {fts_table(model)} "
+            f"WHERE {fts_table(model)} MATCH %s ORDER BY rank LIMIT %s OFFSET %s")
+        params = [START, STOP, query, limit, offset]
+    elif connection.vendor == 'postgresql':
+        sql = (f"SELECT id, ts_headline('simple', COALESCE({column}, ''), query, %s) FROM {table}, plainto_tsquery('simple', %s) query "
+            f"WHERE {postgresql_vector(column)} @@ query ORDER BY ts_rank({postgresql_vector(column)}, query) DESC, id LIMIT %s OFFSET %s")
+        params = [f'StartSel={START}, StopSel={STOP}, HighlightAll=true', terms, limit, offset]
+    else:
+        rows = queryset.filter(**{f'{column}__icontains': terms}).order_by('-pk')[offset:offset+limit]
+        for obj in rows:
+            obj.highlight = highlighted(getattr(obj, column))
+        return list(rows)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        hits = cursor.fetchall()
+    objs = queryset.in_bulk([pk for pk, highlight in hits])
+    results = []
+    for pk, highlight in hits:
+        if pk in objs:
+            objs[pk].highlight = highlighted(highlight)
+            results.append(objs[pk])
+    return results
@@ -0,0 +1,90 @@
+import datetime
+import time
+
+from django.core.cache import caches
+from django.db import router
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from dbaccounting.conf import get_setting
+from dbaccounting.models import ReportSnapshot
+
+# Precomputed reports.
+# The snapshot_reports command (run from cron) renders the configured reports into ReportSnapshot
+# rows, and the snapshot views serve the latest one. A report without a snapshot, or one asked to be
+# recomputed, is computed by a single request at a time: the others wait on a lock in the
+# DBACCOUNTING_SNAPSHOT_CACHE cache and are served the snapshot it stores, so a team opening the
+# same report at once computes it once.
+
+class Report:
+    """A report that can be snapshotted
+
+    content is the dotted path of a function rendering it for a key, and check the dotted path of
+    one raising ValueError or ObjectDoesNotExist for a key it may not be computed for.
+    """
+    def __init__(self, name, title, content, check, perms):
+        self.name, self.title, self.content, self.check, self.perms = name, title, content, check, perms
+
+    def default_key(self):
+        """The report on today, which the snapshot_reports command computes"""
+        return str(datetime.date.today())
+
+    def check_key(self, key):
+        import_string(self.check)(key)
+
+    def render(self, key):
+        return import_string(self.content)(key)
+
+REPORTS = {report.name: report for report in (
+    Report('balance-sheet', 'Balance Sheet', 'dbaccounting.views.balance_sheet_content', 'dbaccounting.views.balance_sheet_period',
+        ('dbaccounting.view_account', 'dbaccounting.view_accounttype')),
+)}
+
+def snapshots():
+    # Read from the primary, where the snapshots are written, even in the views reading from a replica
+    return ReportSnapshot.objects.using(router.db_for_write(ReportSnapshot))
+
+def latest_snapshot(name, key, since=None):
+    """Returns the snapshot of the report, or None if there is none computed from since on"""
+    queryset = snapshots().filter(report=name, key=key)
+    if since is not None:
+        queryset = queryset.filter(computed_at__gte=since)
+    return queryset.first()
+
+def take_snapshot(name, key):
+    """Computes the report and stores it as its latest snapshot"""
+    started, start = timezone.now(), time.monotonic()
+    content = REPORTS[name].render(key)
+    snapshot, created = snapshots().update_or_create(report=name, key=key,
+        defaults={'content': content, 'computed_at': started, 'duration': time.monotonic()-start})
+    return snapshot
+
+def get_snapshot(name, key, recompute=False):
+    """Returns the latest snapshot of the report, computing it first if there is none or recompute is set
+
+    Only one caller computes a given report at a time. The others wait for its snapshot, and compute
+    it themselves if none arrives before DBACCOUNTING_SNAPSHOT_LOCK_SECONDS.
+    """
+    # A recompute is satisfied by a snapshot started after it was asked for
+    since = timezone.now() if recompute else None
+    snapshot = latest_snapshot(name, key, since)
+    if snapshot is not None:
+        return snapshot
+
+    cache = caches[get_setting('SNAPSHOT_CACHE')]
+    lock = f'dbaccounting:snapshot_lock:{name}:{key}'
+    timeout = get_setting('SNAPSHOT_LOCK_SECONDS')
+    deadline = time.monotonic()+timeout
+    while True:
+        if cache.add(lock, True, timeout):
+            try:
+                # The previous holder may have stored the snapshot while this caller waited
+                return latest_snapshot(name, key, since) or take_snapshot(name, key)
+            finally:
+                cache.delete(lock)
+        time.sleep(0.1)
+        snapshot = latest_snapshot(name, key, since)
+        if snapshot is not None:
+            return snapshot
+        if time.monotonic() > deadline:
+            return take_snapshot(name, key)
@@ -0,0 +1,107 @@
+import csv
+
+from django.db.models import Case, Value, When
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from dbaccounting.conf import get_setting
+from dbaccounting.fx import consolidated_totals, convert, with_reporting_balance
+from dbaccounting.models import Account
+
+# Streaming report rendering.
+# The streamed reports are generators of rows, sent by StreamingHttpResponse as they are produced.
+# The balance sheet walks the cached type tree depth first. It reads the type totals with one
+# aggregate query up front, since each type's header comes before its accounts, and then reads the
+# accounts a window of types at a time with iterator(). Its first byte therefore doesn't wait for
+# all the accounts, and only one chunk of them is in memory at a time.
+
+# Types whose accounts are read per query, which bounds the size of the ordering CASE
+TYPES_PER_QUERY = 100
+
+# Where the streamed rows go in a page rendered around them
+ROWS_MARKER = mark_safe('<!-- dbaccounting:rows -->')
+
+def rolled_up_totals(tree, date):
+    """Returns {type id: total of its accounts and all the types below it}, raising MissingRate if a rate is missing"""
+    own = consolidated_totals(date=date)
+    totals = {}
+    # Children come after their parents in a depth-first order, so walk it backwards
+    for node, depth in reversed(list(tree.depth_first())):
+        totals[node.id] = own.get(node.id, 0)+sum(totals[child.id] for child in node.children)
+    return totals
+
+def balance_sheet_rows(tree, totals, date, chunk_size=2000):
+    """Yields ('type', type, depth, total) and ('account', values, depth) rows of the balance sheet on date
+
+    The values of an account are its (pk, name, balance, currency, reporting_balance).
+    """
+    nodes = list(tree.depth_first())
+    for start in range(0, len(nodes), TYPES_PER_QUERY):
+        window = nodes[start:start+TYPES_PER_QUERY]
+        position = Case(*(When(acc_type=node.id, then=Value(i)) for i, (node, depth) in enumerate(window)))
+        accs = (with_reporting_balance(Account.objects.filter(acc_type__in=[node.id for node, depth in window]), date=date)
+            .order_by(position, 'name').values_list('acc_type', 'pk', 'name', 'balance', 'currency', 'reporting_balance')
+            .iterator(chunk_size=chunk_size))
+
+        acc = next(accs, None)
+        for node, depth in window:
+            yield ('type', node, depth, totals[node.id])
+            while acc is not None and acc[0] == node.id:
+                pk, name, balance, currency, reporting = acc[1:]
+                if reporting is None:
+                    reporting = convert(balance, currency, date=date)
+                yield ('account', (pk, name, balance, currency, reporting), depth)
+                acc = next(accs, None)
+
+def html_rows(rows, currency):
+    """Renders balance sheet rows as the table rows of ledger_rows.html"""
+    for row in rows:
+        if row[0] == 'type':
+            kind, node, depth, total = row
+            yield format_html('<tr><th style="padding-left:{}px"><a href="{}">{}</a></th><th>{}</th></tr>\n',
+                depth*30+15, reverse('acctype-detail', args=[node.id]), node.name, total)
+        else:
+            kind, (pk, name, balance, acc_currency, reporting), depth = row
+            converted = format_html('{} {} = ', balance, acc_currency) if acc_currency != currency else ''
+            yield format_html('<tr><td style="padding-left:{}px"><a href="{}">{}</a></td><td>{}{}</td></tr>\n',
+                depth*30+45, reverse('acc-detail', args=[pk]), name, converted, reporting)
+
+class Echo:
+    """A file-like object csv.writer writes to that returns each line instead of storing it"""
+    def write(self, value):
+        return value
+
+def csv_rows(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+def balance_sheet_csv(rows):
+    """Flattens balance sheet rows to (kind, id, name, depth, balance, currency, reporting balance) CSV lines"""
+    currency = get_setting('CURRENCY')
+    def flat():
+        for row in rows:
+            if row[0] == 'type':
+                kind, node, depth, total = row
+                yield ('type', node.id, node.name, depth, '', '', total)
+            else:
+                kind, (pk, name, balance, acc_currency, reporting), depth = row
+                yield ('account', pk, name, depth, balance, acc_currency, reporting)
+    return csv_rows(('kind', 'id', 'name', 'depth', 'balance', 'currency', f'balance_{currency}'), flat())
+
+TRANSACTION_COLUMNS = ('id', 'date', 'from_acc', 'from_acc__name', 'to_acc', 'to_acc__name', 'amount', 'currency', 'note', 'updating', 'edited')
+
+def transactions_csv(queryset, chunk_size=2000):
+    """Streams the transactions of queryset as CSV lines, reading chunk_size rows at a time"""
+    rows = queryset.order_by('date', 'pk').values_list(*TRANSACTION_COLUMNS).iterator(chunk_size=chunk_size)
+    return csv_rows([column.replace('__', '_') for column in TRANSACTION_COLUMNS], rows)
+
+def page_around(request, template, context, rows):
+    """Renders template, which shows ROWS_MARKER as {{rows}}, and yields it with the rows streamed in place of the marker"""
+    head, tail = render_to_string(template, dict(context, rows=ROWS_MARKER), request).split(ROWS_MARKER, 1)
+    yield head
+    yield from rows
+    yield tail
@@ -0,0 +1,61 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib import admin
+from django.contrib.auth.models import User
+
+from dbaccounting.admin import EstimatedCountPaginator
+from dbaccounting.models import AccountType,Account,Transaction,ArchivedTransaction
+from dbaccounting.posting import post_transaction
+
+# Create your tests here.
+
+class TransactionAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser(username='testuser2', password='2HJ1vRV0Z&3iD')
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        cls.bank = Account.objects.create(name="Bank",acc_type=assets)
+
+    def setUp(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+    def test_changelist_queries_independent_of_rows(self):
+        post_transaction(self.cash,self.bank,10)
+        with self.assertNumQueries(7):
+            self.client.get(reverse('admin:dbaccounting_transaction_changelist'))
+        for i in range(5):
+            post_transaction(self.cash,self.bank,10)
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('admin:dbaccounting_transaction_changelist'))
+        self.assertIsInstance(response.context['cl'].paginator,EstimatedCountPaginator)
+        self.assertEqual(response.context['cl'].result_count,6)
+
+    def test_account_changelists(self):
+        for name in ('account','accounttype'):
+            response = self.client.get(reverse(f'admin:dbaccounting_{name}_changelist'))
+            self.assertEqual(response.status_code,200)
+        response = self.client.get(reverse('admin:autocomplete'),{'app_label':'dbaccounting','model_name':'transaction','field_name':'from_acc','term':'Ca'})
+        self.assertEqual([row['text'] for row in response.json()['results']],['Cash'])
+
+    def test_archive_is_read_only(self):
+        response = self.client.get(reverse('admin:dbaccounting_archivedtransaction_changelist'))
+        model_admin = admin.site._registry[ArchivedTransaction]
+        self.assertFalse(model_admin.has_delete_permission(response.wsgi_request))
+        self.assertFalse(model_admin.has_change_permission(response.wsgi_request))
+
+    def test_reverse_action(self):
+        txns = [post_transaction(self.cash,self.bank,amount) for amount in (10,20)]
+        data = {'action':'reverse_transactions','_selected_action':[txn.pk for txn in txns]}
+        url = reverse('admin:dbaccounting_transaction_changelist')
+        self.client.post(url,data)
+        # Reversing again posts nothing
+        self.client.post(url,data)
+        self.assertEqual(Transaction.objects.count(),4)
+        self.assertEqual(dict(Account.objects.values_list('name','balance')),{'Cash':100,'Bank':0})
+
+    def test_reverse_action_checks_balances(self):
+        txn = post_transaction(self.cash,self.bank,10)
+        post_transaction(self.bank,self.cash,10)
+        self.client.post(reverse('admin:dbaccounting_transaction_changelist'),{'action':'reverse_transactions','_selected_action':[txn.pk]})
+        self.assertEqual(Transaction.objects.count(),2)
@@ -0,0 +1,63 @@
+import datetime
+from unittest import skipUnless
+
+from django.test import TestCase
+from django.utils import timezone
+
+from dbaccounting.models import AccountType,Account,Transaction
+from dbaccounting.posting import post_transaction, edit_transaction, post_journal_entry
+from dbaccounting.analytics import pd, accounts_frame, transactions_frame, balances_as_of, activity, type_rollup
+
+# Create your tests here.
+
+def at(month,day):
+    return timezone.make_aware(datetime.datetime(2024,month,day,12))
+
+@skipUnless(pd,'pandas is not installed')
+class AnalyticsTest(TestCase):
+    def setUp(self):
+        self.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.current = AccountType.objects.create(name="Current",bal_type="D",parent=self.assets)
+        self.cash = Account.objects.create(name="Cash",acc_type=self.current,balance=100)
+        self.bank = Account.objects.create(name="Bank",acc_type=self.current)
+        self.safe = Account.objects.create(name="Safe",acc_type=self.assets)
+
+        self.dated(post_transaction(self.cash,self.bank,10),1,10)
+        txn = self.dated(post_transaction(self.cash,self.safe,20),2,10)
+        self.dated(edit_transaction(txn,self.cash,self.safe,25),3,10)
+
+    def dated(self,txn,month,day):
+        Transaction.objects.filter(pk=txn.pk).update(date=at(month,day))
+        return txn
+
+    def test_frames_are_compact(self):
+        accs = accounts_frame()
+        self.assertEqual(str(accs['name'].dtype),'category')
+        self.assertEqual(accs['acc_type'].dtype.itemsize,1)
+        self.assertEqual(accs.loc[self.cash.pk,'balance'],65)
+        txns = transactions_frame()
+        self.assertEqual(len(txns),3)
+        self.assertEqual(list(txns['to_acc_name']),['Bank','Safe','Safe'])
+
+    def test_balances_as_of(self):
+        days = [datetime.date(2023,12,31),datetime.date(2024,1,31),datetime.date(2024,2,29),datetime.date(2024,3,31)]
+        balances = balances_as_of(days)
+        self.assertEqual(list(balances.loc[self.cash.pk]),[100,90,70,65])
+        self.assertEqual(list(balances.loc[self.safe.pk]),[0,0,20,25])
+        self.assertEqual(list(balances.loc[self.bank.pk]),[0,10,10,10])
+
+    def test_balances_include_journal_entries(self):
+        post_journal_entry([(self.cash,-5),(self.bank,5)])
+        today = timezone.localdate()
+        balances = balances_as_of([datetime.date(2024,3,31),today])
+        self.assertEqual(list(balances.loc[self.bank.pk]),[10,15])
+
+    def test_activity(self):
+        table = activity()
+        self.assertEqual(list(table[self.cash.pk]),[-10,-20,-5])
+        self.assertEqual(list(table[self.safe.pk]),[0,20,5])
+
+    def test_type_rollup(self):
+        rolled = type_rollup(accounts_frame()['balance'])
+        self.assertEqual(rolled.loc[self.current.pk],75)
+        self.assertEqual(rolled.loc[self.assets.pk],100)
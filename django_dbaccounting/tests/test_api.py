@@ -0,0 +1,167 @@
+import json
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,Transaction,BalanceDelta
+from dbaccounting.posting import post_transaction
+
+# Create your tests here.
+
+class ApiListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('Can view account type','Can view account','Can view transaction'):
+            test_user2.user_permissions.add(Permission.objects.get(name=name))
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.acc1 = Account.objects.create(name="Cash",acc_type=assets)
+        cls.acc2 = Account.objects.create(name="Bank",acc_type=assets)
+        cls.acc3 = Account.objects.create(name="Safe",acc_type=assets)
+        for txn_id in range(25):
+            Transaction.objects.create(from_acc=cls.acc1,to_acc=cls.acc2,amount=txn_id)
+        Transaction.objects.create(from_acc=cls.acc3,to_acc=cls.acc2,amount=100)
+
+    def test_requires_login(self):
+        response = self.client.get(reverse('api-txn'))
+        self.assertEqual(response.status_code,401)
+
+    def test_requires_permission(self):
+        login = self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('api-acc'))
+        self.assertEqual(response.status_code,403)
+
+    def test_cursor_pagination(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('api-txn'),{'limit':10})
+        data = response.json()
+        self.assertEqual(len(data['results']),10)
+
+        seen = []
+        url = reverse('api-txn')+'?limit=10'
+        while url:
+            data = self.client.get(url).json()
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen,list(Transaction.objects.order_by('pk').values_list('pk',flat=True)))
+
+    def test_sparse_fields(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('api-acc'),{'fields':'name,balance'})
+        self.assertEqual(response.json()['results'][0],{'name':'Cash','balance':0})
+
+        response = self.client.get(reverse('api-acctype'),{'fields':'name,password'})
+        self.assertEqual(response.status_code,400)
+
+    def test_filter_by_account(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('api-txn'),{'account':self.acc3.pk,'fields':'amount'})
+        self.assertEqual(response.json()['results'],[{'amount':100}])
+
+class ApiBulkTransactionTest(TestCase):
+    def setUp(self):
+        test_user = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user.user_permissions.add(Permission.objects.get(name='Can add transaction'))
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        liabilities = AccountType.objects.create(name="Liabilities",bal_type="C")
+        self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        self.bank = Account.objects.create(name="Bank",acc_type=assets)
+        self.loan = Account.objects.create(name="Loan",acc_type=liabilities)
+
+    def post(self,items):
+        return self.client.post(reverse('api-txn-bulk'),json.dumps(items),content_type='application/json')
+
+    def test_bulk_post(self):
+        response = self.post([
+            {'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':60,'note':'Deposit'},
+            {'from_acc':self.loan.pk,'to_acc':self.cash.pk,'amount':40},
+        ])
+        self.assertEqual(response.status_code,201)
+        self.assertEqual(len(response.json()['results']),2)
+        self.assertEqual(Transaction.objects.count(),2)
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).balance,80)
+        self.assertEqual(Account.objects.get(pk=self.bank.pk).balance,60)
+        self.assertEqual(Account.objects.get(pk=self.loan.pk).balance,-40)
+
+    def test_batch_is_checked_against_running_balances(self):
+        # Each transaction alone fits in Cash's balance, but not both of them
+        response = self.post([
+            {'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':60},
+            {'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':60},
+        ])
+        self.assertEqual(response.status_code,400)
+        self.assertEqual(list(response.json()['error']),['1'])
+        self.assertEqual(Transaction.objects.count(),0)
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).balance,100)
+
+    def test_invalid_items(self):
+        response = self.post({'transactions':[{'from_acc':self.cash.pk,'to_acc':999,'amount':1},{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':'1'}]})
+        self.assertEqual(response.status_code,400)
+        self.assertEqual(set(response.json()['error']),{'0','1'})
+
+        response = self.client.post(reverse('api-txn-bulk'),'not json',content_type='application/json')
+        self.assertEqual(response.status_code,400)
+
+    def test_non_finite_amounts(self):
+        for amount in (float('nan'),float('inf')):
+            response = self.post([{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':amount}])
+            self.assertEqual(response.status_code,400)
+        self.assertEqual(Transaction.objects.count(),0)
+
+    def test_concurrent_idempotency_key(self):
+        # Another request posts the key between the lookup and the insert
+        def posted_concurrently(rows,keys):
+            post_transaction(self.cash,self.bank,10,idempotency_key='a')
+            raise IntegrityError
+        with mock.patch('dbaccounting.api.post_transactions',side_effect=posted_concurrently):
+            response = self.post([{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':10,'idempotency_key':'a'}])
+        self.assertEqual(response.status_code,409)
+
+        # Any other integrity error is not mistaken for one
+        with mock.patch('dbaccounting.api.post_transactions',side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.post([{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':10,'idempotency_key':'b'}])
+
+    def test_idempotency_keys(self):
+        response = self.post([{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':10,'idempotency_key':'a'}])
+        first = response.json()['results'][0]
+        self.assertTrue(first['created'])
+
+        # A retry of the batch with one more item only posts the new item
+        response = self.post([
+            {'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':10,'idempotency_key':'a'},
+            {'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':20,'idempotency_key':'b'},
+        ])
+        self.assertEqual(response.status_code,201)
+        results = response.json()['results']
+        self.assertEqual([(row['id'],row['created']) for row in results[:1]],[(first['id'],False)])
+        self.assertEqual((results[1]['idempotency_key'],results[1]['created']),('b',True))
+        self.assertEqual(Account.objects.get(pk=self.bank.pk).balance,30)
+
+        response = self.post([{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':10,'idempotency_key':'a'}])
+        self.assertEqual(response.status_code,200)
+        self.assertEqual(Transaction.objects.count(),2)
+
+    def test_idempotency_key_repeated_in_batch(self):
+        response = self.post([{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':10,'idempotency_key':'a'}]*2)
+        self.assertEqual(response.status_code,400)
+        self.assertEqual(list(response.json()['error']),['1'])
+
+    def test_get_not_allowed(self):
+        response = self.client.get(reverse('api-txn-bulk'))
+        self.assertEqual(response.status_code,405)
+
+    @override_settings(DBACCOUNTING_WRITE_BEHIND=True)
+    def test_bulk_post_write_behind(self):
+        response = self.post([{'from_acc':self.cash.pk,'to_acc':self.bank.pk,'amount':10}]*3)
+        self.assertEqual(response.status_code,201)
+        self.assertEqual(BalanceDelta.objects.count(),6)
+        self.assertTrue(all(row['pending'] for row in response.json()['results']))
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).pending_balance,70)
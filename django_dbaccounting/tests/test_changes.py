@@ -0,0 +1,82 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,TransactionChange
+from dbaccounting.posting import post_transaction, edit_transaction, delete_transaction
+
+# Create your tests here.
+
+@override_settings(DBACCOUNTING_CHANGES_SETTLE_SECONDS=0)
+class ChangeTrackingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('Can view account type','Can view account','Can view transaction'):
+            test_user2.user_permissions.add(Permission.objects.get(name=name))
+
+        cls.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.cash = Account.objects.create(name="Cash",acc_type=cls.assets,balance=100)
+        cls.bank = Account.objects.create(name="Bank",acc_type=cls.assets)
+
+    def setUp(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+    def test_posting_updates_timestamps(self):
+        before = Account.objects.get(pk=self.bank.pk).updated_at
+        post_transaction(self.cash,self.bank,10)
+        self.assertGreater(Account.objects.get(pk=self.bank.pk).updated_at,before)
+
+    def test_change_log(self):
+        txn = post_transaction(self.cash,self.bank,10)
+        new = edit_transaction(txn,self.cash,self.bank,20)
+        new_pk = new.pk
+        delete_transaction(new)
+        self.assertEqual(list(TransactionChange.objects.values_list('transaction_id','kind')),
+            [(txn.pk,'created'),(txn.pk,'updated'),(new_pk,'created'),(txn.pk,'updated'),(new_pk,'deleted')])
+
+    def test_transaction_changes_api(self):
+        txn = post_transaction(self.cash,self.bank,10)
+        data = self.client.get(reverse('api-txn-changes')).json()
+        self.assertEqual([(change['id'],change['kind']) for change in data['results']],[(txn.pk,'created')])
+        self.assertEqual(data['results'][0]['transaction']['amount'],10)
+
+        txn_pk = txn.pk
+        delete_transaction(txn)
+        data = self.client.get(reverse('api-txn-changes'),{'cursor':data['cursor']}).json()
+        self.assertEqual([(change['id'],change['kind'],change['transaction']) for change in data['results']],[(txn_pk,'deleted',None)])
+        data = self.client.get(reverse('api-txn-changes'),{'cursor':data['cursor']}).json()
+        self.assertEqual(data['results'],[])
+
+    def test_account_changes_api(self):
+        data = self.client.get(reverse('api-acc-changes'),{'limit':1}).json()
+        self.assertEqual([row['name'] for row in data['results']],['Cash'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([row['name'] for row in data['results']],['Bank'])
+        self.assertIsNone(data['next'])
+
+        post_transaction(self.bank,self.cash,5)
+        data = self.client.get(reverse('api-acc-changes'),{'cursor':data['cursor']}).json()
+        self.assertEqual({row['name']:row['balance'] for row in data['results']},{'Cash':105,'Bank':-5})
+
+    def test_account_type_changes_api(self):
+        self.assets.name = 'Current assets'
+        self.assets.save()
+        data = self.client.get(reverse('api-acctype-changes')).json()
+        self.assertEqual([row['name'] for row in data['results']],['Current assets'])
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse('api-acc-changes'),{'cursor':'yesterday'})
+        self.assertEqual(response.status_code,400)
+
+    def test_requires_permission(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('api-txn-changes'))
+        self.assertEqual(response.status_code,403)
+
+    @override_settings(DBACCOUNTING_CHANGES_SETTLE_SECONDS=60)
+    def test_recent_changes_held_back(self):
+        post_transaction(self.cash,self.bank,10)
+        self.assertEqual(self.client.get(reverse('api-txn-changes')).json()['results'],[])
+        self.assertEqual(self.client.get(reverse('api-acc-changes')).json()['results'],[])
@@ -0,0 +1,88 @@
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account
+from dbaccounting.chart import ChartError, import_chart
+
+# Create your tests here.
+
+def chart(types,accounts=20):
+    """A chart with a three level tree under Assets, listed children first, and accounts spread over its leaves"""
+    account_types = [{'name':f'Current {i}.{j}','bal_type':'D','parent':f'Current {i}'} for i in range(types) for j in range(2)]
+    account_types += [{'name':f'Current {i}','bal_type':'D','parent':'Assets'} for i in range(types)]
+    account_types.append({'name':'Assets','bal_type':'D'})
+    accounts = [{'name':f'Account {i}','acc_type':f'Current {i%types}.{i%2}','balance':i} for i in range(accounts)]
+    return {'account_types':account_types,'accounts':accounts}
+
+class ImportChartTest(TestCase):
+    def test_resolves_hierarchy(self):
+        counts = import_chart(chart(3))
+        self.assertEqual(counts,{'account_types':10,'accounts':20})
+
+        leaf = AccountType.objects.get(name='Current 1.0')
+        self.assertEqual(leaf.parent.name,'Current 1')
+        self.assertEqual(leaf.parent.parent.name,'Assets')
+        acc = Account.objects.get(name='Account 4')
+        self.assertEqual((acc.acc_type.name,acc.balance,acc.currency),('Current 1.0',4,'AED'))
+
+    def test_query_count_independent_of_size(self):
+        # Two lookups of existing names and one insert per level of the tree, plus the accounts'
+        # (140 accounts stay within one of SQLite's 999-parameter batches)
+        with self.assertNumQueries(8):
+            import_chart(chart(40,140))
+        self.assertEqual(Account.objects.count(),140)
+
+    def test_references_existing_types(self):
+        AccountType.objects.create(name='Liabilities',bal_type='C')
+        import_chart({'account_types':[{'name':'Loans','bal_type':'C','parent':'Liabilities'}],'accounts':[{'name':'Mortgage','acc_type':'Loans','balance':-100}]})
+        self.assertEqual(Account.objects.get(name='Mortgage').acc_type.parent.name,'Liabilities')
+
+    def test_errors(self):
+        assets = AccountType.objects.create(name='Assets',bal_type='D')
+        Account.objects.create(name='Cash',acc_type=assets)
+
+        with self.assertRaises(ChartError) as cm:
+            import_chart({'account_types':[{'name':'Assets','bal_type':'D'},{'name':'Bank','bal_type':'X','parent':'Missing'}],
+                'accounts':[{'name':'Cash','acc_type':'Assets'},{'name':'Cash','acc_type':'Assets'}]})
+        self.assertIn('accounts[1]: Cash appears more than once',cm.exception.errors)
+        self.assertIn('account_types[1]: bal_type must be C or D',cm.exception.errors)
+
+        with self.assertRaises(ChartError) as cm:
+            import_chart({'account_types':[{'name':'Assets','bal_type':'D'},{'name':'Bank','bal_type':'D','parent':'Missing'}],
+                'accounts':[{'name':'Cash','acc_type':'Bank'}]})
+        self.assertEqual(cm.exception.errors,['Account type Assets already exists','Account type Missing does not exist','Account Cash already exists'])
+
+        with self.assertRaises(ChartError) as cm:
+            import_chart({'accounts':[{'name':'Bank','acc_type':'Assets','balance':float('nan')},{'name':'Vault','acc_type':'Assets','balance':float('inf')}]})
+        self.assertEqual(cm.exception.errors,['accounts[0]: balance must be a finite number','accounts[1]: balance must be a finite number'])
+
+    def test_circular_parents(self):
+        with self.assertRaises(ChartError):
+            import_chart({'account_types':[{'name':'A','bal_type':'D','parent':'B'},{'name':'B','bal_type':'D','parent':'A'}]})
+        self.assertFalse(AccountType.objects.exists())
+
+class ChartImportApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('Can add account type','Can add account'):
+            test_user2.user_permissions.add(Permission.objects.get(name=name))
+
+    def test_requires_permission(self):
+        login = self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('api-chart'),json.dumps(chart(2)),content_type='application/json')
+        self.assertEqual(response.status_code,403)
+
+    def test_import(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('api-chart'),json.dumps(chart(2)),content_type='application/json')
+        self.assertEqual(response.status_code,201)
+        self.assertEqual(response.json(),{'account_types':7,'accounts':20})
+
+        response = self.client.post(reverse('api-chart'),json.dumps(chart(2)),content_type='application/json')
+        self.assertEqual(response.status_code,400)
+        self.assertIn('Account type Assets already exists',response.json()['error'])
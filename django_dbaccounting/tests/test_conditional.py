@@ -0,0 +1,80 @@
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account
+from dbaccounting.posting import post_transaction
+
+# Create your tests here.
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        # Committing the setup publishes a new data version, under which pages can be cached
+        with self.captureOnCommitCallbacks(execute=True):
+            test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+            for name in ('Can view account','Can view transaction'):
+                test_user2.user_permissions.add(Permission.objects.get(name=name))
+            assets = AccountType.objects.create(name="Assets",bal_type="D")
+            self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+            self.bank = Account.objects.create(name="Bank",acc_type=assets)
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+    def test_not_modified(self):
+        response = self.client.get(reverse('acc'))
+        self.assertEqual(response.status_code,200)
+        self.assertIn('private',response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('acc'),HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code,304)
+        # Only the session and permission checks
+        self.assertFalse([query for query in queries if 'dbaccounting_' in query['sql']])
+        response = self.client.get(reverse('acc-detail',args=[self.cash.pk]),HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code,304)
+
+    def test_modified_by_posting(self):
+        etag = self.client.get(reverse('acc-detail',args=[self.cash.pk]))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            post_transaction(self.cash,self.bank,10)
+        response = self.client.get(reverse('acc-detail',args=[self.cash.pk]),HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code,200)
+        self.assertContains(response,'90.0')
+
+    def test_no_etag_while_uncommitted(self):
+        post_transaction(self.cash,self.bank,10)
+        response = self.client.get(reverse('acc'))
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_etag_after_rollback(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                post_transaction(self.cash,self.bank,10)
+                Account.objects.create(name="Cash",acc_type=self.cash.acc_type)
+        response = self.client.get(reverse('acc'))
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_modified_by_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            txn = post_transaction(self.cash,self.bank,10)
+        for obj in (txn,self.bank):
+            etag = self.client.get(reverse('acc'))['ETag']
+            # Deleted through the ORM, as the admin does, rather than through the posting functions
+            with self.captureOnCommitCallbacks(execute=True):
+                obj.delete()
+            self.assertEqual(self.client.get(reverse('acc'),HTTP_IF_NONE_MATCH=etag).status_code,200)
+
+    def test_transaction_detail_not_modified(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            txn = post_transaction(self.cash,self.bank,10)
+        response = self.client.get(reverse('txn-detail',args=[txn.pk]))
+        response = self.client.get(reverse('txn-detail',args=[txn.pk]),HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code,304)
+
+    def test_rows_fragment_cached(self):
+        self.client.get(reverse('acc'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('acc'))
+        self.assertContains(response,'Cash')
+        rows = [query for query in queries if 'FROM "dbaccounting_account"' in query['sql'] and 'COUNT' not in query['sql']]
+        self.assertEqual(rows,[])
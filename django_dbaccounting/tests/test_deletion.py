@@ -0,0 +1,121 @@
+import datetime
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,Transaction,ArchivedTransaction,OpeningBalance,Period
+from dbaccounting.posting import post_transaction, edit_transaction
+from dbaccounting.deletion import AccountDeletion, DeletionError, subtree_levels
+
+# Create your tests here.
+
+class AccountDeletionTest(TestCase):
+    def setUp(self):
+        self.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.current = AccountType.objects.create(name="Current Assets",bal_type="D",parent=self.assets)
+        self.cash_type = AccountType.objects.create(name="Cash",bal_type="D",parent=self.current)
+        self.expenses = AccountType.objects.create(name="Expenses",bal_type="D")
+
+        self.wallet = Account.objects.create(name="Wallet",acc_type=self.cash_type,balance=100)
+        self.bank = Account.objects.create(name="Bank",acc_type=self.current,balance=500)
+        self.food = Account.objects.create(name="Food",acc_type=self.expenses)
+        self.rent = Account.objects.create(name="Rent",acc_type=self.expenses)
+
+    def balances(self):
+        return dict(Account.objects.values_list('name','balance'))
+
+    def test_subtree_levels(self):
+        self.assertEqual(subtree_levels(self.assets),[[self.assets.pk],[self.current.pk],[self.cash_type.pk]])
+
+    def test_delete_type_subtree(self):
+        post_transaction(self.bank,self.wallet,50)
+        post_transaction(self.wallet,self.food,30)
+        post_transaction(self.bank,self.rent,200)
+
+        deletion = AccountDeletion.for_type(self.assets)
+        self.assertEqual(deletion.impact(),{'account_types':3,'accounts':2,'transactions':3,'archived_transactions':0,
+            'opening_balances':0,'affected_accounts':2,'queued_deltas':0})
+        deletion.delete(batch_size=2)
+
+        self.assertEqual(list(AccountType.objects.values_list('name',flat=True)),['Expenses'])
+        self.assertFalse(Transaction.objects.exists())
+        # Food and Rent lose what they received from the deleted accounts
+        self.assertEqual(self.balances(),{'Food':0,'Rent':0})
+
+    def test_query_count_independent_of_size(self):
+        for i in range(50):
+            post_transaction(self.bank,self.food,1)
+        deletion = AccountDeletion.for_type(self.assets)
+        # A fixed number of statements, whatever the number of transactions that fit in a batch
+        with self.assertNumQueries(38):
+            deletion.delete(batch_size=1000)
+        self.assertEqual(self.balances(),{'Food':0,'Rent':0})
+
+    def test_refuses_to_change_other_balances(self):
+        post_transaction(self.bank,self.food,10)
+        with self.assertRaises(DeletionError):
+            AccountDeletion.for_account(self.bank).delete(reverse=False)
+        self.assertTrue(Account.objects.filter(pk=self.bank.pk).exists())
+
+        # Transactions between the deleted accounts only do not change other balances
+        post_transaction(self.bank,self.wallet,10)
+        Transaction.objects.filter(to_acc=self.food).delete()
+        AccountDeletion.for_type(self.current).delete(reverse=False)
+        self.assertFalse(Account.objects.filter(pk__in=[self.bank.pk,self.wallet.pk]).exists())
+
+    def test_restores_edited_transactions(self):
+        post_transaction(self.bank,self.food,40)
+        orig = post_transaction(Account.objects.get(name="Food"),self.rent,5)
+        orig = Transaction.objects.get(pk=orig.pk)
+        edit_transaction(orig,Account.objects.get(name="Food"),self.wallet,25)
+        self.assertEqual(self.balances(),{'Wallet':125,'Bank':460,'Food':15,'Rent':0})
+
+        # Deleting Wallet deletes the edit, so Food to Rent stands again as it does after deleting the edit itself
+        AccountDeletion.for_account(self.wallet).delete()
+        orig.refresh_from_db()
+        self.assertFalse(orig.edited)
+        self.assertEqual(self.balances(),{'Bank':460,'Food':35,'Rent':5})
+
+    @override_settings(DBACCOUNTING_WRITE_BEHIND=True)
+    def test_refuses_with_queued_deltas(self):
+        post_transaction(self.bank,self.food,10)
+        with self.assertRaises(DeletionError):
+            AccountDeletion.for_account(self.bank).delete()
+
+    def test_deletes_archive_and_opening_balances(self):
+        txn = post_transaction(self.bank,self.food,10)
+        period = Period.objects.create(end=datetime.date(2020,1,31))
+        OpeningBalance.objects.create(period=period,account=self.bank,balance=490)
+        ArchivedTransaction.objects.create(id=txn.pk,date=txn.date,from_acc=self.bank,to_acc=self.food,amount=10,currency='AED')
+        txn.delete()
+
+        AccountDeletion.for_account(self.bank).delete()
+        self.assertFalse(ArchivedTransaction.objects.exists())
+        self.assertFalse(OpeningBalance.objects.exists())
+        self.assertEqual(self.balances()['Food'],0)
+
+class AccountDeleteViewTest(TestCase):
+    def setUp(self):
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('Can delete account type','Can delete account','Can view account type','Can view account'):
+            test_user2.user_permissions.add(Permission.objects.get(name=name))
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.current = AccountType.objects.create(name="Current Assets",bal_type="D",parent=assets)
+        self.bank = Account.objects.create(name="Bank",acc_type=self.current,balance=100)
+        self.food = Account.objects.create(name="Food",acc_type=assets)
+        post_transaction(self.bank,self.food,10)
+
+    def test_confirm_page_shows_impact(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('acctype_delete',kwargs={'pk':self.current.pk}))
+        self.assertEqual(response.context['impact']['affected_accounts'],1)
+        self.assertContains(response,'reversed in the balances of 1 other accounts')
+
+    def test_delete_reverses_balances(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('acc_delete',kwargs={'pk':self.bank.pk}))
+        self.assertRedirects(response,reverse('acc'))
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.balance,0)
@@ -0,0 +1,55 @@
+import datetime
+import os
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from dbaccounting.models import AccountType,Account,Transaction
+from dbaccounting.export import pa, ExportError, export_transactions, exported_months
+
+# Create your tests here.
+
+class ExportTest(TestCase):
+    def setUp(self):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        bank = Account.objects.create(name="Bank",acc_type=assets)
+        for month, day in ((1,5),(1,20),(2,3),(3,1)):
+            txn = Transaction.objects.create(from_acc=cash,to_acc=bank,amount=month*10+day)
+            Transaction.objects.filter(pk=txn.pk).update(date=timezone.make_aware(datetime.datetime(2024,month,day,12)))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_requires_pyarrow(self):
+        with mock.patch('dbaccounting.export.pa',None):
+            with self.assertRaises(ExportError):
+                export_transactions(self.tmp.name)
+
+    @skipUnless(pa,'pyarrow is not installed')
+    def test_partitions_by_month(self):
+        import pyarrow.parquet as pq
+        self.assertEqual(export_transactions(self.tmp.name,chunk_size=1),{'2024-01':2,'2024-02':1,'2024-03':1})
+        self.assertEqual(exported_months(self.tmp.name),['2024-01','2024-02','2024-03'])
+        table = pq.read_table(os.path.join(self.tmp.name,'month=2024-01','transactions.parquet'))
+        self.assertEqual(table.column('amount').to_pylist(),[15,30])
+        self.assertEqual(table.column('to_acc_name').to_pylist(),['Bank','Bank'])
+        self.assertEqual(table.column('from_acc_type').to_pylist(),['Assets','Assets'])
+
+    @skipUnless(pa,'pyarrow is not installed')
+    def test_feather_date_range(self):
+        exported = export_transactions(self.tmp.name,'feather',start=datetime.date(2024,1,15),end=datetime.date(2024,3,1))
+        # The start is rounded down to whole months
+        self.assertEqual(exported,{'2024-01':2,'2024-02':1})
+        with pa.ipc.open_file(os.path.join(self.tmp.name,'month=2024-02','transactions.arrow')) as reader:
+            self.assertEqual(reader.read_all().column('amount').to_pylist(),[23])
+
+    @skipUnless(pa,'pyarrow is not installed')
+    def test_incremental_command(self):
+        export_transactions(self.tmp.name,end=datetime.date(2024,2,10))
+        out = StringIO()
+        call_command('export_transactions',self.tmp.name,'--incremental',stdout=out)
+        self.assertEqual(out.getvalue().splitlines(),['Exported 1 transactions of 2024-02','Exported 1 transactions of 2024-03'])
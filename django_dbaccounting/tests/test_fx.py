@@ -0,0 +1,126 @@
+import datetime
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,FxRate
+from dbaccounting.fx import MissingRate, get_rate, convert, consolidated_totals
+from dbaccounting.posting import post_transaction, validate_transaction
+
+# Create your tests here.
+
+class FxRateTest(TestCase):
+    def setUp(self):
+        # Rates cached by other tests outlive their rolled back rows
+        get_rate.cache_clear()
+        self.today = datetime.date.today()
+        self.yesterday = self.today-datetime.timedelta(days=1)
+        FxRate.objects.create(base='USD',quote='AED',date=self.yesterday,rate=3.6)
+        FxRate.objects.create(base='USD',quote='AED',date=self.today,rate=3.7)
+
+    def test_latest_rate_on_or_before_date(self):
+        self.assertEqual(get_rate('USD','AED',self.today),3.7)
+        self.assertEqual(get_rate('USD','AED',self.yesterday),3.6)
+        self.assertIsNone(get_rate('USD','AED',self.yesterday-datetime.timedelta(days=1)))
+
+    def test_inverse_rate(self):
+        self.assertAlmostEqual(get_rate('AED','USD',self.today),1/3.7)
+
+    def test_same_currency(self):
+        self.assertEqual(convert(10,'AED','AED'),10)
+
+    def test_missing_rate(self):
+        with self.assertRaises(MissingRate):
+            convert(10,'EUR','AED')
+
+    def test_cache_cleared_on_save(self):
+        self.assertEqual(get_rate('USD','AED',self.today),3.7)
+        with self.assertNumQueries(0):
+            get_rate('USD','AED',self.today)
+        rate = FxRate.objects.get(base='USD',quote='AED',date=self.today)
+        rate.rate = 3.8
+        rate.save()
+        self.assertEqual(get_rate('USD','AED',self.today),3.8)
+
+    @override_settings(DBACCOUNTING_RATE_CACHE_SECONDS=60)
+    def test_cache_expires(self):
+        with mock.patch('dbaccounting.fx.time.monotonic',return_value=6000):
+            self.assertEqual(get_rate('USD','AED',self.today),3.7)
+            # Corrected by another process, whose signal does not reach this one's cache
+            FxRate.objects.filter(base='USD',quote='AED',date=self.today).update(rate=3.8)
+            self.assertEqual(get_rate('USD','AED',self.today),3.7)
+        with mock.patch('dbaccounting.fx.time.monotonic',return_value=6060):
+            self.assertEqual(get_rate('USD','AED',self.today),3.8)
+
+    def test_missing_rate_not_cached(self):
+        self.assertIsNone(get_rate('EUR','AED',self.today))
+        # Loaded by another process, whose signal does not reach this one's cache
+        FxRate.objects.bulk_create([FxRate(base='EUR',quote='AED',date=self.today,rate=4)])
+        self.assertEqual(get_rate('EUR','AED',self.today),4)
+
+class ConsolidationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user.user_permissions.add(Permission.objects.get(name='Can view account'))
+        test_user.user_permissions.add(Permission.objects.get(name='Can view account type'))
+
+        cls.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        Account.objects.create(name="Cash",acc_type=cls.assets,balance=100)
+        Account.objects.create(name="Dollar Account",acc_type=cls.assets,balance=10,currency='USD')
+        Account.objects.create(name="Euro Account",acc_type=cls.assets,balance=10,currency='EUR')
+        FxRate.objects.create(base='USD',quote='AED',date=datetime.date.today(),rate=3.5)
+        # Only the inverse of the euro rate is known
+        FxRate.objects.create(base='AED',quote='EUR',date=datetime.date.today(),rate=0.25)
+
+    def test_consolidated_totals_single_query(self):
+        with self.assertNumQueries(1):
+            totals = consolidated_totals()
+        self.assertAlmostEqual(totals[self.assets.pk],175)
+
+    def test_consolidated_totals_missing_rate(self):
+        Account.objects.create(name="Pound Account",acc_type=self.assets,balance=10,currency='GBP')
+        with self.assertRaisesMessage(MissingRate,'GBP'):
+            consolidated_totals()
+
+    def test_balance_sheet_converts_balances(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('balance-sheet'))
+        self.assertAlmostEqual(response.context['ledgers'][0].total,175)
+
+    def test_balance_sheet_missing_rate(self):
+        Account.objects.create(name="Pound Account",acc_type=self.assets,balance=10,currency='GBP')
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('balance-sheet'))
+        self.assertIn('GBP',response.context['error'])
+
+    def test_balances_api(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('api-balances'))
+        data = response.json()
+        self.assertEqual(data['currency'],'AED')
+        self.assertAlmostEqual(data['totals'][0]['total'],175)
+
+        # There is no rate between euros and dollars
+        response = self.client.get(reverse('api-balances'),{'currency':'usd'})
+        self.assertEqual(response.status_code,409)
+
+class CurrencyPostingTest(TestCase):
+    def setUp(self):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        self.bank = Account.objects.create(name="Bank",acc_type=assets,balance=100)
+        self.dollars = Account.objects.create(name="Dollar Account",acc_type=assets,balance=100,currency='USD')
+
+    def test_transaction_takes_account_currency(self):
+        self.cash.currency = self.bank.currency = 'USD'
+        txn = post_transaction(self.cash,self.bank,10)
+        self.assertEqual(txn.currency,'USD')
+        self.assertEqual(str(txn),f'TXN on {txn.date} from Cash to Bank for 10 USD')
+
+    def test_accounts_must_share_currency(self):
+        with self.assertRaises(ValidationError):
+            validate_transaction(self.cash,self.dollars,10)
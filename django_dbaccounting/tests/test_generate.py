@@ -0,0 +1,59 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Min, Max
+from django.test import TestCase
+
+from dbaccounting.models import AccountType,Account,Transaction
+from dbaccounting.generate import generate_ledger
+
+# Create your tests here.
+
+class GenerateLedgerTest(TestCase):
+    def test_chart_of_accounts(self):
+        counts = generate_ledger(depth=3,width=2,accounts=40,transactions=0)
+        self.assertEqual(counts['account_types'],5*(1+2+4))
+        self.assertEqual(AccountType.objects.count(),35)
+        self.assertEqual(AccountType.objects.filter(parent=None).count(),5)
+        # Accounts only hang off the leaf types
+        self.assertFalse(Account.objects.filter(acc_type__accounttype__isnull=False).exists())
+
+    def test_transactions(self):
+        generate_ledger(depth=2,width=2,accounts=20,transactions=500,hot_accounts=2,hot_share=0.8,batch_size=100)
+        self.assertEqual(Transaction.objects.count(),500)
+        self.assertFalse(Transaction.objects.filter(from_acc=F('to_acc')).exists())
+
+        dates = Transaction.objects.aggregate(first=Min('date'),last=Max('date'))
+        self.assertGreater((dates['last']-dates['first']).days,300)
+
+        # The hot accounts see most of the postings
+        hot = Account.objects.order_by('pk')[:2]
+        hot_txns = Transaction.objects.filter(from_acc__in=hot).count()+Transaction.objects.filter(to_acc__in=hot).count()
+        self.assertGreater(hot_txns,500)
+
+    def test_balances_respect_balance_types(self):
+        generate_ledger(depth=2,width=2,accounts=20,transactions=500,hot_accounts=2,batch_size=100)
+        self.assertFalse(Account.objects.filter(acc_type__bal_type='D',balance__lt=0).exists())
+        self.assertFalse(Account.objects.filter(acc_type__bal_type='C',balance__gt=0).exists())
+
+    def test_runs_add_to_existing_chart(self):
+        generate_ledger(depth=2,width=2,accounts=10,transactions=20)
+        generate_ledger(depth=2,width=2,accounts=10,transactions=20,prefix='Second ')
+        self.assertEqual(AccountType.objects.filter(parent=None).count(),10)
+        self.assertTrue(Account.objects.filter(name='Second Account 1').exists())
+        self.assertEqual(Transaction.objects.count(),40)
+
+    def test_backend_without_returning_ids(self):
+        with mock.patch.object(type(connection.features),'can_return_rows_from_bulk_insert',False):
+            generate_ledger(depth=2,width=2,accounts=10,transactions=50,batch_size=20)
+        self.assertEqual(AccountType.objects.exclude(parent=None).count(),10)
+        self.assertEqual(Account.objects.count(),10)
+        self.assertEqual(Transaction.objects.count(),50)
+        self.assertFalse(Account.objects.filter(acc_type__bal_type='D',balance__lt=0).exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_ledger','--depth=1','--accounts=10','--transactions=50',stdout=out)
+        self.assertIn('Generated 5 account types, 10 accounts and 50 transactions',out.getvalue())
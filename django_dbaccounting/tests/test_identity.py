@@ -0,0 +1,92 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,Transaction
+from dbaccounting.forms import TransactionForm
+from dbaccounting.identity import AccountMap
+from dbaccounting.posting import post_transaction, edit_transaction
+
+# Create your tests here.
+
+def account_selects(queries):
+    """The number of queries that read the account table"""
+    return len([query for query in queries if query['sql'].startswith('SELECT') and 'FROM "dbaccounting_account"' in query['sql']])
+
+class AccountMapTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.acc1 = Account.objects.create(name="Cash",acc_type=cls.assets,balance=100)
+        cls.acc2 = Account.objects.create(name="Bank",acc_type=cls.assets)
+        cls.txn = Transaction.objects.create(from_acc=cls.acc1,to_acc=cls.acc2,amount=10)
+
+    def test_loads_deferred_accounts_together(self):
+        accounts = AccountMap()
+        accounts.defer([self.acc1.pk,self.acc2.pk])
+        with self.assertNumQueries(1):
+            acc1,acc2 = accounts.get(self.acc1.pk),accounts.get(self.acc2.pk)
+            self.assertIs(acc1.acc_type,acc2.acc_type)
+        self.assertIsNone(accounts.get(0))
+
+    def test_attach(self):
+        accounts = AccountMap()
+        acc1 = accounts.add(Account.objects.get(pk=self.acc1.pk))
+        txn = Transaction.objects.get(pk=self.txn.pk)
+        with self.assertNumQueries(1):
+            accounts.attach([txn])
+        self.assertIs(txn.from_acc,acc1)
+
+    def test_form_shares_accounts(self):
+        accounts = AccountMap()
+        orig = Transaction.objects.get(pk=self.txn.pk)
+        accounts.defer((orig.from_acc_id,orig.to_acc_id))
+        form = TransactionForm(data={'from_acc':self.acc1.pk,'to_acc':self.acc2.pk,'amount':5},accounts=accounts)
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+            accounts.attach([orig])
+        self.assertIs(form.cleaned_data['from_acc'],orig.from_acc)
+
+    def test_shared_account_balance_updated_once(self):
+        accounts = AccountMap()
+        orig = accounts.attach([Transaction.objects.get(pk=self.txn.pk)])[0]
+        acc1 = orig.from_acc
+        edit_transaction(orig,acc1,orig.to_acc,30)
+        self.assertEqual(acc1.balance,Account.objects.get(pk=self.acc1.pk).balance)
+
+class TransactionViewAccountQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('Can add transaction','Can change transaction','Can view transaction'):
+            test_user2.user_permissions.add(Permission.objects.get(name=name))
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.acc1 = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        cls.acc2 = Account.objects.create(name="Bank",acc_type=assets)
+        cls.acc3 = Account.objects.create(name="Safe",acc_type=assets)
+
+    def setUp(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+    def test_create_loads_accounts_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('txn_create'),{'from_acc':self.acc1.pk,'to_acc':self.acc2.pk,'amount':10})
+        self.assertRedirects(response,reverse('txn'),fetch_redirect_response=False)
+        self.assertEqual(account_selects(queries),1)
+
+    def test_update_loads_accounts_once(self):
+        txn = post_transaction(self.acc1,self.acc2,10)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('txn_update',kwargs={'pk':txn.pk}),{'from_acc':self.acc1.pk,'to_acc':self.acc3.pk,'amount':20})
+        self.assertRedirects(response,reverse('txn'),fetch_redirect_response=False)
+        self.assertEqual(account_selects(queries),1)
+        self.assertEqual(dict(Account.objects.values_list('name','balance')),{'Cash':80,'Bank':0,'Safe':20})
+
+    def test_detail_loads_accounts_once(self):
+        txn = post_transaction(self.acc1,self.acc2,10)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('txn-detail',kwargs={'pk':txn.pk}))
+        self.assertEqual(account_selects(queries),1)
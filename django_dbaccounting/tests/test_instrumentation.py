@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,Transaction
+from dbaccounting.instrumentation import record_queries, percentile, stats
+
+# Create your tests here.
+
+INSTRUMENTED = dict(MIDDLEWARE=settings.MIDDLEWARE+['dbaccounting.instrumentation.InstrumentationMiddleware'],DBACCOUNTING_INSTRUMENT=True)
+
+class RecordQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        Account.objects.create(name="Cash",acc_type=assets)
+
+    def test_counts_queries(self):
+        with record_queries() as recorder:
+            list(Account.objects.all())
+            Account.objects.count()
+        self.assertEqual(recorder.count,2)
+        self.assertEqual(len(recorder.slowest(1)),1)
+
+    def test_percentile(self):
+        values = list(range(1,101))
+        self.assertEqual(percentile(values,50),50)
+        self.assertEqual(percentile(values,99),99)
+        self.assertIsNone(percentile([],50))
+
+class InstrumentationMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK', is_staff=True)
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for user in (test_user1,test_user2):
+            user.user_permissions.add(Permission.objects.get(name='Can view transaction'))
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        acc1 = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        acc2 = Account.objects.create(name="Bank",acc_type=assets)
+        for txn_id in range(30):
+            Transaction.objects.create(from_acc=acc1,to_acc=acc2,amount=1)
+
+    def setUp(self):
+        stats.clear()
+
+    def test_disabled_by_default(self):
+        login = self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        with override_settings(MIDDLEWARE=INSTRUMENTED['MIDDLEWARE']):
+            self.client.get(reverse('txn'))
+        self.assertEqual(stats.summary(),{})
+
+    @override_settings(**INSTRUMENTED)
+    def test_records_view_stats(self):
+        login = self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        for page in (1,1,1):
+            self.client.get(reverse('txn'),{'page':page})
+
+        response = self.client.get(reverse('api-stats'))
+        self.assertEqual(response.status_code,200)
+        txn_stats = response.json()['views']['txn']
+        self.assertEqual(txn_stats['requests'],3)
+        # The list is paginated with its accounts joined in, so its cost does not grow with the page size
+        self.assertLessEqual(txn_stats['queries']['max'],8)
+        self.assertGreater(txn_stats['total_ms']['p50'],0)
+
+    @override_settings(**INSTRUMENTED)
+    def test_stats_staff_only(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('api-stats'))
+        self.assertEqual(response.status_code,403)
+
+    @override_settings(DBACCOUNTING_SLOW_REQUEST_MS=0,**INSTRUMENTED)
+    def test_logs_slow_requests(self):
+        login = self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        with self.assertLogs('dbaccounting.instrumentation','WARNING') as logs:
+            self.client.get(reverse('txn'))
+        self.assertIn('Slow request GET',logs.output[0])
+        self.assertIn('SELECT',logs.output[0])
@@ -0,0 +1,90 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,JournalEntry,JournalLeg
+from dbaccounting.posting import validate_journal_entry, post_journal_entry
+from dbaccounting.deletion import AccountDeletion, DeletionError
+
+# Create your tests here.
+
+class JournalEntryTest(TestCase):
+    def setUp(self):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        liabilities = AccountType.objects.create(name="Liabilities",bal_type="C")
+        self.bank = Account.objects.create(name="Bank",acc_type=assets,balance=1000)
+        self.staff = [Account.objects.create(name=f"Employee {i}",acc_type=assets) for i in range(50)]
+        self.tax = Account.objects.create(name="Tax Payable",acc_type=liabilities)
+
+    def payroll(self):
+        legs = [(acc,10) for acc in self.staff]+[(self.bank,-450)]
+        return legs+[(self.tax,-5)]*10
+
+    def test_post(self):
+        legs = self.payroll()
+        validate_journal_entry(legs)
+        # The entry, one insert for all the legs and one update per account, in a savepoint
+        with self.assertNumQueries(1+1+52+2):
+            entry = post_journal_entry(legs,"Payroll")
+        self.assertEqual(entry.legs.count(),61)
+        self.assertEqual(Account.objects.get(pk=self.bank.pk).balance,550)
+        self.assertEqual(Account.objects.get(pk=self.tax.pk).balance,-50)
+        self.assertEqual(Account.objects.get(pk=self.staff[0].pk).balance,10)
+        self.assertEqual(self.bank.balance,550)
+
+    def test_legs_must_balance(self):
+        with self.assertRaises(ValidationError):
+            validate_journal_entry([(self.bank,-10),(self.staff[0],9)])
+        with self.assertRaises(ValidationError):
+            validate_journal_entry([(self.bank,-10)])
+        validate_journal_entry([(self.bank,-0.3),(self.staff[0],0.1),(self.staff[1],0.2)])
+        with self.assertRaises(ValidationError):
+            validate_journal_entry([(self.bank,-10),(self.staff[0],10),(self.staff[1],float('nan'))])
+
+    def test_accounts_checked_on_net_change(self):
+        with self.assertRaises(ValidationError):
+            validate_journal_entry([(self.bank,-600),(self.bank,-600),(self.staff[0],1200)])
+        with self.assertRaises(ValidationError):
+            validate_journal_entry([(self.tax,10),(self.bank,-10)])
+        validate_journal_entry([(self.bank,-1200),(self.bank,600),(self.staff[0],600)])
+
+    def test_account_with_entries_not_deleted(self):
+        post_journal_entry([(self.bank,-10),(self.staff[0],10)])
+        with self.assertRaises(DeletionError):
+            AccountDeletion.for_account(self.staff[0]).delete()
+
+class JournalEntryApiTest(TestCase):
+    def setUp(self):
+        test_user = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user.user_permissions.add(Permission.objects.get(name='Can add journal entry'))
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        self.bank = Account.objects.create(name="Bank",acc_type=assets)
+        self.safe = Account.objects.create(name="Safe",acc_type=assets)
+
+    def post(self,body):
+        return self.client.post(reverse('api-journal'),json.dumps(body),content_type='application/json')
+
+    def test_post(self):
+        response = self.post({'note':'Split','legs':[{'account':self.cash.pk,'amount':-60},{'account':self.bank.pk,'amount':40},{'account':self.safe.pk,'amount':20}]})
+        self.assertEqual(response.status_code,201)
+        self.assertEqual(len(response.json()['legs']),3)
+        self.assertEqual(JournalLeg.objects.count(),3)
+        self.assertEqual(dict(Account.objects.values_list('name','balance')),{'Cash':40,'Bank':40,'Safe':20})
+
+    def test_invalid(self):
+        response = self.post({'legs':[{'account':self.cash.pk,'amount':-60},{'account':999,'amount':60}]})
+        self.assertEqual(response.status_code,400)
+        self.assertEqual(list(response.json()['error']),['1'])
+
+        response = self.post({'legs':[{'account':self.cash.pk,'amount':-200},{'account':self.bank.pk,'amount':200}]})
+        self.assertEqual(response.status_code,400)
+
+        response = self.post({'legs':[{'account':self.cash.pk,'amount':-60},{'account':self.bank.pk,'amount':60},{'account':self.safe.pk,'amount':float('nan')}]})
+        self.assertEqual(list(response.json()['error']),['2'])
+        self.assertFalse(JournalEntry.objects.exists())
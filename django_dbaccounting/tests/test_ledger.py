@@ -0,0 +1,85 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,FxRate
+from dbaccounting.fx import MissingRate
+from dbaccounting.ledger import LedgerTree, account_rows
+from dbaccounting.tree import get_tree
+
+# Create your tests here.
+
+class LedgerTreeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view account'))
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view account type'))
+
+        cls.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.current = AccountType.objects.create(name="Current Assets",bal_type="D",parent=cls.assets)
+        cls.bank = AccountType.objects.create(name="Bank Accounts",bal_type="D",parent=cls.current)
+        cls.liabilities = AccountType.objects.create(name="Liabilities",bal_type="C")
+        Account.objects.create(name="Building",acc_type=cls.assets,balance=1000)
+        Account.objects.create(name="Cash",acc_type=cls.current,balance=50)
+        Account.objects.create(name="Savings",acc_type=cls.bank,balance=100)
+        Account.objects.create(name="Checking",acc_type=cls.bank,balance=25)
+        Account.objects.create(name="Short-Term Debt",acc_type=cls.liabilities,balance=-200)
+
+    def test_rolled_up_totals(self):
+        ledgers = {node.acc_type.name:node for node in LedgerTree(get_tree(),account_rows(None)).roots}
+        self.assertEqual(set(ledgers),{'Assets','Liabilities'})
+        assets = ledgers['Assets']
+        self.assertEqual((assets.total,assets.subtotal),(1175,175))
+        current, = assets.children
+        self.assertEqual((current.acc_type.name,current.depth,current.total,current.subtotal),('Current Assets',1,175,125))
+        bank, = current.children
+        self.assertEqual([(acc.name,acc.balance) for acc in bank.accs],[('Checking',25),('Savings',100)])
+        self.assertEqual(ledgers['Liabilities'].total,-200)
+
+    def test_builds_from_rows(self):
+        rows = [(1,'Wallet',self.bank.pk,10.0,'AED',None),(2,'Vault',self.assets.pk,5.0,'USD',20.0)]
+        ledger = LedgerTree(get_tree(),rows)
+        assets = ledger.roots[0]
+        self.assertEqual(assets.total,30)
+        self.assertEqual([(acc.pk,acc.currency,acc.reporting_balance) for acc in assets.accs],[(2,'USD',20.0)])
+        # Types without accounts are kept with a total of zero
+        self.assertEqual([(node.acc_type.name,node.total) for node in ledger.roots],[('Assets',30),('Liabilities',0)])
+
+    def test_missing_rate(self):
+        with self.assertRaises(MissingRate):
+            LedgerTree(get_tree(),[(1,'Pounds',self.current.pk,10.0,'GBP',None)])
+
+    def test_unknown_type_left_out(self):
+        rows = [(1,'Wallet',self.bank.pk,10.0,'AED',10.0),(2,'Vault',self.bank.pk+100,5.0,'AED',5.0)]
+        with self.assertLogs('dbaccounting.ledger','WARNING'):
+            ledger = LedgerTree(get_tree(),rows)
+        self.assertEqual(list(ledger.acc_ids),[1])
+        self.assertEqual(ledger.roots[0].total,10)
+
+    def test_nodes_are_slotted(self):
+        node = LedgerTree(get_tree(),account_rows(None)).roots[0]
+        self.assertFalse(hasattr(node,'__dict__'))
+        self.assertFalse(hasattr(node.accs[0],'__dict__'))
+
+    def test_as_dict(self):
+        self.assertEqual(LedgerTree(get_tree(),account_rows(None)).as_dicts()[1],{
+            'acc_type':self.liabilities.pk,'name':'Liabilities','total':-200,'children':[],
+            'accounts':[{'id':Account.objects.get(name='Short-Term Debt').pk,'name':'Short-Term Debt','balance':-200,'currency':'AED','reporting_balance':-200}]})
+
+    def test_api(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        FxRate.objects.create(base='USD',quote='AED',date='2000-01-01',rate=4)
+        response = self.client.get(reverse('api-balance-sheet'),{'currency':'usd'})
+        self.assertEqual(response.status_code,200)
+        assets = response.json()['types'][0]
+        self.assertEqual((assets['name'],assets['total']),('Assets',1175/4))
+        self.assertEqual(assets['children'][0]['children'][0]['name'],'Bank Accounts')
+
+        Account.objects.create(name="Pounds",acc_type=self.current,balance=10,currency='GBP')
+        self.assertEqual(self.client.get(reverse('api-balance-sheet')).status_code,409)
+
+    def test_api_requires_permission(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(reverse('api-balance-sheet')).status_code,403)
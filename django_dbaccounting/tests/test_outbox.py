@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+
+from dbaccounting.models import AccountType,Account,OutboxEvent
+from dbaccounting.posting import post_transaction, post_transactions, edit_transaction, delete_transaction
+from dbaccounting.deletion import AccountDeletion
+from dbaccounting.outbox import relay, FileSink, HttpSink, CallbackSink
+
+# Create your tests here.
+
+received = []
+
+def collect(messages):
+    received.extend(messages)
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        self.bank = Account.objects.create(name="Bank",acc_type=assets)
+        received.clear()
+
+    def events(self):
+        return list(OutboxEvent.objects.values_list('event','payload__id'))
+
+    def test_posting_edit_and_delete_record_events(self):
+        txn = post_transaction(self.cash,self.bank,10)
+        new = edit_transaction(txn,self.cash,self.bank,20)
+        new_pk = new.pk
+        delete_transaction(new)
+        self.assertEqual(self.events(),[(OutboxEvent.POSTED,txn.pk),(OutboxEvent.EDITED,new_pk),(OutboxEvent.DELETED,new_pk)])
+        self.assertEqual(OutboxEvent.objects.get(event=OutboxEvent.EDITED).payload['updating'],txn.pk)
+
+    def test_bulk_posting_records_events(self):
+        txns = post_transactions([(self.cash,self.bank,1,None),(self.cash,self.bank,2,'Fees')])
+        self.assertEqual(self.events(),[(OutboxEvent.POSTED,txn.pk) for txn in txns])
+
+    def test_rolled_back_posting_records_nothing(self):
+        try:
+            with transaction.atomic():
+                post_transaction(self.cash,self.bank,10)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_account_deletion_records_events(self):
+        txn = post_transaction(self.cash,self.bank,10)
+        AccountDeletion.for_account(self.bank).delete()
+        self.assertEqual(self.events()[-1],(OutboxEvent.DELETED,txn.pk))
+
+    def test_relay_marks_delivered(self):
+        for i in range(5):
+            post_transaction(self.cash,self.bank,1)
+        self.assertEqual(relay(CallbackSink(collect),batch_size=3),3)
+        self.assertEqual(relay(CallbackSink(collect),batch_size=3),2)
+        self.assertEqual(relay(CallbackSink(collect),batch_size=3),0)
+        self.assertEqual([message['id'] for message in received],list(OutboxEvent.objects.values_list('pk',flat=True)))
+        self.assertFalse(OutboxEvent.objects.filter(delivered_at=None).exists())
+
+    def test_failed_delivery_is_retried(self):
+        post_transaction(self.cash,self.bank,1)
+        def fail(messages):
+            raise OSError
+        with self.assertRaises(OSError):
+            relay(CallbackSink(fail))
+        self.assertTrue(OutboxEvent.objects.filter(delivered_at=None).exists())
+        self.assertEqual(relay(CallbackSink(collect)),1)
+
+    def test_file_sink(self):
+        post_transaction(self.cash,self.bank,10,'Rent')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp,'events.jsonl')
+            relay(FileSink(path))
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([(line['event'],line['payload']['note']) for line in lines],[(OutboxEvent.POSTED,'Rent')])
+
+    def test_http_sink(self):
+        bodies = []
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                bodies.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                self.send_response(204)
+                self.end_headers()
+            def log_message(self, *args):
+                pass
+        server = HTTPServer(('127.0.0.1',0),Handler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        try:
+            post_transaction(self.cash,self.bank,10)
+            self.assertEqual(relay(HttpSink(f'http://127.0.0.1:{server.server_port}/events')),1)
+        finally:
+            thread.join()
+            server.server_close()
+        self.assertEqual(bodies[0][0]['payload']['amount'],10)
+
+    def test_command(self):
+        post_transaction(self.cash,self.bank,10)
+        out = StringIO()
+        call_command('relay_outbox','--sink','dbaccounting.tests.test_outbox.collect','--once','--keep-days','0',stdout=out)
+        self.assertEqual(len(received),1)
+        self.assertFalse(OutboxEvent.objects.exists())
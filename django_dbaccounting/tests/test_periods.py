@@ -0,0 +1,94 @@
+import datetime
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,Transaction,ArchivedTransaction,OpeningBalance,Period
+from dbaccounting.periods import PeriodError, close_period
+from dbaccounting.posting import post_transaction, edit_transaction, posted_transactions
+
+# Create your tests here.
+
+class PeriodCloseTest(TestCase):
+    def setUp(self):
+        self.end = timezone.localdate()-datetime.timedelta(days=10)
+        self.before = timezone.now()-datetime.timedelta(days=20)
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=1000)
+        self.bank = Account.objects.create(name="Bank",acc_type=assets)
+        Account.objects.filter(pk__in=[self.cash.pk,self.bank.pk]).update(date_create=self.before)
+
+        # Two transactions in the closed period, one of which is edited after it
+        self.old1 = self.post(self.cash,self.bank,100,self.before)
+        self.old2 = self.post(self.cash,self.bank,50,self.before)
+        self.edit = edit_transaction(self.old2,self.cash,self.bank,70)
+        self.new = post_transaction(self.cash,self.bank,10)
+
+    def post(self,from_acc,to_acc,amount,date):
+        txn = post_transaction(from_acc,to_acc,amount)
+        Transaction.objects.filter(pk=txn.pk).update(date=date)
+        return txn
+
+    def test_opening_balances(self):
+        period = close_period(self.end)
+        balances = dict(OpeningBalance.objects.filter(period=period).values_list('account','balance'))
+        self.assertEqual(balances,{self.cash.pk:850,self.bank.pk:150})
+
+    def test_transactions_archived(self):
+        close_period(self.end)
+        self.assertEqual(list(ArchivedTransaction.objects.values_list('pk',flat=True)),[self.old1.pk])
+        archived = ArchivedTransaction.objects.get(pk=self.old1.pk)
+        self.assertEqual((archived.from_acc,archived.to_acc,archived.amount),(self.cash,self.bank,100))
+        # The edited transaction stays until its edit is archived too
+        self.assertEqual(set(Transaction.objects.values_list('pk',flat=True)),{self.old2.pk,self.edit.pk,self.new.pk})
+
+    def test_later_period_archives_edit_chain(self):
+        close_period(self.end)
+        Transaction.objects.filter(pk__in=[self.edit.pk,self.new.pk]).update(date=timezone.now()-datetime.timedelta(days=5))
+        period = close_period(self.end+datetime.timedelta(days=7))
+
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(ArchivedTransaction.objects.get(pk=self.edit.pk).updating_id,self.old2.pk)
+        balances = dict(OpeningBalance.objects.filter(period=period).values_list('account','balance'))
+        self.assertEqual(balances,{self.cash.pk:820,self.bank.pk:180})
+
+    def test_idempotency_key_survives_archiving(self):
+        txn = post_transaction(self.cash,self.bank,5,idempotency_key='retry')
+        Transaction.objects.filter(pk=txn.pk).update(date=self.before)
+        close_period(self.end)
+        # A retry after the close returns the archived transaction rather than posting again
+        self.assertEqual(post_transaction(self.cash,self.bank,5,idempotency_key='retry').pk,txn.pk)
+        self.assertEqual(posted_transactions(['retry'])['retry'].pk,txn.pk)
+        self.assertFalse(Transaction.objects.filter(idempotency_key='retry').exists())
+
+    def test_cannot_close_open_or_closed_periods(self):
+        with self.assertRaises(PeriodError):
+            close_period(timezone.localdate())
+        close_period(self.end)
+        with self.assertRaises(PeriodError):
+            close_period(self.end)
+
+    @override_settings(DBACCOUNTING_WRITE_BEHIND=True)
+    def test_cannot_close_with_queued_deltas(self):
+        post_transaction(self.cash,self.bank,10)
+        with self.assertRaises(PeriodError):
+            close_period(self.end)
+        self.assertFalse(Period.objects.exists())
+
+    def test_balance_sheet_for_closed_period(self):
+        user = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        user.user_permissions.add(Permission.objects.get(name='Can view account'))
+        user.user_permissions.add(Permission.objects.get(name='Can view account type'))
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        close_period(self.end)
+
+        for name in ('balance-sheet','balance-sheet-async'):
+            response = self.client.get(reverse(name),{'period':str(self.end)})
+            self.assertEqual(response.context['date'],str(self.end))
+            self.assertEqual({acc.name:acc.balance for acc in response.context['ledgers'][0].accs},{'Cash':850,'Bank':150})
+
+            response = self.client.get(reverse(name),{'period':'2000-01-01'})
+            self.assertEqual(response.status_code,404)
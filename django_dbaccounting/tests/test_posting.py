@@ -0,0 +1,98 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from dbaccounting.models import AccountType,Account,Transaction,TransactionChange,BalanceDelta
+from dbaccounting.posting import post_transaction, post_transactions, edit_transaction, delete_transaction, apply_queued_deltas
+
+# Create your tests here.
+
+class PostingTest(TestCase):
+    def setUp(self):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=500)
+        self.bank = Account.objects.create(name="Bank",acc_type=assets,balance=100)
+        self.safe = Account.objects.create(name="Safe",acc_type=assets,balance=0)
+
+    def balances(self):
+        return [Account.objects.get(pk=acc.pk).balance for acc in (self.cash,self.bank,self.safe)]
+
+    def test_post_transaction(self):
+        txn = post_transaction(self.cash,self.bank,50,"Deposit")
+        self.assertEqual(self.balances(),[450,150,0])
+        self.assertFalse(txn.pending)
+        # In-memory instances are kept in step with the database
+        self.assertEqual(self.cash.balance,450)
+
+    def test_idempotency_key(self):
+        txn = post_transaction(self.cash,self.bank,50,idempotency_key="req-1")
+        with self.assertNumQueries(8):
+            # The archive is checked, the insert fails on the key in its savepoint, and the transaction already posted is read back - nothing else
+            retry = post_transaction(self.cash,self.bank,50,idempotency_key="req-1")
+        self.assertEqual(retry.pk,txn.pk)
+        self.assertEqual(self.balances(),[450,150,0])
+        self.assertEqual(self.cash.balance,450)
+
+    def test_edit_transaction_amount(self):
+        txn = post_transaction(self.cash,self.bank,50)
+        edit_transaction(txn,self.cash,self.bank,80)
+        self.assertEqual(self.balances(),[420,180,0])
+        self.assertTrue(Transaction.objects.get(pk=txn.pk).edited)
+
+    def test_edit_transaction_swapped_accounts(self):
+        txn = post_transaction(self.cash,self.bank,50)
+        edit_transaction(txn,Account.objects.get(pk=self.bank.pk),Account.objects.get(pk=self.safe.pk),50)
+        self.assertEqual(self.balances(),[500,50,50])
+
+    def test_delete_edited_transaction_restores_original(self):
+        txn = post_transaction(self.cash,self.bank,50)
+        new_txn = edit_transaction(txn,self.cash,self.safe,20)
+        delete_transaction(new_txn)
+        self.assertEqual(self.balances(),[450,150,0])
+        self.assertFalse(Transaction.objects.get(pk=txn.pk).edited)
+
+@override_settings(DBACCOUNTING_WRITE_BEHIND=True)
+class WriteBehindPostingTest(TestCase):
+    def setUp(self):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.cash = Account.objects.create(name="Cash",acc_type=assets,balance=500)
+        self.bank = Account.objects.create(name="Bank",acc_type=assets,balance=100)
+
+    def test_posting_is_queued(self):
+        txn = post_transaction(self.cash,self.bank,50)
+        self.assertTrue(txn.pending)
+        self.assertEqual(BalanceDelta.objects.count(),2)
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).balance,500)
+
+    def test_pending_balance(self):
+        post_transaction(self.cash,self.bank,50)
+        post_transaction(self.cash,self.bank,25)
+        cash = Account.objects.get(pk=self.cash.pk)
+        self.assertEqual(cash.balance,500)
+        self.assertEqual(cash.pending_balance,425)
+        self.assertEqual(Account.objects.with_pending_balance().get(pk=self.bank.pk).pending_balance,175)
+
+    def test_apply_queued_deltas(self):
+        txns = [post_transaction(self.cash,self.bank,10) for i in range(5)]
+        self.assertEqual(apply_queued_deltas(),10)
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).balance,450)
+        self.assertEqual(Account.objects.get(pk=self.bank.pk).balance,150)
+        self.assertFalse(Transaction.objects.filter(pending=True).exists())
+        self.assertEqual(apply_queued_deltas(),0)
+
+    def test_batch_on_backend_without_returning_ids(self):
+        with mock.patch.object(type(connection.features),'can_return_rows_from_bulk_insert',False):
+            txns = post_transactions([(self.cash,self.bank,10,None),(self.cash,self.bank,20,None)])
+        self.assertTrue(all(txn.pk for txn in txns))
+        self.assertEqual(set(BalanceDelta.objects.values_list('transaction',flat=True)),{txn.pk for txn in txns})
+        self.assertEqual(set(TransactionChange.objects.values_list('transaction_id',flat=True)),{txn.pk for txn in txns})
+
+    def test_apply_queued_deltas_in_batches(self):
+        txn = post_transaction(self.cash,self.bank,10)
+        apply_queued_deltas(batch_size=1)
+        # Half of the transaction's deltas are still queued
+        self.assertTrue(Transaction.objects.get(pk=txn.pk).pending)
+        apply_queued_deltas(batch_size=1)
+        self.assertFalse(Transaction.objects.get(pk=txn.pk).pending)
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).balance,490)
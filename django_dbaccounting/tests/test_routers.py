@@ -0,0 +1,102 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+from django.contrib.sessions.backends.db import SessionStore
+
+from dbaccounting.models import AccountType,Account,Transaction
+from dbaccounting.routers import ReplicaRouter, replica_reads, stick_to_primary
+from dbaccounting.tree import get_tree, clear_tree_cache
+
+# Create your tests here.
+
+class ReplicaRouterTest(TestCase):
+    def test_reads_stay_on_primary_outside_read_views(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(Account))
+
+    @override_settings(DBACCOUNTING_REPLICA='missing')
+    def test_unconfigured_alias_falls_back_to_primary(self):
+        with replica_reads():
+            self.assertIsNone(ReplicaRouter().db_for_read(Account))
+
+    @override_settings(DBACCOUNTING_REPLICA='default')
+    def test_only_routes_app_models(self):
+        with replica_reads():
+            self.assertEqual(ReplicaRouter().db_for_read(Account),'default')
+            self.assertIsNone(ReplicaRouter().db_for_read(User))
+
+    @override_settings(DBACCOUNTING_REPLICA='default')
+    def test_sticky_session_reads_from_primary(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        stick_to_primary(request)
+        with replica_reads(request):
+            self.assertIsNone(ReplicaRouter().db_for_read(Account))
+
+        with override_settings(DBACCOUNTING_STICKY_SECONDS=-1):
+            stick_to_primary(request)
+        with replica_reads(request):
+            self.assertEqual(ReplicaRouter().db_for_read(Account),'default')
+
+# Uses a second SQLite database named 'replica' in the test settings as a stand-in for a replica.
+# The two databases are kept apart so that each test can tell which one a view read from.
+@skipUnless('replica' in settings.DATABASES,'requires a database alias named replica')
+@override_settings(DATABASE_ROUTERS=['dbaccounting.routers.ReplicaRouter'],DBACCOUNTING_REPLICA='replica')
+class ReplicaReadViewTest(TestCase):
+    databases = {'default','replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    @classmethod
+    def setUpTestData(cls):
+        test_user = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('Can view account type','Can view account','Can view transaction','Can add transaction'):
+            test_user.user_permissions.add(Permission.objects.get(name=name))
+
+        for db in ('default','replica'):
+            assets = AccountType.objects.using(db).create(name="Assets",bal_type="D")
+            Account.objects.using(db).create(name="Cash",acc_type=assets,balance=100)
+            Account.objects.using(db).create(name="Bank",acc_type=assets)
+        Account.objects.using('replica').filter(name="Bank").update(name="Bank (replica)")
+
+    def setUp(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+    def test_list_views_read_from_replica(self):
+        response = self.client.get(reverse('acc'))
+        self.assertContains(response,'Bank (replica)')
+
+        response = self.client.get(reverse('api-acc'),{'fields':'name'})
+        self.assertIn({'name':'Bank (replica)'},response.json()['results'])
+
+    def test_reads_after_write_use_primary(self):
+        cash,bank = Account.objects.get(name="Cash"),Account.objects.get(name="Bank")
+        response = self.client.post(reverse('txn_create'),{'from_acc':cash.pk,'to_acc':bank.pk,'amount':10,'note':'Deposit'})
+        self.assertRedirects(response,reverse('txn'))
+
+        # The replica has not caught up with the new transaction yet, but the session reads its own write
+        self.assertFalse(Transaction.objects.using('replica').exists())
+        response = self.client.get(reverse('txn'))
+        self.assertEqual([txn.note for txn in response.context['transaction_list']],['Deposit'])
+        response = self.client.get(reverse('acc'))
+        self.assertNotContains(response,'Bank (replica)')
+
+    def test_streamed_views_read_from_replica(self):
+        cash,bank = Account.objects.using('replica').get(name="Cash"),Account.objects.using('replica').get(name="Bank (replica)")
+        Transaction.objects.using('replica').create(from_acc=cash,to_acc=bank,amount=10,note='Replica deposit')
+        response = self.client.get(reverse('txn-export'))
+        self.assertIn(b'Replica deposit',b''.join(response.streaming_content))
+
+        for params in ({},{'format':'csv'}):
+            response = self.client.get(reverse('balance-sheet-stream'),params)
+            self.assertIn(b'Bank (replica)',b''.join(response.streaming_content))
+
+    def test_tree_loads_from_primary(self):
+        AccountType.objects.using('replica').filter(name="Assets").update(name="Assets (replica)")
+        clear_tree_cache()
+        with replica_reads():
+            self.assertEqual([node.name for node in get_tree()],['Assets'])
+
+    def test_async_views_read_from_replica(self):
+        response = self.client.get(reverse('balance-sheet-async'))
+        self.assertContains(response,'Bank (replica)')
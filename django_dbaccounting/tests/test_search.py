@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,Transaction
+from dbaccounting.search import search, install_search
+
+# Create your tests here.
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.cash = Account.objects.create(name="Petty Cash",acc_type=assets,balance=100)
+        cls.bank = Account.objects.create(name="Bank",acc_type=assets)
+        Transaction.objects.bulk_create([Transaction(from_acc=cls.cash,to_acc=cls.bank,amount=1,note=f"Payment of invoice {i}") for i in range(30)])
+        cls.txn = Transaction.objects.create(from_acc=cls.cash,to_acc=cls.bank,amount=5,note="Refund <b>invoice</b> 1234")
+
+    def test_search_notes(self):
+        hits = search(Transaction,"invoice 1234")
+        self.assertEqual(hits,[self.txn])
+        self.assertEqual(hits[0].highlight,"Refund &lt;b&gt;<mark>invoice</mark>&lt;/b&gt; <mark>1234</mark>")
+
+    def test_pages(self):
+        first,second = search(Transaction,"payment",limit=20),search(Transaction,"payment",limit=20,offset=20)
+        self.assertEqual((len(first),len(second)),(20,10))
+        self.assertFalse(set(first)&set(second))
+
+    def test_index_follows_changes(self):
+        self.txn.note = "Card fee"
+        self.txn.save()
+        self.assertEqual(search(Transaction,"1234"),[])
+        self.assertEqual(search(Transaction,"card"),[self.txn])
+        Transaction.objects.filter(pk=self.txn.pk).delete()
+        self.assertEqual(search(Transaction,"card"),[])
+
+    def test_search_account_names(self):
+        self.assertEqual(search(Account,"pet"),[self.cash])
+        self.assertEqual(search(Account,"!!"),[])
+
+    def test_reinstall_reindexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite triggers")
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER dbaccounting_transaction_fts_queue_insert")
+        Transaction.objects.create(from_acc=self.cash,to_acc=self.bank,amount=1,note="Missed while unindexed")
+        install_search()
+        self.assertEqual(len(search(Transaction,"unindexed")),1)
+
+class SearchApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view transaction'))
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        bank = Account.objects.create(name="Bank",acc_type=assets)
+        Transaction.objects.bulk_create([Transaction(from_acc=cash,to_acc=bank,amount=1,note=f"Invoice {i}") for i in range(3)])
+
+    def test_search(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('api-search'),{'q':'invoice','limit':2})
+        self.assertEqual(response.status_code,200)
+        data = response.json()
+        self.assertEqual(len(data['results']),2)
+        self.assertIn('<mark>Invoice</mark>',data['results'][0]['highlight'])
+        response = self.client.get(data['next'])
+        self.assertEqual((len(response.json()['results']),response.json()['next']),(1,None))
+
+    def test_permissions(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.assertEqual(self.client.get(reverse('api-search'),{'q':'cash','in':'accounts'}).status_code,403)
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(reverse('api-search'),{'q':'invoice'}).status_code,403)
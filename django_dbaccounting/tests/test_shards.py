@@ -0,0 +1,80 @@
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,BalanceShard
+from dbaccounting.posting import validate_transaction, post_transaction, edit_transaction, delete_transaction, compact_balance_shards
+from dbaccounting.fx import consolidated_totals
+from dbaccounting.deletion import AccountDeletion
+
+# Create your tests here.
+
+class BalanceShardTest(TestCase):
+    def setUp(self):
+        self.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        self.cash = Account.objects.create(name="Cash",acc_type=self.assets,balance=100)
+        self.clearing = Account.objects.create(name="Clearing",acc_type=self.assets,balance_shards=4)
+
+    def test_postings_spread_over_shards(self):
+        for i in range(20):
+            post_transaction(self.cash,self.clearing,1)
+        self.assertEqual(BalanceShard.objects.filter(account=self.clearing).count(),4)
+        clearing = Account.objects.get(pk=self.clearing.pk)
+        self.assertEqual(clearing.balance,0)
+        self.assertEqual(clearing.pending_balance,20)
+        self.assertEqual(Account.objects.with_pending_balance().get(pk=self.clearing.pk).pending_balance,20)
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).balance,80)
+
+    def test_pages_show_current_balance(self):
+        test_user = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user.user_permissions.add(Permission.objects.get(name='Can view account'))
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        post_transaction(self.cash,self.clearing,30)
+
+        response = self.client.get(reverse('acc'))
+        self.assertContains(response,'<td>30.0 AED</td>')
+        response = self.client.get(reverse('acctype-detail',args=[self.assets.pk]))
+        self.assertContains(response,'Clearing</a> - (30.0)')
+        response = self.client.get(reverse('api-acc'),{'fields':'name,balance'})
+        self.assertIn({'name':'Clearing','balance':30},response.json()['results'])
+
+    def test_compact(self):
+        post_transaction(self.cash,self.clearing,30)
+        self.assertEqual(compact_balance_shards(),1)
+        self.assertEqual(Account.objects.get(pk=self.clearing.pk).balance,30)
+        self.assertFalse(BalanceShard.objects.exclude(amount=0).exists())
+        self.assertEqual(compact_balance_shards(),0)
+
+    def test_compact_command(self):
+        post_transaction(self.cash,self.clearing,30)
+        call_command('compact_balance_shards','--once',stdout=StringIO())
+        self.assertEqual(Account.objects.get(pk=self.clearing.pk).balance,30)
+
+    def test_validation_counts_shards(self):
+        post_transaction(self.cash,self.clearing,30)
+        clearing = Account.objects.select_related('acc_type').get(pk=self.clearing.pk)
+        validate_transaction(clearing,self.cash,30)
+        post_transaction(clearing,self.cash,20)
+        with self.assertRaises(ValidationError):
+            validate_transaction(clearing,self.cash,20)
+
+    def test_edit_and_delete(self):
+        txn = post_transaction(self.cash,self.clearing,30)
+        txn = edit_transaction(txn,self.cash,self.clearing,10)
+        self.assertEqual(Account.objects.get(pk=self.clearing.pk).pending_balance,10)
+        delete_transaction(txn)
+        self.assertEqual(Account.objects.get(pk=self.clearing.pk).pending_balance,30)
+
+    def test_reports_include_shards(self):
+        post_transaction(self.cash,self.clearing,30)
+        self.assertEqual(consolidated_totals(),{self.assets.pk:100})
+
+    def test_deleting_sharded_account(self):
+        post_transaction(self.cash,self.clearing,30)
+        AccountDeletion.for_account(self.clearing).delete()
+        self.assertFalse(BalanceShard.objects.exists())
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).balance,100)
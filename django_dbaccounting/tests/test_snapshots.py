@@ -0,0 +1,88 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,ReportSnapshot
+from dbaccounting.periods import close_period
+from dbaccounting.snapshots import get_snapshot
+
+# Create your tests here.
+
+class ReportSnapshotTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view account'))
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view account type'))
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.cash = Account.objects.create(name="Cash",acc_type=assets,balance=50)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('report-snapshot',args=['balance-sheet'])
+
+    def test_serves_latest_snapshot(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response,'dbaccounting/report_snapshot.html')
+        self.assertContains(response,'<th>50.0</th>',html=True)
+        self.assertEqual(ReportSnapshot.objects.count(),1)
+
+        # The snapshot is served until it is recomputed
+        Account.objects.filter(pk=self.cash.pk).update(balance=70)
+        self.assertContains(self.client.get(self.url),'<th>50.0</th>',html=True)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code,302)
+        self.assertContains(self.client.get(response.url),'<th>70.0</th>',html=True)
+        self.assertEqual(ReportSnapshot.objects.count(),1)
+
+    def test_requires_permission(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(self.url).status_code,403)
+
+    def test_unknown_report_or_key(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.assertEqual(self.client.get(reverse('report-snapshot',args=['forecast'])).status_code,404)
+        self.assertEqual(self.client.get(self.url,{'key':'period:2000-01-01'}).status_code,404)
+        self.assertEqual(self.client.get(self.url,{'key':'yesterday'}).status_code,404)
+        # Past dates of the open period have no recorded balances to report
+        self.assertEqual(self.client.get(self.url,{'key':'1999-01-01'}).status_code,404)
+        self.assertFalse(ReportSnapshot.objects.exists())
+
+    def test_closed_period(self):
+        Account.objects.filter(pk=self.cash.pk).update(date_create=timezone.now()-datetime.timedelta(days=2))
+        end = timezone.localdate()-datetime.timedelta(days=1)
+        close_period(end)
+        Account.objects.filter(pk=self.cash.pk).update(balance=70)
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(self.url,{'key':f'period:{end}'})
+        self.assertContains(response,'<th>50.0</th>',html=True)
+
+    def test_waits_for_concurrent_computation(self):
+        # Another request holds the lock and stores the snapshot while this one waits
+        cache.add('dbaccounting:snapshot_lock:balance-sheet:2024-01-31',True)
+        def other_request_finishes(seconds):
+            ReportSnapshot.objects.create(report='balance-sheet',key='2024-01-31',content='theirs',computed_at=timezone.now(),duration=1)
+        with mock.patch('dbaccounting.snapshots.time.sleep',side_effect=other_request_finishes):
+            with mock.patch('dbaccounting.views.balance_sheet_content') as render:
+                snapshot = get_snapshot('balance-sheet','2024-01-31')
+        self.assertEqual(snapshot.content,'theirs')
+        render.assert_not_called()
+
+    def test_command(self):
+        out = StringIO()
+        call_command('snapshot_reports',stdout=out)
+        self.assertIn('Computed balance-sheet',out.getvalue())
+        self.assertEqual(ReportSnapshot.objects.get().report,'balance-sheet')
+        with self.assertRaises(CommandError):
+            call_command('snapshot_reports','--key=1999-01-01',stdout=out)
@@ -0,0 +1,88 @@
+import csv
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account,FxRate
+from dbaccounting.posting import post_transaction
+from dbaccounting.tree import get_tree
+from dbaccounting.streaming import rolled_up_totals, balance_sheet_rows
+
+# Create your tests here.
+
+class StreamingReportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('Can view account','Can view account type','Can view transaction'):
+            test_user2.user_permissions.add(Permission.objects.get(name=name))
+
+        cls.assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.current = AccountType.objects.create(name="Current Assets",bal_type="D",parent=cls.assets)
+        cls.liabilities = AccountType.objects.create(name="Liabilities",bal_type="C")
+        Account.objects.create(name="Building",acc_type=cls.assets,balance=1000)
+        cls.cash = Account.objects.create(name="Cash",acc_type=cls.current,balance=50)
+        cls.bank = Account.objects.create(name="Bank",acc_type=cls.current,balance=150)
+        Account.objects.create(name="Short-Term Debt",acc_type=cls.liabilities,balance=-200)
+
+    def stream(self,**params):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('balance-sheet-stream'),params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_rows_in_tree_order(self):
+        tree = get_tree()
+        rows = list(balance_sheet_rows(tree,rolled_up_totals(tree,None),None))
+        self.assertEqual([(row[0],row[1].name if row[0] == 'type' else row[1][1]) for row in rows],[
+            ('type','Assets'),('account','Building'),('type','Current Assets'),('account','Bank'),('account','Cash'),
+            ('type','Liabilities'),('account','Short-Term Debt')])
+        self.assertEqual({row[1].name:row[3] for row in rows if row[0] == 'type'},{'Assets':1200,'Current Assets':200,'Liabilities':-200})
+
+    def test_html(self):
+        content = self.stream()
+        self.assertIn('<h1>Balance Sheet on',content)
+        self.assertInHTML(f'<tr><td style="padding-left:75px"><a href="{reverse("acc-detail",args=[self.cash.pk])}">Cash</a></td><td>50.0</td></tr>',content)
+        self.assertInHTML(f'<tr><th style="padding-left:15px"><a href="{reverse("acctype-detail",args=[self.assets.pk])}">Assets</a></th><th>1200.0</th></tr>',content)
+
+    def test_csv(self):
+        rows = list(csv.DictReader(self.stream(format='csv').splitlines()))
+        self.assertEqual(len(rows),7)
+        self.assertEqual(rows[0]['name'],'Assets')
+        self.assertEqual(float(rows[0]['balance_AED']),1200)
+
+    def test_query_count_independent_of_accounts(self):
+        tree = get_tree()
+        with self.assertNumQueries(2):
+            list(balance_sheet_rows(tree,rolled_up_totals(tree,None),None))
+        for i in range(50):
+            Account.objects.create(name=f"Petty Cash {i}",acc_type=self.current)
+        with self.assertNumQueries(2):
+            list(balance_sheet_rows(tree,rolled_up_totals(tree,None),None))
+
+    def test_converts_currencies(self):
+        Account.objects.create(name="Dollars",acc_type=self.current,balance=10,currency='USD')
+        FxRate.objects.create(base='USD',quote='AED',date='2000-01-01',rate=4)
+        self.assertInHTML('<td>10.0 USD = 40.0</td>',self.stream())
+
+    def test_missing_rate(self):
+        Account.objects.create(name="Pounds",acc_type=self.current,balance=10,currency='GBP')
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('balance-sheet-stream'))
+        # Reported before streaming starts
+        self.assertFalse(response.streaming)
+        self.assertContains(response,'No exchange rate from GBP')
+
+    def test_requires_permission(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(reverse('balance-sheet-stream')).status_code,403)
+        self.assertEqual(self.client.get(reverse('txn-export')).status_code,403)
+
+    def test_transaction_export(self):
+        post_transaction(self.cash,self.bank,10,'Deposit')
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('txn-export'))
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([(row['from_acc_name'],row['to_acc_name'],row['note']) for row in rows],[('Cash','Bank','Deposit')])
@@ -0,0 +1,79 @@
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User, Permission
+
+from dbaccounting.models import AccountType,Account
+from dbaccounting.ledger import LedgerTree, account_rows
+from dbaccounting.chart import import_chart
+from dbaccounting.tree import TypeTree, get_tree, clear_tree_cache, tree_cache, VERSION_KEY
+
+# Create your tests here.
+
+class TypeTreeTest(TestCase):
+    def setUp(self):
+        # Committing the setup publishes a new version, so the tree read from it can be cached
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assets = AccountType.objects.create(name="Assets",bal_type="D")
+            self.current = AccountType.objects.create(name="Current Assets",bal_type="D",parent=self.assets)
+            self.cash = AccountType.objects.create(name="Cash",bal_type="D",parent=self.current)
+            self.liabilities = AccountType.objects.create(name="Liabilities",bal_type="C")
+        Account.objects.create(name="Wallet",acc_type=self.cash,balance=10)
+        Account.objects.create(name="Bank",acc_type=self.current,balance=100)
+
+    def tearDown(self):
+        # The rows of this test are rolled back, so its tree must not outlive it
+        clear_tree_cache()
+
+    def test_structure(self):
+        tree = TypeTree.load()
+        self.assertEqual([node.name for node in tree.roots],['Assets','Liabilities'])
+        self.assertEqual(tree.get(self.cash.pk).depth,2)
+        self.assertEqual(tree.get(self.current.pk).children,[tree.get(self.cash.pk)])
+        self.assertEqual(sorted(tree.descendants(self.assets.pk)),sorted([self.assets.pk,self.current.pk,self.cash.pk]))
+
+    def test_cached_between_reads(self):
+        tree = get_tree()
+        with self.assertNumQueries(0):
+            self.assertIs(get_tree(),tree)
+
+    def test_ledger_only_queries_accounts(self):
+        get_tree()
+        with self.assertNumQueries(1):
+            ledgers = LedgerTree(get_tree(),account_rows(None)).roots
+        self.assertEqual(ledgers[0].total,110)
+
+    def test_invalidated_by_save(self):
+        get_tree()
+        with self.captureOnCommitCallbacks(execute=True):
+            AccountType.objects.create(name="Equity",bal_type="C")
+        self.assertIn("Equity",[node.name for node in get_tree()])
+
+    def test_uncommitted_changes_not_cached(self):
+        get_tree()
+        AccountType.objects.create(name="Equity",bal_type="C")
+        # Visible to the transaction that made it, but only cached once committed
+        self.assertIn("Equity",[node.name for node in get_tree()])
+        self.assertIsNot(get_tree(),get_tree())
+
+    def test_cached_again_after_rollback(self):
+        get_tree()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                AccountType.objects.create(name="Equity",bal_type="C")
+                AccountType.objects.create(name="Equity",bal_type="C")
+        get_tree()
+        with self.assertNumQueries(0):
+            self.assertNotIn("Equity",[node.name for node in get_tree()])
+
+    def test_invalidated_by_other_process(self):
+        tree = get_tree()
+        # Another worker sharing the cache publishes a new version
+        tree_cache().set(VERSION_KEY,'other',None)
+        self.assertIsNot(get_tree(),tree)
+
+    def test_invalidated_by_bulk_import(self):
+        get_tree()
+        with self.captureOnCommitCallbacks(execute=True):
+            import_chart({'account_types':[{'name':'Loans','bal_type':'C','parent':'Liabilities'}]})
+        self.assertEqual(get_tree().get(AccountType.objects.get(name='Loans').pk).depth,1)
@@ -491,6 +491,28 @@ class TransactionCreateTest(TestCase):
         # Check we used correct template
         self.assertTemplateUsed(response, 'dbaccounting/transaction_form.html')
 
+    def test_retry_with_idempotency_key_posts_once(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        bank = Account.objects.create(name="Bank",acc_type=assets)
+        for i in range(2):
+            response = self.client.post(reverse('txn_create'),{'from_acc':cash.pk,'to_acc':bank.pk,'amount':10},HTTP_IDEMPOTENCY_KEY='retry-1')
+            self.assertRedirects(response,reverse('txn'),fetch_redirect_response=False)
+        self.assertEqual(Transaction.objects.count(),1)
+        self.assertEqual(Account.objects.get(pk=bank.pk).balance,10)
+
+    def test_retry_after_balance_spent(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cash = Account.objects.create(name="Cash",acc_type=assets,balance=100)
+        bank = Account.objects.create(name="Bank",acc_type=assets)
+        # The first post leaves too little in Cash to pass validation a second time
+        for i in range(2):
+            response = self.client.post(reverse('txn_create'),{'from_acc':cash.pk,'to_acc':bank.pk,'amount':80},HTTP_IDEMPOTENCY_KEY='retry-2')
+            self.assertRedirects(response,reverse('txn'),fetch_redirect_response=False)
+        self.assertEqual(Account.objects.get(pk=bank.pk).balance,80)
+
 
 class AccountTypeUpdateTest(TestCase):
     def setUp(self):
@@ -908,3 +930,103 @@ class TransactionUpdateTest(TestCase):
         login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
         response = self.client.post(reverse('txn_delete', kwargs={'pk':self.test_txn1.pk,}), {'submit':"Confirm"})
         self.assertRedirects(response, reverse('txn'))
+
+    def test_delete_reverses_balances(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('txn_delete', kwargs={'pk':self.test_txn1.pk,}), {'submit':"Confirm"})
+        self.assertEqual(Account.objects.get(id=1).balance,0)
+        self.assertEqual(Account.objects.get(id=2).balance,0)
+        self.assertFalse(Transaction.objects.filter(pk=self.test_txn1.pk).exists())
+
+class BalanceSheetViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Set Up User
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view account'))
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view account type'))
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        current = AccountType.objects.create(name="Current Assets",bal_type="D",parent=assets)
+        liabilities = AccountType.objects.create(name="Liabilities",bal_type="C")
+        Account.objects.create(name="Building",acc_type=assets,balance=1000)
+        Account.objects.create(name="Cash",acc_type=current,balance=50)
+        Account.objects.create(name="Bank",acc_type=current,balance=150)
+        Account.objects.create(name="Short-Term Debt",acc_type=liabilities,balance=-200)
+
+    def test_redirect_if_not_logged_in(self):
+        for name in ('balance-sheet','balance-sheet-async'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response.url.startswith('/accounts/login/'))
+
+    def test_redirect_if_logged_in_but_not_correct_permission(self):
+        login = self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        for name in ('balance-sheet','balance-sheet-async'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 403)
+
+    def test_view_uses_correct_template(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('balance-sheet','balance-sheet-async'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code,200)
+            self.assertTemplateUsed(response, 'dbaccounting/balance_sheet.html')
+
+    def test_ledger_totals(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        for name in ('balance-sheet','balance-sheet-async'):
+            response = self.client.get(reverse(name))
+            ledgers = {ledger.acc_type.name: ledger for ledger in response.context['ledgers']}
+            self.assertEqual(set(ledgers),{'Assets','Liabilities'})
+            self.assertEqual(ledgers['Assets'].total,1200)
+            self.assertEqual(ledgers['Assets'].subtotal,200)
+            self.assertEqual(ledgers['Liabilities'].total,-200)
+
+class AsyncReadViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Set Up User
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Can view transaction'))
+
+        assets = AccountType.objects.create(name="Assets",bal_type="D")
+        cls.acc1 = Account.objects.create(name="Cash",acc_type=assets)
+        cls.acc2 = Account.objects.create(name="Bank",acc_type=assets)
+        for txn_id in range(53):
+            Transaction.objects.create(from_acc=cls.acc1,to_acc=cls.acc2,amount=txn_id)
+
+    def test_redirect_if_not_logged_in(self):
+        response = self.client.get(reverse('txn-async'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/accounts/login/'))
+
+    def test_redirect_if_logged_in_but_not_correct_permission(self):
+        login = self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('txn-async'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_transaction_list_pagination_is_fifty(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('txn-async'))
+        self.assertEqual(response.status_code,200)
+        self.assertTemplateUsed(response, 'dbaccounting/transaction_list.html')
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['transaction_list']),50)
+
+        response = self.client.get(reverse('txn-async'),{'page':2})
+        self.assertEqual([txn.amount for txn in response.context['transaction_list']],[50,51,52])
+
+    def test_account_detail(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('acc-detail-async',args=[self.acc1.pk]))
+        self.assertEqual(response.status_code,200)
+        self.assertTemplateUsed(response, 'dbaccounting/account_detail.html')
+        self.assertEqual(len(response.context['recent_transactions']),20)
+
+    def test_HTTP404_for_invalid_account(self):
+        login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('acc-detail-async',args=[100]))
+        self.assertEqual(response.status_code,404)
@@ -0,0 +1,153 @@
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+
+from dbaccounting.conf import get_setting
+from dbaccounting.models import AccountType
+
+# Process-level cache of the account type tree.
+# The chart of accounts changes rarely but is read by every report, so each process keeps the whole
+# tree in memory. A version token in the Django cache (DBACCOUNTING_TREE_CACHE) is replaced whenever
+# a type changes, so every worker sharing that cache rebuilds its tree on its next read. Code that
+# changes types without signals (bulk_create, raw deletes) must call tree_changed() itself.
+
+VERSION_KEY = 'dbaccounting:acctype_tree_version'
+
+class TypeNode:
+    """An account type of the cached tree, with the attributes of AccountType that reports use"""
+    __slots__ = ('id', 'name', 'bal_type', 'parent_id', 'children', 'depth')
+
+    def __init__(self, id, name, bal_type, parent_id):
+        self.id, self.name, self.bal_type, self.parent_id = id, name, bal_type, parent_id
+        self.children = []
+        self.depth = 0
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse('acctype-detail', args=[str(self.id)])
+
+    def __str__(self):
+        return self.name
+
+class TypeTree:
+    """All account types by id, in AccountType's ordering, with their children and depth"""
+    def __init__(self, rows):
+        self.nodes = {pk: TypeNode(pk, name, bal_type, parent_id) for pk, name, bal_type, parent_id in rows}
+        self.roots = []
+        for node in self.nodes.values():
+            if node.parent_id is None:
+                self.roots.append(node)
+            else:
+                self.nodes[node.parent_id].children.append(node)
+
+        stack = [(root, 0) for root in self.roots]
+        while stack:
+            node, depth = stack.pop()
+            node.depth = depth
+            stack.extend((child, depth+1) for child in node.children)
+
+    @classmethod
+    def load(cls):
+        # Always from the primary - a replica's tree could lag the version it is cached under
+        return cls(AccountType.objects.using(router.db_for_write(AccountType)).values_list('pk', 'name', 'bal_type', 'parent_id'))
+
+    def __iter__(self):
+        return iter(self.nodes.values())
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, pk):
+        return self.nodes.get(pk)
+
+    def depth_first(self):
+        """Yields (type, depth) of every type, each type followed by its subtree, in the order reports show them"""
+        stack = [(root, 0) for root in reversed(self.roots)]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            stack.extend((child, depth+1) for child in reversed(node.children))
+
+    def descendants(self, pk):
+        """Returns the ids of the type pk and every type below it"""
+        ids, stack = [], [self.nodes[pk]]
+        while stack:
+            node = stack.pop()
+            ids.append(node.id)
+            stack.extend(node.children)
+        return ids
+
+class _Local:
+    lock = threading.Lock()
+    version = None
+    tree = None
+
+class OnCommit:
+    """A transaction.on_commit callback that records whether it has run"""
+    def __init__(self, func):
+        self.func, self.done = func, False
+
+    def __call__(self):
+        self.done = True
+        self.func()
+
+def waiting_on_commit(func):
+    """Whether an OnCommit of func is registered by this thread's open transactions and has not run
+
+    A rollback drops the callbacks of the rolled back block, so its changes stop counting at once.
+    """
+    return any(isinstance(entry[1], OnCommit) and entry[1].func is func and not entry[1].done
+        for conn in connections.all(initialized_only=True) for entry in conn.run_on_commit)
+
+def tree_cache():
+    return caches[get_setting('TREE_CACHE')]
+
+def current_version():
+    version = tree_cache().get(VERSION_KEY)
+    if version is None:
+        tree_cache().add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = tree_cache().get(VERSION_KEY)
+    return version
+
+def get_tree():
+    """Returns the account type tree, reading it from the database only if a type changed since it was cached"""
+    # A transaction that changed the types reads its own tree, which must not be cached
+    dirty = waiting_on_commit(publish_version)
+    version = current_version()
+    if not dirty and _Local.tree is not None and _Local.version == version:
+        return _Local.tree
+    tree = TypeTree.load()
+    if not dirty:
+        with _Local.lock:
+            _Local.version, _Local.tree = version, tree
+    return tree
+
+def clear_tree_cache():
+    """Forgets this process' tree"""
+    with _Local.lock:
+        _Local.version, _Local.tree = None, None
+
+def publish_version():
+    # A new token rather than a counter, so that an evicted key can never come back as a version already seen
+    tree_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
+    with _Local.lock:
+        _Local.version, _Local.tree = None, None
+
+def tree_changed(using=None):
+    """Invalidates the tree in every process once the current transaction commits"""
+    with _Local.lock:
+        _Local.version, _Local.tree = None, None
+    # Publishing before the commit would let another worker cache the tree as it was before the change
+    transaction.on_commit(OnCommit(publish_version), using=using)
+
+@receiver((post_save, post_delete), sender=AccountType)
+def account_type_changed(sender, using=None, **kwargs):
+    tree_changed(using)
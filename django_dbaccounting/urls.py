@@ -1,13 +1,15 @@
 from django.urls import path
 
-from . import views
+from . import views, api
 
 # Create urls here
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('report/', views.index, name='report'),
-    path('balance-sheet/', views.index, name='balance-sheet'),
+    path('report/<slug:name>/snapshot/', views.report_snapshot, name='report-snapshot'),
+    path('balance-sheet/', views.balance_sheet, name='balance-sheet'),
+    path('balance-sheet/stream/', views.balance_sheet_stream, name='balance-sheet-stream'),
     path('income/', views.index, name='income'),
     path('cashflow/', views.index, name='cashflow'),
     path('retained/', views.index, name='retained'),
@@ -25,8 +27,25 @@ urlpatterns = [
     path('acc/<int:pk>/delete/',views.AccountDelete.as_view(),name='acc_delete'),
     path('txn/', views.TransactionListView.as_view(), name='txn'),
     path('txn/<int:pk>/',  views.TransactionDetailView.as_view(), name='txn-detail'),
+    path('txn/export.csv', views.transaction_export, name='txn-export'),
     path('txn/create/',views.transaction_create,name='txn_create'),
     path('txn/<int:pk>/update/',views.transaction_update,name='txn_update'),
     path('txn/<int:pk>/delete/',views.TransactionDelete.as_view(),name='txn_delete'),
+    path('async/txn/', views.transaction_list_async, name='txn-async'),
+    path('async/acc/<int:pk>/', views.account_detail_async, name='acc-detail-async'),
+    path('async/balance-sheet/', views.balance_sheet_async, name='balance-sheet-async'),
+    path('api/acctype/', api.account_type_list, name='api-acctype'),
+    path('api/acc/', api.account_list, name='api-acc'),
+    path('api/txn/', api.transaction_list, name='api-txn'),
+    path('api/txn/bulk/', api.transaction_bulk_create, name='api-txn-bulk'),
+    path('api/changes/acctype/', api.account_type_changes, name='api-acctype-changes'),
+    path('api/changes/acc/', api.account_changes, name='api-acc-changes'),
+    path('api/changes/txn/', api.transaction_changes, name='api-txn-changes'),
+    path('api/search/', api.text_search, name='api-search'),
+    path('api/journal/', api.journal_entry_create, name='api-journal'),
+    path('api/chart/', api.chart_import, name='api-chart'),
+    path('api/stats/', api.view_stats, name='api-stats'),
+    path('api/balances/', api.consolidated_balances, name='api-balances'),
+    path('api/balance-sheet/', api.balance_sheet, name='api-balance-sheet'),
 
 ]
\ No newline at end of file
@@ -1,96 +1,147 @@
 import datetime
+from urllib.parse import urlencode
 
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required,permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views import generic
 from django.urls import reverse_lazy, reverse
 from django.db import transaction
-from django.http import HttpResponseRedirect
-
-from dbaccounting.models import AccountType,Account,Transaction
+from django.db.models import Q
+from django.http import HttpResponseRedirect, Http404, StreamingHttpResponse
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
+from django.core.paginator import Paginator
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import require_http_methods
+from asgiref.sync import sync_to_async
+
+from dbaccounting.conf import get_setting
+from dbaccounting.models import AccountType,Account,Transaction,Period
 from dbaccounting.forms import TransactionForm
+from dbaccounting.posting import post_transaction, posted_transactions, edit_transaction, delete_transaction
+from dbaccounting.fx import MissingRate
+from dbaccounting.periods import closing_balance_rows
+from dbaccounting.identity import request_accounts
+from dbaccounting.tree import get_tree
+from dbaccounting.ledger import LedgerTree, account_rows
+from dbaccounting.deletion import AccountDeletion, DeletionError
+from dbaccounting.routers import ReplicaReadMixin, PrimaryAfterWriteMixin, replica_reads_view, replica_reads_iter, stick_to_primary
+from dbaccounting.conditional import ConditionalGetMixin, fragment_context
+from dbaccounting.snapshots import REPORTS, get_snapshot
+from dbaccounting.streaming import rolled_up_totals, balance_sheet_rows, html_rows, balance_sheet_csv, transactions_csv, page_around
 # Create your views here.
 
-# View related objects
-class AccountLedger:
-    """An organized collection of an AccountType, its child AccountTypes, related Accounts, and total balances"""
-    def __init__(self,acc_type):
-        self.acc_type = acc_type
-        self.sub_type = AccountType.objects.filter(parent=acc_type)
-        self.accs = Account.objects.filter(acc_type=acc_type)
-        self.total = sum((acc.balance for acc in self.accs)) if self.accs else 0
-
-        self.sub_accs = {}
-        if self.sub_type:    
-            for sub in self.sub_type:
-                self.sub_accs[sub] = AccountLedger(sub)
-
-        self.subtotal = sum((self.sub_accs[sub].total for sub in self.sub_type)) if len(self.sub_type)>0 else 0
-        self.total+=self.subtotal
+def recent_transactions(acc,count=20):
+    """Returns a queryset of the latest transactions into or out of acc"""
+    return Transaction.objects.filter(Q(from_acc=acc)|Q(to_acc=acc)).select_related('from_acc','to_acc').order_by('-date')[:count]
 
 # View Implementations Below
 
 # Account Types
-class AccountTypeDetailView(PermissionRequiredMixin,generic.DetailView):
+class AccountTypeDetailView(ReplicaReadMixin,PermissionRequiredMixin,ConditionalGetMixin,generic.DetailView):
     permission_required=("dbaccounting.view_account",)
     model = AccountType
 
-class AccountTypeListView(PermissionRequiredMixin,generic.ListView):
+class AccountTypeListView(ReplicaReadMixin,PermissionRequiredMixin,ConditionalGetMixin,generic.ListView):
     permission_required=("dbaccounting.view_accounttype",)
     model = AccountType
     paginate_by = 10
 
-class AccountTypeCreate(PermissionRequiredMixin,CreateView):
+class AccountTypeCreate(PrimaryAfterWriteMixin,PermissionRequiredMixin,CreateView):
     permission_required=("dbaccounting.add_accounttype",)
     model = AccountType
     fields = '__all__'
     
-class AccountTypeUpdate(PermissionRequiredMixin,UpdateView):
+class AccountTypeUpdate(PrimaryAfterWriteMixin,PermissionRequiredMixin,UpdateView):
     permission_required=("dbaccounting.change_accounttype",)
     model = AccountType
     fields = '__all__'
 
-class AccountTypeDelete(PermissionRequiredMixin,DeleteView):
+class AccountDeleteMixin:
+    """Deletes with deletion.AccountDeletion, which reverses the effect of the deleted transactions on other accounts
+
+    Views set deletion_for to the AccountDeletion constructor for their object.
+    """
+    def get_deletion(self):
+        return self.deletion_for(self.object)
+
+    def get_context_data(self,**kwargs):
+        context = super().get_context_data(**kwargs)
+        context['impact'] = self.get_deletion().impact()
+        return context
+
+    def form_valid(self,form):
+        try:
+            self.get_deletion().delete()
+        except DeletionError as e:
+            form.add_error(None,str(e))
+            return self.form_invalid(form)
+        stick_to_primary(self.request)
+
+        return HttpResponseRedirect(self.get_success_url())
+
+class AccountTypeDelete(AccountDeleteMixin,PermissionRequiredMixin,DeleteView):
     permission_required=("dbaccounting.delete_accounttype",)
     model = AccountType
     success_url = reverse_lazy('acctype')
+    deletion_for = AccountDeletion.for_type
 
 # Accounts
-class AccountDetailView(PermissionRequiredMixin,generic.DetailView):
+class AccountDetailView(ReplicaReadMixin,PermissionRequiredMixin,ConditionalGetMixin,generic.DetailView):
     permission_required=("dbaccounting.view_transaction",)
     model = Account
 
-class AccountListView(PermissionRequiredMixin,generic.ListView):
+    def get_context_data(self,**kwargs):
+        context = super().get_context_data(**kwargs)
+        # Every row shares the one instance of this account instead of loading a copy per row
+        accounts = request_accounts(self.request)
+        accounts.add(self.object)
+        # Lazy, so that they are not read when their fragment is cached
+        context['recent_transactions'] = SimpleLazyObject(lambda: accounts.attach(list(recent_transactions(self.object).select_related(None))))
+        return context
+
+class AccountListView(ReplicaReadMixin,PermissionRequiredMixin,ConditionalGetMixin,generic.ListView):
     permission_required=("dbaccounting.view_account",)
     model = Account
     paginate_by = 20
 
-class AccountCreate(PermissionRequiredMixin,CreateView):
+    def get_queryset(self):
+        return super().get_queryset().with_current_balance()
+
+class AccountCreate(PrimaryAfterWriteMixin,PermissionRequiredMixin,CreateView):
     permission_required=("dbaccounting.add_account",)
     model = Account
     fields = '__all__'
     
-class AccountUpdate(PermissionRequiredMixin,UpdateView):
+class AccountUpdate(PrimaryAfterWriteMixin,PermissionRequiredMixin,UpdateView):
     permission_required=("dbaccounting.change_account",)
     model = Account
     fields = ['name','acc_type','balance']
     success_url = reverse_lazy('acc')
 
-class AccountDelete(PermissionRequiredMixin,DeleteView):
+class AccountDelete(AccountDeleteMixin,PermissionRequiredMixin,DeleteView):
     permission_required=("dbaccounting.delete_account",)
     model = Account
     success_url = reverse_lazy('acc')
+    deletion_for = AccountDeletion.for_account
 
 # Transactions
-class TransactionDetailView(PermissionRequiredMixin,generic.DetailView):
+class TransactionDetailView(ReplicaReadMixin,PermissionRequiredMixin,ConditionalGetMixin,generic.DetailView):
     permission_required=("dbaccounting.view_transaction",)
     model = Transaction
 
-class TransactionListView(PermissionRequiredMixin,generic.ListView):
+    def get_object(self,queryset=None):
+        txn = super().get_object(queryset)
+        request_accounts(self.request).attach([txn])
+        return txn
+
+class TransactionListView(ReplicaReadMixin,PermissionRequiredMixin,ConditionalGetMixin,generic.ListView):
     permission_required=("dbaccounting.view_transaction",)
     model = Transaction
+    queryset = Transaction.objects.select_related('from_acc','to_acc')
     paginate_by = 50
 
 class TransactionDelete(PermissionRequiredMixin,DeleteView):
@@ -99,25 +150,11 @@ class TransactionDelete(PermissionRequiredMixin,DeleteView):
     success_url = reverse_lazy('txn')
 
     @transaction.atomic
-    def delete(self,request,pk):
-        txn = get_object_or_404(Transaction,pk=pk)
-        txn.from_acc.balance+=txn.amount
-        txn.to_acc.balance-=txn.amount
-        txn.from_acc.save()
-        txn.to_acc.save()
-
-        if txn.updating:
-            prev = txn.updating
-            prev.edited = False
-            prev.from_acc.balance-=prev.amount
-            prev.to_acc.balance+=prev.amount
-            prev.from_acc.save()
-            prev.to_acc.save()
-            prev.save()
-
-        txn.delete()
+    def form_valid(self,form):
+        delete_transaction(self.object)
+        stick_to_primary(self.request)
         
-        return HttpResponseRedirect(reverse_lazy('txn'))
+        return HttpResponseRedirect(self.get_success_url())
 
 
 @transaction.atomic
@@ -128,21 +165,25 @@ def transaction_create(request):
     if request.method == 'POST':
 
         # Create a form instance and populate it with data from the request (binding):
-        form = TransactionForm(request.POST)
-
+        form = TransactionForm(request.POST,accounts=request_accounts(request))
+        # Clients that may retry the POST send a key, so that a retry returns the transaction already posted
+        key = request.headers.get('Idempotency-Key') or None
+
+        if key is not None and len(key) > Transaction._meta.get_field('idempotency_key').max_length:
+            form.add_error(None,'Idempotency-Key must be at most 64 characters')
+        # Before validating, since the first post may have left too little balance to post it again
+        elif key is not None and posted_transactions([key]):
+            stick_to_primary(request)
+            return HttpResponseRedirect(reverse('txn'))
         #Check if the form is valid:
-        if form.is_valid():
+        elif form.is_valid():
             # process the data in form.cleaned_data as required
-            from_acc = get_object_or_404(Account,pk=form.cleaned_data['from_acc'].pk)
-            to_acc = get_object_or_404(Account,pk=form.cleaned_data['to_acc'].pk)
+            from_acc = form.cleaned_data['from_acc']
+            to_acc = form.cleaned_data['to_acc']
             amount = form.cleaned_data['amount']
-            from_acc.balance -= amount
-            to_acc.balance += amount
-            from_acc.save()
-            to_acc.save()
             note = form.cleaned_data['note']
-
-            Transaction.objects.create(from_acc = from_acc,to_acc = to_acc,amount = amount, note=note)
+            post_transaction(from_acc,to_acc,amount,note,idempotency_key=key)
+            stick_to_primary(request)
 
             # redirect to a new URL
             return HttpResponseRedirect(reverse('txn'))
@@ -162,50 +203,33 @@ def transaction_create(request):
 @permission_required('dbaccounting.change_transaction',raise_exception=True)
 def transaction_update(request,pk):
     orig_txn = get_object_or_404(Transaction,pk=pk)
+    # The original's accounts are loaded with the form's, and shared with it
+    accounts = request_accounts(request)
+    accounts.defer((orig_txn.from_acc_id,orig_txn.to_acc_id))
     # If this is a POST request then process the Form data
     if request.method == 'POST':
         # Create a form instance and populate it with data from the request (binding):
-        form = TransactionForm(request.POST)
+        form = TransactionForm(request.POST,accounts=accounts)
  
         #Check if the form is valid:
         if form.is_valid():
             # process the data in form.cleaned_data as required
-            from_acc = get_object_or_404(Account,pk=form.cleaned_data['from_acc'].pk)
-            to_acc = get_object_or_404(Account,pk=form.cleaned_data['to_acc'].pk)
+            from_acc = form.cleaned_data['from_acc']
+            to_acc = form.cleaned_data['to_acc']
+            accounts.attach([orig_txn])
             amount = form.cleaned_data['amount']
 
-            if from_acc!=orig_txn.from_acc:
-                orig_txn.from_acc.balance += orig_txn.amount
-                from_acc.balance -= orig_txn.amount
-            
-            if to_acc!=orig_txn.to_acc:
-                orig_txn.to_acc.balance -= orig_txn.amount
-                to_acc.balance += orig_txn.amount
-            
-            if amount!=orig_txn.amount:
-                diff = amount-orig_txn.amount
-                from_acc.balance-=diff
-                to_acc.balance+=diff
-
-            orig_txn.from_acc.save()
-            orig_txn.to_acc.save()
-
-            from_acc.save()
-            to_acc.save()
-            
-            orig_txn.edited=True
-            orig_txn.save()
-
             note = form.cleaned_data['note']
 
-            Transaction.objects.create(from_acc = from_acc,to_acc = to_acc,amount = amount, note=note, updating=orig_txn)
+            edit_transaction(orig_txn,from_acc,to_acc,amount,note)
+            stick_to_primary(request)
 
             # redirect to a new URL
             return HttpResponseRedirect(reverse('txn'))
         
     # If this is a GET (or any other method) create the default form.
     else:
-        form = TransactionForm(instance = orig_txn)
+        form = TransactionForm(instance = orig_txn,accounts=accounts)
 
     context = {
         'form': form,
@@ -213,23 +237,122 @@ def transaction_update(request,pk):
 
     return render(request,'dbaccounting/transaction_form.html',context)
 
-# Balance Sheet (Work in Progress)
+# Balance Sheet
 
-@permission_required(('dbaccounting.view_account','dbaccounting.view_accounttype'))
+@replica_reads_view
+@login_required
+@permission_required(('dbaccounting.view_account','dbaccounting.view_accounttype'),raise_exception=True)
 def balance_sheet(request):
-    date = str(datetime.date.today())
-    main_acc_types = AccountType.objects.filter(parent__isnull=True)
+    period = closed_period(request)
+    if period:
+        # Closed periods are reported from the balances recorded when they were closed
+        context = balance_sheet_context(get_tree(),closing_balance_rows(period),period.end)
+    else:
+        date = datetime.date.today()
+        context = balance_sheet_context(get_tree(),account_rows(date),date)
+    context['periods'] = Period.objects.all()
+    context['snapshot_key'] = balance_sheet_key(period)
+    
+    return render(request,'dbaccounting/balance_sheet.html',context=context)
+
+def closed_period(request):
+    """Returns the closed Period whose end date is given as ?period=, or None for the open period"""
+    if not request.GET.get('period'):
+        return None
+    try:
+        end = datetime.date.fromisoformat(request.GET['period'])
+    except ValueError:
+        raise Http404('Invalid period')
+    return get_object_or_404(Period,end=end)
+
+@replica_reads_view
+@login_required
+@permission_required(('dbaccounting.view_account','dbaccounting.view_accounttype'),raise_exception=True)
+def balance_sheet_stream(request):
+    """Streams today's balance sheet as it walks the account tree, as HTML or with ?format=csv as CSV"""
+    date = datetime.date.today()
+    tree = get_tree()
+    context = {'date':str(date),'currency':get_setting('CURRENCY'),'empty':not len(tree)}
+    try:
+        # Read before the first byte is sent, so that a missing rate can still be reported
+        totals = rolled_up_totals(tree,date)
+    except MissingRate as e:
+        return render(request,'dbaccounting/balance_sheet_stream.html',dict(context,error=str(e)))
+
+    rows = balance_sheet_rows(tree,totals,date)
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(replica_reads_iter(balance_sheet_csv(rows),request),content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="balance-sheet-{date}.csv"'
+        return response
+    page = page_around(request,'dbaccounting/balance_sheet_stream.html',context,html_rows(rows,context['currency']))
+    return StreamingHttpResponse(replica_reads_iter(page,request))
 
-    acc_types = AccountType.objects.all()
-    accs = Account.objects.all()
+@login_required
+@permission_required(('dbaccounting.view_transaction'),raise_exception=True)
+def transaction_export(request):
+    """Streams every transaction with its accounts' names as CSV"""
+    # The rows are read while the response is sent, after the view has returned
+    response = StreamingHttpResponse(replica_reads_iter(transactions_csv(Transaction.objects.all()),request),content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
+    return response
+
+def balance_sheet_key(period):
+    """The snapshot key of the balance sheet of a closed period, or of today's if period is None"""
+    return f'period:{period.end}' if period else str(datetime.date.today())
+
+def balance_sheet_period(key):
+    """The closed Period of a balance sheet snapshot key, or None for today's - raising ValueError for any other key
+
+    Past dates of the open period are refused, since their balances are not recorded.
+    """
+    if key.startswith('period:'):
+        return Period.objects.get(end=datetime.date.fromisoformat(key[len('period:'):]))
+    if key != str(datetime.date.today()):
+        raise ValueError('Only the balance sheet of today or of a closed period can be snapshotted')
+    return None
+
+def balance_sheet_content(key):
+    """Renders the balance sheet for its snapshot, of today or of the closed period:<end date>"""
+    period = balance_sheet_period(key)
+    if period:
+        # Closed periods are reported from the balances recorded when they were closed
+        context = balance_sheet_context(get_tree(),closing_balance_rows(period),period.end)
+    else:
+        date = datetime.date.fromisoformat(key)
+        context = balance_sheet_context(get_tree(),account_rows(date),date)
+    return render_to_string('dbaccounting/balance_sheet_body.html',context)
 
+@replica_reads_view
+@login_required
+@require_http_methods(('GET','POST'))
+def report_snapshot(request,name):
+    """Shows the latest snapshot of a report, computing it if there is none - a POST recomputes it"""
+    report = REPORTS.get(name)
+    if report is None:
+        raise Http404('Unknown report')
+    if not request.user.has_perms(report.perms):
+        raise PermissionDenied
+    key = request.GET.get('key') or report.default_key()
+
+    try:
+        report.check_key(key)
+        snapshot = get_snapshot(name,key,recompute=request.method == 'POST')
+    except (ValueError,ObjectDoesNotExist):
+        raise Http404('Invalid report key')
+    if request.method == 'POST':
+        return redirect(f"{reverse('report-snapshot',args=[name])}?{urlencode({'key':key})}")
+    return render(request,'dbaccounting/report_snapshot.html',{'report':report,'snapshot':snapshot})
+
+def balance_sheet_context(tree,rows,date):
     context = {
-        'acc_types': acc_types,
-        'accs': accs,
-        'date':date,
+        'date': str(date),
+        'currency': get_setting('CURRENCY'),
     }
-    
-    return render(request,'balance_sheet.html',context=context)
+    try:
+        context['ledgers'] = LedgerTree(tree,rows,date).roots
+    except MissingRate as e:
+        context['error'] = str(e)
+    return context
 
 # Index/Main Menu
 @login_required
@@ -251,4 +374,76 @@ def index(request):
     }
 
     # Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
\ No newline at end of file
+    return render(request, 'index.html', context=context)
+
+# Async read views
+# Served by an ASGI worker, these wait on the database without blocking it. The auth checks
+# and the template rendering stay synchronous and run in a thread via sync_to_async.
+
+@sync_to_async
+def async_permission_check(request,perms):
+    """Async counterpart of login_required + permission_required(raise_exception=True)"""
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if not request.user.has_perms(perms):
+        raise PermissionDenied
+    return None
+
+@replica_reads_view
+async def transaction_list_async(request):
+    denied = await async_permission_check(request,('dbaccounting.view_transaction',))
+    if denied:
+        return denied
+
+    paginator = Paginator(range(await Transaction.objects.acount()),TransactionListView.paginate_by)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    bottom = (page_obj.number-1)*paginator.per_page
+    txns = Transaction.objects.select_related('from_acc','to_acc')[bottom:bottom+paginator.per_page]
+
+    context = {
+        'transaction_list': [txn async for txn in txns],
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+        **await sync_to_async(fragment_context)(),
+    }
+
+    return await sync_to_async(render)(request,'dbaccounting/transaction_list.html',context)
+
+@replica_reads_view
+async def account_detail_async(request,pk):
+    denied = await async_permission_check(request,('dbaccounting.view_transaction',))
+    if denied:
+        return denied
+
+    try:
+        acc = await Account.objects.select_related('acc_type').aget(pk=pk)
+    except Account.DoesNotExist:
+        raise Http404('No account found matching the query')
+
+    context = {
+        'account': acc,
+        'recent_transactions': [txn async for txn in recent_transactions(acc)],
+        **await sync_to_async(fragment_context)(),
+    }
+
+    return await sync_to_async(render)(request,'dbaccounting/account_detail.html',context)
+
+@replica_reads_view
+async def balance_sheet_async(request):
+    denied = await async_permission_check(request,('dbaccounting.view_account','dbaccounting.view_accounttype'))
+    if denied:
+        return denied
+
+    period = await sync_to_async(closed_period)(request)
+    tree = await sync_to_async(get_tree)()
+    if period:
+        accs,date = [row async for row in closing_balance_rows(period)],period.end
+    else:
+        date = datetime.date.today()
+        accs = [acc async for acc in account_rows(date)]
+    # Accounts without a reporting balance fall back to cached rate lookups, which are synchronous
+    context = await sync_to_async(balance_sheet_context)(tree,accs,date)
+    context['periods'] = [period async for period in Period.objects.all()]
+    context['snapshot_key'] = balance_sheet_key(period)
+
+    return await sync_to_async(render)(request,'dbaccounting/balance_sheet.html',context)